@@ -1,4 +1,7 @@
 #!/usr/bin/env python3
 
 from paddle.paddle import main
-main() 
+
+# Guarded: process pool workers re-import the main module when spawned
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+import sys
+
+from paddle.batch import main
+
+# Guarded: process pool workers re-import the main module when spawned
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Time the expansion of site table multiplicities onto rows, `process.expand_side_table`
+against `padua.process.expand_side_table`, and check they give the same table.
+
+    python benchmarks/expand_side_table.py [--sizes 1000x4 100000x12 250000x24]
+'''
+import argparse
+import os
+import sys
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pandas as pd
+import padua
+
+from paddle import process
+from tables import site_table, best_of
+
+
+def parse_size(s):
+    rows, samples = s.split('x')
+    return int(rows), int(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=[(1000, 4), (100000, 12), (250000, 24)],
+                        help='table sizes, as sites x samples')
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs')
+    args = parser.parse_args(argv)
+
+    # padua sets columns on slices
+    warnings.simplefilter('ignore', pd.errors.SettingWithCopyWarning)
+
+    print('expand_side_table, best of %d (pandas %s, numpy %s)' % (args.repeat, pd.__version__, np.__version__))
+    for rows, samples in args.sizes:
+        df = site_table(rows, samples)
+        pd.testing.assert_frame_equal(process.expand_side_table(df), padua.process.expand_side_table(df))
+
+        before = best_of(lambda: padua.process.expand_side_table(df), args.repeat)
+        after = best_of(lambda: process.expand_side_table(df), args.repeat)
+        print('%9d sites x %2d samples: padua %.3fs, native %.3fs (%.1fx)' % (
+            rows, samples, before, after, before / after))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Time the quantification tool's transform and normalization in each precision, with
+the peak memory allocated (tracemalloc) and the size of the output table.
+
+    python benchmarks/quantification.py [--samples 12] [--sites 300000] [--proteins 100000]
+'''
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# Tools are loaded without an application window, as in batch runs
+os.environ['PADDLE_HEADLESS'] = '1'
+
+import numpy as np
+import pandas as pd
+
+from paddle.tools.quantification import Quantification
+from tables import site_table, protein_table, best_of, peak_memory
+
+
+def quantify(df, precision):
+    config = dict(Quantification.defaults, precision=precision)
+    return Quantification.quantification(df, config, lambda p: None)['data']['df']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--samples', type=int, default=12)
+    parser.add_argument('--sites', type=int, default=300000, help='rows of the site table')
+    parser.add_argument('--proteins', type=int, default=100000, help='rows of the protein table')
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs')
+    args = parser.parse_args(argv)
+
+    print('Quantification, %d samples, best of %d (pandas %s, numpy %s)' % (
+        args.samples, args.repeat, pd.__version__, np.__version__))
+    print('(time; tracemalloc peak; output table size)')
+    for kind, table, rows in [('sites', site_table, args.sites), ('proteins', protein_table, args.proteins)]:
+        df = table(rows, args.samples)
+        outputs = {}
+        for precision in ('float64', 'float32'):
+            t = best_of(lambda: quantify(df, precision), args.repeat)
+            outputs[precision], peak = peak_memory(lambda: quantify(df, precision))
+            print('  %-8s %7d rows, %s: %.3fs, %4d MB, %4d MB' % (
+                kind, rows, precision, t, peak / 1024. ** 2,
+                outputs[precision].memory_usage(index=False).sum() / 1024. ** 2))
+
+        # Single precision changes only the rounding of the values
+        np.testing.assert_allclose(outputs['float32'].values, outputs['float64'].values, rtol=1e-5, atol=1e-5)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
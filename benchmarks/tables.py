@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+'''
+Synthetic MaxQuant tables for the benchmarks, shaped like the real outputs: annotations,
+quality flags and log-normal intensities with missing (zero) values.
+'''
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+MULTIPLICITIES = ('___1', '___2', '___3')
+
+
+def intensities(rng, rows, missing=0.3):
+    values = rng.lognormal(20, 2, size=rows)
+    values[rng.random(rows) < missing] = 0
+    return values
+
+
+def site_table(rows, samples, seed=0):
+    '''
+    A Phospho (STY)Sites.txt-like table, with a block of intensity columns per multiplicity.
+    '''
+    rng = np.random.default_rng(seed)
+    columns = {
+        'Proteins': ['P%05d' % (n // 4) for n in range(rows)],
+        'Protein names': ['Protein %d' % (n // 4) for n in range(rows)],
+        'Gene names': ['GENE%d' % (n // 4) for n in range(rows)],
+        'Positions within proteins': rng.integers(1, 2000, size=rows).astype(str),
+        'Amino acid': rng.choice(list('STY'), size=rows),
+        'Localization prob': rng.random(rows),
+        'id': np.arange(rows),
+    }
+    for m in MULTIPLICITIES:
+        columns['Intensity%s' % m] = intensities(rng, rows)
+        for s in range(samples):
+            columns['Intensity S%02d%s' % (s, m)] = intensities(rng, rows)
+    return pd.DataFrame(columns)
+
+
+def protein_table(rows, samples, seed=0):
+    '''
+    A proteinGroups.txt-like table, with intensity and LFQ intensity columns.
+    '''
+    rng = np.random.default_rng(seed)
+    columns = {
+        'Protein IDs': ['P%05d' % n for n in range(rows)],
+        'Proteins': ['P%05d' % n for n in range(rows)],
+        'Protein names': ['Protein %d' % n for n in range(rows)],
+        'Gene names': ['GENE%d' % n for n in range(rows)],
+        'id': np.arange(rows),
+        'Intensity': intensities(rng, rows),
+    }
+    for q in ('Intensity', 'LFQ intensity'):
+        for s in range(samples):
+            columns['%s S%02d' % (q, s)] = intensities(rng, rows)
+    return pd.DataFrame(columns)
+
+
+def best_of(fn, repeat=3):
+    '''
+    Best wall time of `repeat` calls of `fn`, in seconds.
+    '''
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def peak_memory(fn):
+    '''
+    Call `fn`, returning its result and the peak memory allocated meanwhile (tracemalloc).
+    '''
+    tracemalloc.start()
+    try:
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, peak
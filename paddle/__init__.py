@@ -0,0 +1,26 @@
+'''
+Paddle: MaxQuant quantified data processing.
+
+Layering: the GUI (paddle.py, ui.py, threads.py, globals.py, qt.py and the tool classes in
+tools/) is built on Qt. The tool functions it runs may instead run in pool processes
+(pool.py) or headless batch runs (batch.py), so everything they use must import without
+Qt: the modules in `QT_FREE_MODULES` must not import Qt, directly or indirectly. This is
+checked by tests/test_layering.py.
+'''
+from __future__ import unicode_literals
+
+# Modules importable without Qt; see above
+QT_FREE_MODULES = (
+    'cache',
+    'impute',
+    'instrument',
+    'io',
+    'memory',
+    'normalization',
+    'plots',
+    'pool',
+    'process',
+    'schema',
+    'utils',
+    'workflow',
+)
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+'''
+Run a saved Paddle configuration (.paddle file) over MaxQuant data files without the GUI.
+
+The tool functions are run in dependency order exactly as in the GUI, but from the tool
+classes: no windows or widgets are created, so this runs on a headless server. Each
+tool's processed data and figure are written to the output folder, named by the tool
+shortname (e.g. `filter.csv`, `quantification.png`), together with a profile of each
+tool's run in Chrome trace format (`trace.json`; see instrument.py).
+
+    python PaddleBatch.py analysis.paddle proteinGroups.txt -o results
+
+Several files (or glob patterns, or folders to search for proteinGroups.txt and site
+tables) can be given to process them with the same configuration. They are processed
+in parallel in a process pool, one file per core by default, each into its own folder.
+A summary table of all files (summary.csv) is written to the output folder.
+
+    python PaddleBatch.py analysis.paddle "searches/*/txt/proteinGroups.txt" -o results -j 8
+'''
+from __future__ import unicode_literals
+import os
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from collections import OrderedDict
+
+# Must be set before Qt is imported (via the tools): no GUI application, no display
+os.environ['PADDLE_HEADLESS'] = '1'
+import matplotlib
+matplotlib.use('Agg')
+
+logging.debug('Loading batch.py')
+
+from . import utils
+from . import io
+from . import cache
+from . import workflow
+from . import pool
+from . import plots
+from . import instrument
+from . import normalization
+from .globals import settings
+from .tools import ( import_data, localization, amino_acids, rank_intensity,
+                     quantification, enrichment, design,
+                     filter, imputation, correlation
+                    )
+
+# Tool classes, in the same order as the GUI tool list
+TOOLS = [
+    import_data.ImportData,
+    localization.Localization,
+    amino_acids.ModifiedAminoAcids,
+    rank_intensity.RankIntensity,
+    quantification.Quantification,
+    design.Design,
+    filter.Filter,
+    imputation.Imputation,
+    correlation.Correlation,
+    enrichment.Enrichment,
+]
+
+# Processed data writers, by format (as for Save processed data in the GUI)
+DATA_FORMATS = {
+    'csv': lambda df, fn: df.to_csv(fn),
+    'pickle': lambda df, fn: df.to_pickle(fn),
+}
+
+
+def load_configuration(fn):
+    '''
+    Load a .paddle configuration file, as written by Save configuration in the GUI.
+
+    :return: dict of tool class name to tool config dict
+    '''
+    with open(fn, 'r') as f:
+        configuration = json.load(f)
+
+    return configuration.get('tools', {})
+
+
+def tool_configs(configuration, filename, design_filename=None, msp_filename=None):
+    '''
+    Build the config for each tool from a loaded configuration, applying the input
+    files for this run. Settings missing from the configuration (e.g. those added since
+    it was saved) take the tool's defaults, as in the GUI.
+
+    :return: dict of tool class to config dict
+    '''
+    configs = {}
+    for cls in TOOLS:
+        configs[cls] = cls.config_defaults()
+        configs[cls].update(configuration.get(cls.__name__, {}))
+
+    configs[import_data.ImportData]['filename'] = filename
+    if design_filename is not None:
+        configs[design.Design]['filename_design'] = design_filename
+    if msp_filename is not None:
+        configs[enrichment.Enrichment]['filename_msp'] = msp_filename
+
+    return configs
+
+
+class _LogProgress(object):
+    # Progress callback for headless runs; logs each tool's progress at debug level
+    # and records it as a stage checkpoint
+
+    def __init__(self, name, recorder):
+        self.name = name
+        self.recorder = recorder
+
+    def __call__(self, progress):
+        self.recorder.checkpoint(progress)
+        logging.debug('%s: %d%%' % (self.name, progress * 100))
+
+
+def run(configs, dataset, output=None, data_format='csv', image_format='png', figures=True):
+    '''
+    Run the active tools in dependency order, passing each tool's data to the tools
+    that take input from it.
+
+    A tool is active if it applies to the data file (see `ToolBase.applies_to`) and is
+    not switched off in its config (`is_active` set to False).
+
+    :param configs: dict of tool class to config dict, see `tool_configs`
+    :param dataset: header summary of the data file, see `io.sniff_maxquant`
+    :param output: folder to write processed data and figures to, or None to not write
+    :param data_format: 'csv' or 'pickle'
+    :param image_format: figure file extension, e.g. 'png', 'svg', 'tif'
+    :param figures: render and write figures; if False figures are never rendered
+    :return: OrderedDict of tool class to result dict, each with its run 'profile' added
+    '''
+    import matplotlib.pyplot as plt
+
+    def is_active(cls):
+        config = configs[cls]
+        return config.get('is_active', True) is not False and cls.applies_to(dataset, config)
+
+    if output:
+        utils.mkdir_p(output)
+
+    results = OrderedDict()
+    for cls in workflow.order(TOOLS, is_active):
+        data = {}
+        for t in workflow.resolve_inputs(cls, TOOLS, is_active):
+            if results[t].get('data'):
+                data.update(results[t]['data'])
+        if cls.uses is not None:
+            data = {k: v for k, v in data.items() if k in cls.uses}
+
+        recorder = instrument.Recorder(cls.name)
+        kwargs = {
+            'config': configs[cls],
+            'progress_callback': _LogProgress(cls.name, recorder),
+        }
+        kwargs.update(data)
+        kwargs.update(cls.function_args(dataset))
+
+        logging.info('Running %s' % cls.name)
+        recorder.start(inputs=data)
+        result = getattr(cls, cls.function)(**kwargs) or {}
+        recorder.stop('ok', outputs=result.get('data'))
+        result['profile'] = recorder.as_dict()
+        logging.info('%s: done in %.1fs (%.1fs CPU)' % (cls.name, recorder.wall, recorder.cpu))
+
+        # Figures are only rendered (the slow part of most tools) when written out
+        spec = result.pop('fig', None)
+        if spec is not None and output and figures:
+            fig = plots.render(spec)
+            fig.savefig(os.path.join(output, '%s.%s' % (cls.shortname, image_format)), bbox_inches='tight')
+            plt.close(fig)
+
+        if output:
+            write_data(cls, result.get('data'), data, output, data_format)
+
+        results[cls] = result
+
+    if output:
+        instrument.export(os.path.join(output, 'trace.json'), [r['profile'] for r in results.values()], trace=True)
+
+    return results
+
+
+def write_data(cls, data, inputs, output, data_format='csv'):
+    '''
+    Write the tables in a tool's output `data` to `output`. Tables passed through
+    unchanged from the tool's `inputs` are skipped, as they were written by the tool
+    that produced them.
+    '''
+    if not data:
+        return
+
+    write = DATA_FORMATS[data_format]
+    for k, v in data.items():
+        if not hasattr(v, 'to_csv') or any(v is i for i in inputs.values()):
+            continue
+
+        name = cls.shortname if k == 'df' else '%s_%s' % (cls.shortname, k)
+        write(v, os.path.join(output, '%s.%s' % (name, data_format)))
+
+
+def output_names(filenames):
+    '''
+    Return a unique name for each input file, for its output folder. The file name is
+    used where unique; MaxQuant output files share names (proteinGroups.txt) so
+    otherwise the path from the folders' common parent is used.
+    '''
+    names = [os.path.splitext(os.path.basename(fn))[0] for fn in filenames]
+    if len(set(names)) == len(names):
+        return names
+
+    paths = [os.path.splitext(os.path.abspath(fn))[0] for fn in filenames]
+    common = os.path.dirname(os.path.commonprefix(paths))
+    return [os.path.relpath(p, common).replace(os.sep, '_') for p in paths]
+
+
+def process_file(configuration, filename, output, design_filename=None, msp_filename=None, **kwargs):
+    '''
+    Process a single data file with a loaded configuration, writing results to `output`.
+    Additional keyword arguments are passed to `run`.
+
+    :return: OrderedDict of tool class to result dict
+    '''
+    logging.info('Processing %s' % filename)
+    dataset = io.sniff_maxquant(filename)
+    configs = tool_configs(configuration, filename, design_filename, msp_filename)
+    return run(configs, dataset, output, **kwargs)
+
+
+def summarise(name, filename, results):
+    '''
+    Build a summary row for a processed file: the kind of data, number of samples,
+    quantification type and the number of rows output by each tool.
+
+    :return: OrderedDict of column name to value
+    '''
+    dataset = io.sniff_maxquant(filename)
+
+    summary = OrderedDict([
+        ('name', name),
+        ('filename', filename),
+        ('kind', dataset['kind']),
+        ('samples', len(dataset['samples'])),
+    ])
+
+    for cls, result in results.items():
+        data = result.get('data') or {}
+        if 'quantification_type' in data:
+            summary['quantification'] = data['quantification_type']
+        if hasattr(data.get('df'), 'shape'):
+            summary['%s rows' % cls.shortname] = data['df'].shape[0]
+
+    return summary
+
+
+def process_task(configuration, name, filename, output, design_filename=None, msp_filename=None, **kwargs):
+    '''
+    Process a single data file (see `process_file`) and return its summary row (see
+    `summarise`). Run in the batch process pool, so only the summary is sent back.
+    Errors are logged and recorded in the summary, so one bad file doesn't stop a batch.
+    '''
+    start = time.time()
+    try:
+        results = process_file(configuration, filename, output, design_filename, msp_filename, **kwargs)
+        summary = summarise(name, filename, results)
+        summary['status'] = 'ok'
+
+    except Exception as e:
+        logging.exception('Failed to process %s' % filename)
+        summary = OrderedDict([('name', name), ('filename', filename), ('status', 'error'), ('error', str(e))])
+
+    summary['seconds'] = round(time.time() - start, 1)
+    return summary
+
+
+def main(argv=None):
+    # Frozen builds must handle spawned pool processes before anything else
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser(
+        description='Process MaxQuant data files with a saved Paddle configuration, without the GUI.')
+    parser.add_argument('configuration', help='Paddle configuration file (.paddle)')
+    parser.add_argument('filenames', nargs='+', help='MaxQuant data file(s), glob patterns or folders')
+    parser.add_argument('-o', '--output', default='.', help='output folder (default: current folder)')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='number of files to process in parallel (default: one per core)')
+    parser.add_argument('--design', help='experimental design file, overriding the configuration')
+    parser.add_argument('--msp', help='modificationSpecificPeptides file, overriding the configuration')
+    parser.add_argument('--format', dest='data_format', choices=sorted(DATA_FORMATS), default='csv',
+                        help='processed data file format (default: csv)')
+    parser.add_argument('--image-format', default='png', help='figure file format (default: png)')
+    parser.add_argument('--no-figures', dest='figures', action='store_false', help='do not write figures')
+    parser.add_argument('--no-cache', dest='cache', action='store_false', help='do not use the parsed data cache')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log debug messages')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    utils.enable_copy_on_write()
+
+    data_cache = None
+    if args.cache and settings.get('cache/enabled'):
+        data_cache = cache.configure(settings.get('cache/directory'), settings.get('cache/max_size') * 1024 ** 2)
+
+    # Within a file; files processed in parallel get one thread each (see get_threads)
+    normalization.configure(settings.get('normalization/threads'))
+
+    configuration = load_configuration(args.configuration)
+
+    filenames = io.expand_filenames(args.filenames)
+    if not filenames:
+        parser.error('no data files found')
+
+    # One output folder per file when processing several
+    names = output_names(filenames)
+    if len(filenames) > 1:
+        outputs = [os.path.join(args.output, n) for n in names]
+    else:
+        outputs = [args.output]
+
+    options = {
+        'data_format': args.data_format,
+        'image_format': args.image_format,
+        'figures': args.figures,
+    }
+    tasks = [(configuration, name, fn, output, args.design, args.msp)
+             for name, fn, output in zip(names, filenames, outputs)]
+
+    jobs = pool.worker_count(args.jobs, len(tasks))
+    if jobs > 1:
+        # Parallelise across files, not within them: one numerical thread per process
+        pool.limit_threads()
+
+        # Pool processes share the parsed data cache
+        pool.configure(jobs, (data_cache.directory, data_cache.max_size) if data_cache else None)
+        logging.info('Processing %d files with %d processes' % (len(tasks), jobs))
+
+        executor = pool.get_pool()
+        futures = [executor.submit(process_task, *task, **options) for task in tasks]
+        summaries = []
+        for task, future in zip(tasks, futures):
+            summaries.append(future.result())
+            logging.info('Finished %s (%s)' % (task[2], summaries[-1]['status']))
+
+        pool.shutdown()
+
+    else:
+        summaries = [process_task(*task, **options) for task in tasks]
+
+    failed = sum(1 for s in summaries if s['status'] != 'ok')
+
+    import pandas as pd
+    utils.mkdir_p(args.output)
+    pd.DataFrame(summaries).to_csv(os.path.join(args.output, 'summary.csv'), index=False)
+
+    logging.info('Processed %d of %d files' % (len(filenames) - failed, len(filenames)))
+    return 1 if failed else 0
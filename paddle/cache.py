@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import os
+import json
+import hashlib
+import time
+import logging
+import threading
+import pickle
+from collections import OrderedDict
+logging.debug('Loading cache.py')
+
+from . import utils
+
+# pyarrow is optional (`pip install Paddle[cache]`); without it cached and spilled tables
+# are stored as pickles, which are slower to write and are read back in full rather
+# than memory-mapped.
+try:
+    import pyarrow
+    import pyarrow.feather
+except ImportError:
+    pyarrow = None
+
+# Bump to invalidate all stored entries when the on-disk layout changes
+CACHE_VERSION = 2
+
+# Block size used when hashing file contents
+HASH_BLOCKSIZE = 4 * 1024 * 1024
+
+
+def write_frame(df, path):
+    '''
+    Write a DataFrame to `path` in a binary columnar format; Feather (uncompressed, so it
+    can be memory-mapped on read) when pyarrow is available, otherwise pickle.
+    The write is atomic: a partially written file is never visible at `path`, nor left
+    behind if the write fails.
+    '''
+    tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.current_thread().ident)
+    try:
+        if pyarrow:
+            table = pyarrow.Table.from_pandas(df, preserve_index=True)
+            pyarrow.feather.write_feather(table, tmp, compression='uncompressed')
+        else:
+            df.to_pickle(tmp)
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def read_frame(path):
+    '''
+    Read a DataFrame written by `write_frame`, memory-mapping the file where supported.
+    '''
+    if pyarrow:
+        # Converted a column at a time without consolidating into 2-d blocks, releasing
+        # each Arrow column as it goes, so the table is not held twice while converting.
+        # The Table must not be referenced after the conversion.
+        return pyarrow.feather.read_table(path, memory_map=True).to_pandas(
+            self_destruct=True, split_blocks=True)
+
+    import pandas as pd
+    return pd.read_pickle(path)
+
+
+def frame_extension():
+    return '.feather' if pyarrow else '.pickle'
+
+
+def evict_directory(directory, ext, max_size):
+    '''
+    Remove the least-recently used (by modification time) files with extension `ext`
+    from `directory` until their total size is within `max_size` bytes.
+    '''
+    entries = []
+    for fn in os.listdir(directory):
+        if not fn.endswith(ext):
+            continue
+        path = os.path.join(directory, fn)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    entries.sort()
+    total = sum(e[1] for e in entries)
+    while entries and total > max_size:
+        _, size, path = entries.pop(0)
+        try:
+            os.remove(path)
+            logging.info('Evicted cache entry %s' % path)
+        except OSError:
+            pass
+        total -= size
+
+
+def touch(path):
+    # Mark as recently used for LRU eviction
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+# Libraries whose versions affect tool results, as well as paddle's own code
+CODE_DEPENDENCIES = ('numpy', 'pandas', 'scipy', 'padua')
+
+_code_fingerprint = None
+
+
+def source_fingerprint(directory, packages=()):
+    '''
+    Return a hash of the Python sources under `directory` and the installed versions of
+    `packages` (None for those not installed).
+    '''
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:  # Python < 3.8
+        from importlib_metadata import version, PackageNotFoundError
+
+    h = hashlib.sha1()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for fn in sorted(files):
+            if fn.endswith('.py'):
+                path = os.path.join(root, fn)
+                h.update(os.path.relpath(path, directory).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+
+    for p in packages:
+        try:
+            v = version(p)
+        except PackageNotFoundError:
+            v = None
+        h.update(repr((p, v)).encode('utf-8'))
+
+    return h.hexdigest()
+
+
+def code_fingerprint():
+    '''
+    Return a hash of paddle's code and the versions of the libraries it uses, calculated
+    once per process. Tool results depend on helper modules (e.g. process.py,
+    normalization.py) as well as the tool function itself, so this is part of every
+    result key; results stored on disk by a different version are then not re-used.
+    '''
+    global _code_fingerprint
+    if _code_fingerprint is None:
+        _code_fingerprint = source_fingerprint(os.path.dirname(os.path.abspath(__file__)), CODE_DEPENDENCIES)
+    return _code_fingerprint
+
+
+def content_fingerprint(value, max_nbytes=1024 ** 2):
+    '''
+    Return a hash of a value's content if it is cheap to compute: scalars, strings and
+    tables (or arrays) up to `max_nbytes`. Returns None for anything else.
+    '''
+    import numpy as np
+    import pandas as pd
+
+    h = hashlib.sha1()
+    if value is None or isinstance(value, (str, bytes, int, float, bool, tuple)):
+        h.update(repr(value).encode('utf-8'))
+
+    elif isinstance(value, (pd.DataFrame, pd.Series)):
+        # Shallow size: deep sizing of object columns would cost as much as the hash
+        if np.sum(value.memory_usage(index=True, deep=False)) > max_nbytes:
+            return None
+        h.update(repr((type(value).__name__, value.shape, list(getattr(value, 'columns', [])),
+                       [str(d) for d in np.atleast_1d(value.dtypes)])).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+
+    elif isinstance(value, np.ndarray):
+        if value.nbytes > max_nbytes:
+            return None
+        h.update(repr((value.shape, str(value.dtype))).encode('utf-8'))
+        h.update(np.ascontiguousarray(value).tobytes())
+
+    else:
+        return None
+
+    return h.hexdigest()
+
+
+def result_nbytes(*results):
+    '''
+    Estimate the memory held by tool results, counting the DataFrames in their data
+    dicts. Tables are often passed through from one tool's result to the next without
+    copying, so each table is counted once however many results hold it.
+    '''
+    seen = set()
+    nbytes = 0
+    for result in results:
+        data = result.get('data') if result else None
+        if not data:
+            continue
+
+        for v in data.values():
+            if hasattr(v, 'memory_usage') and id(v) not in seen:
+                seen.add(id(v))
+                nbytes += int(v.memory_usage(index=True).sum())
+    return nbytes
+
+
+class DataCache(object):
+    '''
+    Persistent on-disk cache of parsed tables.
+
+    Entries are keyed by the content hash of the source file combined with any reader
+    parameters. Hashing a large file is itself slow, so the hash is remembered against
+    the file's (path, size, mtime) in an index and only recalculated when those change.
+    The cache directory is bounded to `max_size` bytes, evicting the least-recently
+    used entries first.
+
+    :param directory: folder to store cached tables in, created if missing
+    :param max_size: maximum total size of stored entries in bytes
+    '''
+
+    def __init__(self, directory, max_size=4 * 1024 ** 3):
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.RLock()
+
+        utils.mkdir_p(directory)
+        self._index_fn = os.path.join(directory, 'index.json')
+        self._index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self._index_fn, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        # Process-specific, as pool processes may share the cache directory
+        tmp = '%s.%d.tmp' % (self._index_fn, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self._index_fn)
+
+    def fingerprint(self, fn):
+        '''
+        Return the content hash for file `fn`, re-using the stored hash while the path,
+        size and modification time are unchanged.
+        '''
+        path = os.path.abspath(fn)
+        st = os.stat(path)
+
+        with self._lock:
+            entry = self._index.get(path)
+            if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+                return entry['hash']
+
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCKSIZE), b''):
+                h.update(block)
+        digest = h.hexdigest()
+
+        with self._lock:
+            self._index[path] = {'size': st.st_size, 'mtime': st.st_mtime, 'hash': digest}
+            self._save_index()
+
+        return digest
+
+    def key(self, fn, *args):
+        '''
+        Build a cache key for file `fn`, parsed with the reader parameters in `args`.
+        '''
+        h = hashlib.sha1()
+        h.update(self.fingerprint(fn).encode('utf-8'))
+        h.update(repr((CACHE_VERSION,) + args).encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + frame_extension())
+
+    def get(self, key):
+        '''
+        Return the cached DataFrame for `key`, or None if not present.
+        '''
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            df = read_frame(path)
+        except Exception:
+            logging.exception('Failed to read cache entry %s; discarding' % path)
+            self._remove(path)
+            return None
+
+        touch(path)
+
+        logging.info('Loaded cached table %s' % key)
+        return df
+
+    def put(self, key, df):
+        '''
+        Store DataFrame `df` under `key`, then evict old entries to stay within `max_size`.
+        '''
+        try:
+            write_frame(df, self._path(key))
+        except Exception:
+            logging.exception('Failed to write cache entry %s' % key)
+            return
+
+        self.evict()
+
+    def evict(self):
+        '''
+        Remove the least-recently used entries until the total size is within `max_size`.
+        '''
+        with self._lock:
+            evict_directory(self.directory, frame_extension(), self.max_size)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            logging.info('Evicted cache entry %s' % path)
+        except OSError:
+            pass
+
+
+class ResultCache(object):
+    '''
+    Cache of tool results, keyed by a fingerprint of the tool's inputs, configuration
+    and code (see `ToolBase.result_key`).
+
+    Results are held in memory up to `max_size` bytes, evicting the least-recently used;
+    tables shared between results are counted once. If a `directory` is given results
+    are also pickled to disk in the background and reloaded from there when no longer in
+    memory; the directory is bounded to `max_disk_size` bytes.
+
+    The in-memory tier can also be evicted from by a `memory.MemoryBudget`, using
+    `entries` and `discard`, so cached results count towards the tool data budget.
+
+    :param max_size: maximum bytes of results held in memory
+    :param directory: folder for the on-disk tier, or None to keep results in memory only
+    :param max_disk_size: maximum total size of the on-disk tier in bytes
+    '''
+
+    def __init__(self, max_size=2 * 1024 ** 3, directory=None, max_disk_size=8 * 1024 ** 3):
+        self.max_size = max_size
+        self.directory = directory
+        self.max_disk_size = max_disk_size
+
+        self._memory = OrderedDict()  # key: (result, last used time)
+        self._lock = threading.RLock()
+
+        if directory:
+            utils.mkdir_p(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.result')
+
+    def get(self, key):
+        '''
+        Return the cached result for `key`, or None if not present.
+        '''
+        with self._lock:
+            if key in self._memory:
+                result = self._memory[key][0]
+                self._memory[key] = (result, time.time())
+                self._memory.move_to_end(key)
+                return result
+
+        if not self.directory or not os.path.exists(self._path(key)):
+            return None
+
+        try:
+            with open(self._path(key), 'rb') as f:
+                result = pickle.load(f)
+        except Exception:
+            logging.exception('Failed to read cached result %s' % key)
+            return None
+
+        touch(self._path(key))
+        self._store(key, result)
+        return result
+
+    def put(self, key, result):
+        '''
+        Store `result` under `key`; written to the on-disk tier in the background.
+        '''
+        self._store(key, result)
+
+        if self.directory and not os.path.exists(self._path(key)):
+            t = threading.Thread(target=self._write, args=(key, result))
+            t.daemon = True
+            t.start()
+
+    def _store(self, key, result):
+        with self._lock:
+            self._memory.pop(key, None)
+            self._memory[key] = (result, time.time())
+
+            # Always keep the most recent entry, even if alone it exceeds the limit
+            while len(self._memory) > 1 and self.size() > self.max_size:
+                self._memory.popitem(last=False)
+
+    def size(self):
+        '''
+        Return the bytes of tables held in memory, counting shared tables once.
+        '''
+        with self._lock:
+            return result_nbytes(*[r for r, _ in self._memory.values()])
+
+    def entries(self):
+        '''
+        Return a list of (key, result, last used time) for the results held in memory,
+        least-recently used first.
+        '''
+        with self._lock:
+            return [(key, r, used) for key, (r, used) in self._memory.items()]
+
+    def discard(self, key):
+        '''
+        Remove the result for `key` from memory; it is still reloaded from the on-disk
+        tier, if there is one.
+        '''
+        with self._lock:
+            self._memory.pop(key, None)
+
+    def _write(self, key, result):
+        path = self._path(key)
+        tmp = '%s.%d.tmp' % (path, threading.current_thread().ident)
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception:
+            logging.exception('Failed to write cached result %s' % key)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+
+        evict_directory(self.directory, '.result', self.max_disk_size)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+
+# Application-wide caches, set up by `configure` and `configure_results`; None when disabled
+default_cache = None
+default_results = None
+
+
+def configure(directory, max_size):
+    global default_cache
+    if directory:
+        default_cache = DataCache(directory, max_size)
+    else:
+        default_cache = None
+    return default_cache
+
+
+def get_cache():
+    return default_cache
+
+
+def configure_results(max_size, directory=None, max_disk_size=8 * 1024 ** 3):
+    global default_results
+    if max_size:
+        default_results = ResultCache(max_size, directory, max_disk_size)
+    else:
+        default_results = None
+    return default_results
+
+
+def get_results():
+    return default_results
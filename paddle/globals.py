@@ -16,21 +16,42 @@ STATUS_COLORS = {
     'active': 'orange',
     'error': 'red',
     'inactive': 'white',
-    'complete': 'green'
+    'complete': 'green',
+    'stale': 'grey',
 }
 
 # ReadTheDocs
 ON_RTD = os.environ.get('READTHEDOCS', None) == 'True'
 if not ON_RTD:
 
-    # Application settings
-    settings = QSettingsManager()
+    # Application settings. The names QSettings needs are set in qt.py without an
+    # application object, which headless runs don't have, so skip pyqtconfig's check
+    settings = QSettingsManager(warn_no_app_name=False)
     settings.set_defaults({
         'core/is_setup': False,
         'core/current_version': '0.0.1',
         'core/latest_version': '0.0.1',
         'core/last_time_version_checked': 0,
         'core/offered_registration': False,
+        # Parsed data cache
+        'cache/enabled': True,
+        'cache/directory': os.path.join(QStandardPaths.writableLocation(QStandardPaths.CacheLocation), 'data'),
+        'cache/max_size': 4096,  # MB
+        # Tool result cache
+        'cache/results_max_size': 2048,  # MB held in memory
+        'cache/results_on_disk': False,
+        'cache/results_directory': os.path.join(QStandardPaths.writableLocation(QStandardPaths.CacheLocation), 'results'),
+        'cache/results_max_disk_size': 8192,  # MB
+        # Run tool functions in a process pool rather than on threads
+        'processes/enabled': False,
+        'processes/max_workers': 0,  # 0 = one per core
+        # Tool data held in memory; older tables are spilled to disk beyond this
+        'memory/budget': 4096,  # MB, 0 = unlimited
+        'memory/spill_directory': '',  # Temporary folder if empty
+        # Trace allocations (tracemalloc) when profiling tool runs; slows runs down
+        'instrument/trace_memory': False,
+        # Threads for normalization kernels
+        'normalization/threads': 0,  # 0 = one per core
     })
 
     # GLobal processing settings (e.g. peak annotations, class groups, etc.)
@@ -48,6 +69,7 @@ if not ON_RTD:
         'error': QColor(255, 0, 0),
         'inactive': QColor(255, 255, 255),
         'complete': QColor(0, 255, 0),
+        'stale': QColor(200, 200, 200),
     }
 
     def _get_QLineEdit(self):
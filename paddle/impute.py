@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading impute.py')
+
+from collections import OrderedDict
+
+from .normalization import Method, map_blocks, slices, column_quantiles, BLOCK_COLUMNS, BLOCK_ROWS
+
+# Query rows per block of the nearest neighbour search; with `BLOCK_ROWS` candidate
+# rows, bounds the distances held at once (per thread) to KNN_QUERY_ROWS x BLOCK_ROWS
+KNN_QUERY_ROWS = 1024
+
+# Available methods, in the order offered; see `register`
+METHODS = OrderedDict()
+
+
+def register(name, label):
+    '''
+    Decorator adding a kernel function to `METHODS`.
+    '''
+    def decorator(fn):
+        METHODS[name] = Method(name, label, fn)
+        return fn
+    return decorator
+
+
+def impute(values, method, seed=0, threads=None, **options):
+    '''
+    Replace the missing (NaN) values of a block of values (rows, samples) in place with
+    the named method.
+
+    Random draws are seeded per sample from `seed`, so results are reproducible and
+    don't depend on the number of threads.
+
+    :param values: float numpy array, ideally column-major (see `process.value_block`)
+    :param method: key of `METHODS`
+    :param seed: seed for random draws
+    :param threads: threads to share column or row blocks across; see `normalization.get_threads`
+    :param options: method options, e.g. `width`, `shift`, `quantile` or `k`
+    :return: values
+    '''
+    METHODS[method].fn(values, seed=seed, threads=threads, **options)
+    return values
+
+
+def moments(a, axis):
+    '''
+    Mean and sample standard deviation of the non-NaN values along an axis of a 2-d
+    array; NaN where there are too few values.
+    '''
+    import numpy as np
+
+    valid = ~np.isnan(a)
+    n = np.count_nonzero(valid, axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, a, 0).sum(axis=axis, dtype=np.float64) / n
+        deviations = np.where(valid, a - np.expand_dims(mean, axis), 0)
+        sd = np.sqrt((deviations ** 2).sum(axis=axis) / (n - 1))
+    return mean, sd
+
+
+def draw(values, s, mean, sd, seed):
+    '''
+    Fill the missing values of the columns at slice `s` with draws from a normal
+    distribution per column, of the given means and standard deviations (one per column
+    of the slice). Each sample has its own generator, seeded from `seed` and its position.
+    '''
+    import numpy as np
+
+    for j, m, d in zip(range(s.start, s.stop), mean, sd):
+        c = values[:, j]
+        missing = np.flatnonzero(np.isnan(c))
+        if missing.size and np.isfinite(m) and np.isfinite(d):
+            c[missing] = np.random.default_rng([seed, j]).normal(m, d, missing.size)
+
+
+@register('gaussian', 'Left-shifted Gaussian (Perseus)')
+def gaussian(values, seed=0, threads=None, width=0.3, shift=1.8, **options):
+    '''
+    Draw each sample's missing values from a normal distribution below its measured
+    values, as Perseus does: missing values are taken to be low abundance, below the
+    detection limit. The distribution is centered `shift` standard deviations below the
+    mean of the measured values, and is `width` standard deviations wide.
+    '''
+    def impute_block(s):
+        mean, sd = moments(values[:, s], axis=0)
+        draw(values, s, mean - shift * sd, width * sd, seed)
+
+    map_blocks(impute_block, slices(values.shape[1], BLOCK_COLUMNS), threads)
+
+
+@register('minprob', 'MinProb')
+def minprob(values, seed=0, threads=None, quantile=0.01, width=1.0, **options):
+    '''
+    Draw each sample's missing values from a normal distribution centered on a low
+    quantile of its measured values, as MinProb (imputeLCMD) does. The standard
+    deviation is the median of the rows' standard deviations, over rows measured in
+    more than half the samples, scaled by `width`.
+    '''
+    import numpy as np
+
+    rows, columns = values.shape
+
+    def row_deviations(s):
+        block = values[s, :]
+        sd = moments(block, axis=1)[1]
+        return sd[np.count_nonzero(~np.isnan(block), axis=1) > columns / 2]
+
+    sd = np.concatenate(map_blocks(row_deviations, slices(rows, BLOCK_ROWS), threads))
+    sd = sd[np.isfinite(sd)]
+    if not sd.size:
+        logging.warning('MinProb: no rows measured in more than half the samples; values not imputed')
+        return
+    sd = np.median(sd) * width
+
+    def impute_block(s):
+        minima = column_quantiles(values[:, s], quantile)
+        draw(values, s, minima, np.full(len(minima), sd), seed)
+
+    map_blocks(impute_block, slices(columns, BLOCK_COLUMNS), threads)
+
+
+def nearest_neighbours(filled, observed, queries, k, candidates=BLOCK_ROWS):
+    '''
+    Find the `k` nearest rows to each of the rows at positions `queries`, by Euclidean
+    distance over the samples measured in both rows, scaled up to all samples (as in
+    `sklearn.metrics.pairwise.nan_euclidean_distances`). Rows are compared a block of
+    `candidates` rows at a time, keeping the running nearest `k`, so memory use is
+    bounded by the block size rather than growing with the square of the number of rows.
+
+    The sums over measured samples are taken as matrix products, of the values with
+    missing values as zero (`filled`) and the mask of measured values (`observed`), in
+    the precision of `filled`. Center the columns of `filled` (distances are unchanged)
+    to keep the products accurate in single precision.
+
+    :return: tuple of (positions, squared distances), arrays of shape (queries, k),
+             nearest first; distance is inf where rows have no samples in common
+    '''
+    import numpy as np
+
+    rows, columns = filled.shape
+    dtype = filled.dtype
+    q = filled[queries]
+    mq = observed[queries].astype(dtype)
+    # One product gives the sum over measured samples of x^2 + y^2 - 2xy
+    left = np.hstack([q ** 2, mq, -2 * q])
+
+    best = np.full((len(queries), k), np.inf, dtype=dtype)
+    best_positions = np.full((len(queries), k), -1, dtype=np.intp)
+
+    for s in slices(rows, candidates):
+        c = filled[s]
+        mc = observed[s].astype(dtype)
+
+        shared = mq @ mc.T
+        d = left @ np.hstack([mc, c ** 2, c]).T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            d *= columns / shared
+        d[shared == 0] = np.inf
+
+        # A row is not its own neighbour
+        own = (queries >= s.start) & (queries < s.stop)
+        d[np.flatnonzero(own), queries[own] - s.start] = np.inf
+
+        # Merge candidates nearer than a row's current k-th nearest with its nearest so
+        # far. Once a few blocks are seen these are few, so are merged as a short list
+        # per row rather than partitioning the whole block
+        nearer = d < best.max(axis=1)[:, None]
+        n = np.count_nonzero(nearer)
+        if not n:
+            continue
+
+        if n > d.size // 16:
+            merged = np.hstack([best, d])
+            nearest = np.argpartition(merged, k - 1, axis=1)[:, :k]
+            best = np.take_along_axis(merged, nearest, axis=1)
+            best_positions = np.where(nearest < k,
+                                      np.take_along_axis(best_positions, np.minimum(nearest, k - 1), axis=1),
+                                      nearest - k + s.start)
+            continue
+
+        r, i = np.nonzero(nearer)
+        counts = np.bincount(r, minlength=len(queries))
+        merge = np.flatnonzero(counts)
+        row = np.repeat(np.arange(merge.size), counts[merge])
+        slot = np.arange(r.size) - np.repeat(np.cumsum(counts[merge]) - counts[merge], counts[merge])
+
+        merged = np.full((merge.size, k + counts.max()), np.inf, dtype=dtype)
+        merged_positions = np.full(merged.shape, -1, dtype=np.intp)
+        merged[:, :k] = best[merge]
+        merged_positions[:, :k] = best_positions[merge]
+        merged[row, k + slot] = d[r, i]
+        merged_positions[row, k + slot] = i + s.start
+
+        nearest = np.argpartition(merged, k - 1, axis=1)[:, :k]
+        best[merge] = np.take_along_axis(merged, nearest, axis=1)
+        best_positions[merge] = np.take_along_axis(merged_positions, nearest, axis=1)
+
+    np.maximum(best, 0, out=best)
+    order = np.argsort(best, axis=1)
+    return np.take_along_axis(best_positions, order, axis=1), np.take_along_axis(best, order, axis=1)
+
+
+@register('knn', 'k nearest neighbours')
+def knn(values, seed=0, threads=None, k=10, **options):
+    '''
+    Replace each missing value by the mean of that sample's values in the `k` rows
+    nearest the row (see `nearest_neighbours`), of those measured in the sample; as
+    impute.knn (Troyanskaya et al. 2001). Where none of the nearest rows are measured in
+    the sample, the sample mean is used. Rows are imputed in blocks, shared across
+    threads; neighbours are found from, and averaged over, the measured values only.
+    '''
+    import numpy as np
+
+    rows, columns = values.shape
+    k = min(k, rows - 1)
+
+    observed = ~np.isnan(values)
+    queries = np.flatnonzero(~observed.all(axis=1))
+    if not queries.size or k < 1:
+        return
+
+    means = moments(values, axis=0)[0]
+    # Centered, with missing values as zero; see `nearest_neighbours`
+    filled = np.where(observed, values - means.astype(values.dtype), 0).astype(values.dtype, copy=False)
+
+    def impute_block(s):
+        block = queries[s]
+        neighbours, distances = nearest_neighbours(filled, observed, block, k)
+        found = np.isfinite(distances)
+
+        # Sum and count of the measured values of the neighbours, per sample
+        weights = observed[neighbours] & found[:, :, None]
+        total = np.where(weights, filled[neighbours], 0).sum(axis=1, dtype=np.float64)
+        count = np.count_nonzero(weights, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            imputed = means + np.where(count > 0, total / count, 0)
+
+        # Rows at `block` are only written by this block; neighbours are read from
+        # `filled`, so are unaffected by other blocks' writes
+        missing = ~observed[block]
+        r, c = np.nonzero(missing)
+        values[block[r], c] = imputed[r, c]
+
+    map_blocks(impute_block, slices(len(queries), KNN_QUERY_ROWS), threads)
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import tracemalloc
+logging.debug('Loading instrument.py')
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# CPU time of the calling thread, where available (Python >= 3.7)
+thread_time = getattr(time, 'thread_time', time.process_time)
+
+# Trace Python allocations (including numpy arrays) during runs; adds noticeable overhead
+trace_memory = False
+
+# Profiles of completed runs, in order of completion; see `add`
+records = []
+
+_tracing = 0
+_tracing_lock = threading.Lock()
+
+
+def configure(trace=False):
+    global trace_memory
+    trace_memory = trace
+
+
+def _start_tracing():
+    global _tracing
+    with _tracing_lock:
+        if _tracing == 0:
+            tracemalloc.start()
+        _tracing += 1
+
+
+def _stop_tracing():
+    # Return the peak traced memory, stopping tracing once no run needs it
+    global _tracing
+    with _tracing_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracing -= 1
+        if _tracing == 0:
+            tracemalloc.stop()
+    return peak
+
+
+def peak_rss():
+    '''
+    Return the peak resident set size of this process in bytes, or None where unavailable.
+    '''
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, kilobytes elsewhere
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def shapes(data):
+    '''
+    Return the shapes of the tables and arrays in a dict of tool data, as lists.
+    '''
+    if not data:
+        return {}
+    return {k: list(v.shape) for k, v in data.items() if getattr(v, 'ndim', 0)}
+
+
+class Recorder(object):
+    '''
+    Record timings and memory use for a single run of a tool function.
+
+    Call `start` and `stop` around the run, and `checkpoint` from its progress callback
+    to time the stages between progress reports. CPU time is for the running thread (or
+    process, with `cpu_clock=time.process_time`). Memory is the process peak RSS at the
+    end of the run (a high-water mark for the process, not the run) and, if
+    `trace_memory` is set, the peak of allocations traced while the run was in progress,
+    which includes any runs concurrent with it.
+
+    :param name: name of the function or tool run
+    :param trace: trace allocations with tracemalloc; defaults to the module `trace_memory` setting
+    :param cpu_clock: function returning CPU seconds
+    '''
+
+    def __init__(self, name, trace=None, cpu_clock=None):
+        self.name = name
+        self.trace_memory = trace_memory if trace is None else trace
+        self.cpu_clock = cpu_clock or thread_time
+
+        self.status = None
+        self.error = None
+        self.started = None
+        self.wall = None
+        self.cpu = None
+        self.peak_rss = None
+        self.peak_traced = None
+        self.inputs = {}
+        self.outputs = {}
+        self.stages = []  # (progress, seconds since start)
+
+    def start(self, inputs=None):
+        self.pid = os.getpid()
+        self.thread = threading.current_thread().ident
+        self.inputs = shapes(inputs)
+
+        if self.trace_memory:
+            _start_tracing()
+
+        self.started = time.time()
+        self._wall0 = time.perf_counter()
+        self._cpu0 = self.cpu_clock()
+
+    def checkpoint(self, progress):
+        self.stages.append((float(progress), time.perf_counter() - self._wall0))
+
+    def stop(self, status='ok', outputs=None, error=None):
+        self.wall = time.perf_counter() - self._wall0
+        self.cpu = self.cpu_clock() - self._cpu0
+
+        if self.trace_memory:
+            self.peak_traced = _stop_tracing()
+        self.peak_rss = peak_rss()
+
+        self.status = status
+        self.error = error
+        self.outputs = shapes(outputs)
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'error': self.error,
+            'started': self.started,
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'peak_rss': self.peak_rss,
+            'peak_traced': self.peak_traced,
+            'inputs': self.inputs,
+            'outputs': self.outputs,
+            'stages': self.stages,
+            'pid': self.pid,
+            'thread': self.thread,
+        }
+
+
+def add(record):
+    '''
+    Add a completed run's profile (as from `Recorder.as_dict`) to `records`.
+    '''
+    records.append(record)
+    logging.info('%s: %s in %.2fs wall, %.2fs CPU' % (record['name'], record['status'], record['wall'], record['cpu']))
+
+
+def clear():
+    del records[:]
+
+
+def stage_intervals(record):
+    '''
+    Return the stages of a run as (label, start, duration) tuples, in seconds from the
+    start of the run. Each stage runs up to a progress checkpoint; the last to the end.
+    '''
+    intervals = []
+    previous_progress, previous_t = 0.0, 0.0
+    for progress, t in record['stages'] + [(1.0, record['wall'])]:
+        if t > previous_t:
+            intervals.append(('%d-%d%%' % (previous_progress * 100, progress * 100), previous_t, t - previous_t))
+        previous_progress, previous_t = progress, t
+
+    return intervals
+
+
+def to_chrome_trace(records):
+    '''
+    Convert run profiles to Chrome trace event format (chrome://tracing, Perfetto):
+    one complete event per run with nested events for its stages, on a track per
+    process and thread.
+    '''
+    events = []
+    if not records:
+        return {'traceEvents': events}
+
+    origin = min(r['started'] for r in records)
+    for r in records:
+        start = (r['started'] - origin) * 1e6
+        events.append({
+            'name': r['name'], 'cat': 'tool', 'ph': 'X',
+            'ts': start, 'dur': r['wall'] * 1e6,
+            'pid': r['pid'], 'tid': r['thread'],
+            'args': {k: r[k] for k in ('status', 'error', 'cpu', 'peak_rss', 'peak_traced', 'inputs', 'outputs')},
+        })
+        for label, t, duration in stage_intervals(r):
+            events.append({
+                'name': label, 'cat': 'stage', 'ph': 'X',
+                'ts': start + t * 1e6, 'dur': duration * 1e6,
+                'pid': r['pid'], 'tid': r['thread'],
+            })
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def export(fn, records, trace=False):
+    '''
+    Write run profiles to `fn` as JSON, either as a list of profiles or, if `trace` is
+    set, in Chrome trace event format.
+    '''
+    with open(fn, 'w') as f:
+        json.dump(to_chrome_trace(records) if trace else records, f, indent=1)
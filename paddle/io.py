@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import os
+import logging
+logging.debug('Loading io.py')
+
+# Number of rows parsed per chunk when streaming MaxQuant tables
+DEFAULT_CHUNKSIZE = 10000
+
+# Quality flag columns, marked with '+' when set
+MAXQUANT_FLAGS = [
+    'Reverse',
+    'Potential contaminant',
+    'Contaminant',
+    'Only identified by site',
+]
+
+# Quantification column prefixes; the bare name is the summed column, e.g. 'Intensity'.
+# Ratio columns are not read by any tool, so are skipped with the other unused columns
+MAXQUANT_QUANTIFICATION = [
+    'Intensity',
+    'LFQ intensity',
+    'iBAQ',
+    'Reporter intensity',
+]
+
+# Annotation columns used downstream for indexing, labelling and plots
+MAXQUANT_ANNOTATION = [
+    'id',
+    'Proteins',
+    'Protein IDs',
+    'Protein names',
+    'Gene names',
+    'Positions within proteins',
+    'Amino acid',
+    'Multiplicity',
+    'Localization prob',
+]
+
+# Numeric columns outside of the quantification blocks
+MAXQUANT_NUMERIC = [
+    'Localization prob',
+]
+
+# Data files processed from a folder of MaxQuant output (see `expand_filenames`)
+MAXQUANT_TABLES = [
+    'proteinGroups.txt',
+    '*Sites.txt',
+]
+
+
+def is_quantification_column(c):
+    for q in MAXQUANT_QUANTIFICATION:
+        if c == q or c.startswith('%s ' % q):
+            return True
+    return False
+
+
+def read_header(fn):
+    '''
+    Read the column names from the first line of a MaxQuant table, without parsing any data.
+
+    :param fn: MaxQuant tab-separated output file
+    :return: list of column names
+    '''
+    with open(fn, 'r') as f:
+        line = f.readline()
+
+    return line.rstrip('\r\n').split('\t')
+
+
+def maxquant_columns(header):
+    '''
+    Select the subset of columns from a MaxQuant header that are used by the processing tools:
+    annotations, quality flags and quantification values. Everything else (scores, sequence
+    windows, evidence IDs, per-experiment counts, etc.) is skipped at parse time.
+
+    :param header: list of column names, as returned by `read_header`
+    :return: list of column names, in file order
+    '''
+    keep = set(MAXQUANT_ANNOTATION + MAXQUANT_FLAGS)
+    return [c for c in header if c in keep or is_quantification_column(c)]
+
+
+def find_maxquant_tables(directory):
+    '''
+    Find the MaxQuant tables (see `MAXQUANT_TABLES`) in `directory` and its subfolders,
+    e.g. the combined/txt folders of several searches.
+
+    :return: sorted list of file names
+    '''
+    import fnmatch
+
+    found = []
+    for root, dirs, files in os.walk(directory):
+        for fn in files:
+            if any(fnmatch.fnmatchcase(fn, p) for p in MAXQUANT_TABLES):
+                found.append(os.path.join(root, fn))
+    return sorted(found)
+
+
+def expand_filenames(patterns):
+    '''
+    Expand glob patterns (Windows shells don't) and folders (see `find_maxquant_tables`)
+    in a list of file names, keeping the given order and dropping duplicates, including
+    the same file given by different paths.
+
+    :param patterns: list of file names, glob patterns and folders
+    :return: list of file names
+    '''
+    import glob
+
+    filenames = []
+    seen = set()
+    for p in patterns:
+        matches = sorted(glob.glob(p)) if any(c in p for c in '*?[') else [p]
+
+        expanded = []
+        for fn in matches:
+            expanded.extend(find_maxquant_tables(fn) if os.path.isdir(fn) else [fn])
+        if not expanded:
+            logging.warning('No files match %s' % p)
+
+        for fn in expanded:
+            key = os.path.normcase(os.path.abspath(fn))
+            if key not in seen:
+                seen.add(key)
+                filenames.append(fn)
+
+    return filenames
+
+
+def maxquant_dtypes(columns, float32=False):
+    '''
+    Build an explicit dtype map for the selected columns, so the parser does not have to
+    infer types (and fall back to object) chunk by chunk.
+
+    Quantification values may be parsed straight to float32, so no float64 copy of the
+    table is built; other numeric columns are compared against thresholds, so stay
+    float64 (see `process.compact_dtypes`).
+
+    :param columns: list of column names
+    :param float32: parse quantification columns as float32
+    :return: dict of column name to dtype
+    '''
+    import pandas as pd
+
+    # Fixed categories so chunks concatenate without falling back to object
+    flag = pd.api.types.CategoricalDtype(['+'])
+
+    dtype = {}
+    for c in columns:
+        if c in MAXQUANT_FLAGS:
+            dtype[c] = flag
+        elif is_quantification_column(c):
+            dtype[c] = 'float32' if float32 else 'float64'
+        elif c in MAXQUANT_NUMERIC:
+            dtype[c] = 'float64'
+
+    return dtype
+
+
+def read_maxquant(fn, columns=None, chunksize=DEFAULT_CHUNKSIZE, progress_callback=None, float32=False):
+    '''
+    Stream a MaxQuant table from disk in chunks, parsing only the selected columns.
+
+    The header is read first and the column list built with `maxquant_columns` unless
+    given explicitly. Progress is reported as the fraction of the file consumed.
+
+    :param fn: MaxQuant tab-separated output file (proteinGroups.txt, Phospho (STY)Sites.txt, ...)
+    :param columns: list of columns to parse, or None to use the default selection
+    :param chunksize: number of rows to parse per chunk
+    :param progress_callback: called with a float 0-1 after each chunk
+    :param float32: parse quantification columns as float32 (see `maxquant_dtypes`)
+    :return: pandas DataFrame, indexed by `id` where available
+    '''
+    import pandas as pd
+
+    if columns is None:
+        columns = maxquant_columns(read_header(fn))
+
+    index_col = 'id' if 'id' in columns else None
+    dtype = maxquant_dtypes(columns, float32)
+
+    size = float(os.path.getsize(fn)) or 1.0
+
+    chunks = []
+    with open(fn, 'rb') as f:
+        reader = pd.read_csv(f, sep='\t', header=0, usecols=columns, dtype=dtype,
+                             index_col=index_col, chunksize=chunksize)
+        for chunk in reader:
+            chunks.append(chunk)
+            if progress_callback:
+                progress_callback(min(f.tell() / size, 1.0))
+
+    if not chunks:
+        return pd.DataFrame(columns=[c for c in columns if c != index_col])
+
+    # usecols keeps file order, so chunks line up without reindexing
+    df = pd.concat(chunks, axis=0) if len(chunks) > 1 else chunks[0]
+
+    logging.info('Read %d rows x %d columns from %s' % (df.shape[0], df.shape[1], fn))
+    return df
+
+
+def sniff_maxquant(fn):
+    '''
+    Classify a MaxQuant table from its header alone, without parsing any data.
+
+    Returns a dict with:
+
+    kind
+        `str` one of 'sites' (modification site tables, with ___N multiplicity columns),
+        'proteins', 'peptides' or 'unknown'
+
+    quantification
+        `list` of quantification types with per-sample columns, e.g. ['Intensity', 'LFQ intensity']
+
+    samples
+        `list` of sample names, taken from the first quantification type with per-sample columns
+
+    multiplicities
+        `list` of multiplicity suffixes, e.g. ['___1', '___2', '___3']
+
+    :param fn: MaxQuant tab-separated output file
+    :return: dict
+    '''
+    import re
+
+    header = read_header(fn)
+    multiplicity_re = re.compile(r'(___\d+)$')
+
+    multiplicities = []
+    for c in header:
+        m = multiplicity_re.search(c)
+        if m and m.group(1) not in multiplicities:
+            multiplicities.append(m.group(1))
+    multiplicities.sort(key=lambda m: int(m[3:]))
+
+    quantification = []
+    samples = []
+    for q in MAXQUANT_QUANTIFICATION:
+        prefix = '%s ' % q
+        names = [multiplicity_re.sub('', c[len(prefix):]) for c in header if c.startswith(prefix)]
+        if not names:
+            continue
+
+        quantification.append(q)
+        if not samples:
+            for n in names:
+                if n not in samples:
+                    samples.append(n)
+
+    if multiplicities:
+        kind = 'sites'
+    elif 'Protein IDs' in header or 'Majority protein IDs' in header:
+        kind = 'proteins'
+    elif 'Sequence' in header:
+        kind = 'peptides'
+    else:
+        kind = 'unknown'
+
+    return {
+        'kind': kind,
+        'quantification': quantification,
+        'samples': samples,
+        'multiplicities': multiplicities,
+    }
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import os
+import uuid
+import atexit
+import shutil
+import logging
+import tempfile
+import weakref
+logging.debug('Loading memory.py')
+
+from . import utils
+from . import cache
+
+
+def _column_arrays(df):
+    # Underlying arrays of each column; categoricals are represented by their codes
+    import pandas as pd
+
+    for c in range(df.shape[1]):
+        s = df.iloc[:, c]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            # Not s.cat.codes, which is a copy with copy-on-write
+            yield s.array.codes
+        else:
+            yield s.values
+
+
+def _root(a):
+    # The array that owns the memory a (possibly nested) view refers to
+    import numpy as np
+
+    while isinstance(getattr(a, 'base', None), np.ndarray):
+        a = a.base
+    return a
+
+
+def is_frame(value):
+    # Tool data also holds indexes over a table's columns (e.g. process.GroupIndex)
+    import pandas as pd
+    return isinstance(value, pd.DataFrame)
+
+
+def frames(data):
+    '''
+    Return the DataFrames held in a tool data dict.
+    '''
+    if not data:
+        return []
+    return [v for v in data.values() if is_frame(v)]
+
+
+def shared_nbytes(df, others):
+    '''
+    Return a tuple of (total bytes, bytes shared with any of `others`) for the column data
+    of DataFrame `df`, as `memory_usage(deep=True)` counts them. Columns are shared when
+    they are views onto the same memory as a column of another frame, e.g. passed through
+    without copying.
+    '''
+    import numpy as np
+
+    # Hold references to the roots so ids are not re-used while comparing
+    roots = {}
+    for o in others:
+        for a in _column_arrays(o):
+            if isinstance(a, np.ndarray):
+                r = _root(a)
+                roots[id(r)] = r
+
+    total = 0
+    shared = 0
+    sizes = df.memory_usage(index=False, deep=True).values
+    for a, nbytes in zip(_column_arrays(df), sizes):
+        nbytes = int(nbytes)
+        total += nbytes
+        if isinstance(a, np.ndarray) and id(_root(a)) in roots:
+            shared += nbytes
+
+    return total, shared
+
+
+def report(name, inputs, outputs):
+    '''
+    Log the size of a tool's output data, and how much of it is shared with its inputs
+    rather than copied.
+
+    :param name: tool name for the log message
+    :param inputs: tool input data dict (or None)
+    :param outputs: tool output data dict (or None)
+    :return: tuple of (total bytes, shared bytes)
+    '''
+    total = 0
+    shared = 0
+    seen = set()
+    for df in frames(outputs):
+        # Outputs may hold the same table under several names
+        if id(df) in seen:
+            continue
+        seen.add(id(df))
+        t, s = shared_nbytes(df, frames(inputs))
+        total += t
+        shared += s
+
+    if total:
+        logging.info('%s: output %.1f MB, %.1f MB shared with input, %.1f MB new' % (
+            name, total / 1024. ** 2, shared / 1024. ** 2, (total - shared) / 1024. ** 2))
+
+    return total, shared
+
+
+def nbytes(df):
+    return int(df.memory_usage(index=True).sum())
+
+
+class SpilledFrame(object):
+    '''
+    Placeholder for a DataFrame spilled to disk by a `SpillStore`. The file is removed
+    once the placeholder is no longer referenced.
+    '''
+
+    def __init__(self, path, nbytes):
+        self.path = path
+        self.nbytes = nbytes
+        self._frame = None
+
+    def load(self):
+        '''
+        Read the DataFrame back (memory-mapped where supported). Placeholders shared by
+        several tools return the same DataFrame while it is in memory.
+        '''
+        df = self._frame() if self._frame else None
+        if df is None:
+            df = cache.read_frame(self.path)
+            self._frame = weakref.ref(df)
+        return df
+
+    def __reduce__(self):
+        # Pickled (e.g. into the result cache) as the table itself
+        return _frame, (self.load(),)
+
+    def __del__(self):
+        try:
+            os.remove(self.path)
+        except (OSError, TypeError):  # TypeError: os already torn down at exit
+            pass
+
+
+def _frame(df):
+    return df
+
+
+def resolve(value):
+    # The DataFrame for a value that may be a spilled placeholder
+    return value.load() if isinstance(value, SpilledFrame) else value
+
+
+class SpillStore(object):
+    '''
+    Folder of spilled DataFrames, in the binary format used by the data cache. A
+    temporary folder is created (and removed at exit) if none is given.
+    '''
+
+    def __init__(self, directory=None):
+        if not directory:
+            directory = tempfile.mkdtemp(prefix='paddle-spill-')
+            atexit.register(shutil.rmtree, directory, True)
+
+        self.directory = directory
+        utils.mkdir_p(directory)
+
+    def spill(self, df):
+        '''
+        Write `df` to disk, returning a `SpilledFrame` placeholder or None on failure.
+        '''
+        path = os.path.join(self.directory, uuid.uuid4().hex + cache.frame_extension())
+        try:
+            cache.write_frame(df, path)
+        except Exception:
+            logging.exception('Failed to spill table to %s' % path)
+            return None
+        return SpilledFrame(path, nbytes(df))
+
+
+def _slots(result):
+    # (container, key) of each place in a tool result that may hold a DataFrame: the
+    # data dict and the arguments of an unrendered figure spec
+    from . import plots
+
+    data = result.get('data') if result else None
+    if data:
+        for k in data:
+            yield data, k
+
+    spec = result.get('fig') if result else None
+    if isinstance(spec, plots.LazyFigure):
+        if any(isinstance(a, SpilledFrame) or is_frame(a) for a in spec.args):
+            spec.args = list(spec.args)
+            for n in range(len(spec.args)):
+                yield spec.args, n
+        for k in spec.kwargs:
+            yield spec.kwargs, k
+
+
+def restore(result):
+    '''
+    Load any spilled DataFrames in a tool result back into memory, in place.
+    '''
+    for container, k in _slots(result):
+        if isinstance(container[k], SpilledFrame):
+            container[k] = container[k].load()
+
+
+def usage(result):
+    '''
+    Return a tuple of (bytes in memory, bytes spilled to disk) for the DataFrames
+    held in a tool result.
+    '''
+    seen = set()
+    in_memory = 0
+    spilled = 0
+    for container, k in _slots(result):
+        v = container[k]
+        if id(v) in seen:
+            continue
+        seen.add(id(v))
+
+        if isinstance(v, SpilledFrame):
+            spilled += v.nbytes
+        elif is_frame(v):
+            in_memory += nbytes(v)
+
+    return in_memory, spilled
+
+
+class MemoryBudget(object):
+    '''
+    Keep the DataFrames held in tool results, and in the in-memory tier of the result
+    cache, within `max_size` bytes. Tables are often shared between tools and cached
+    results (passed through without copying), so each table is counted once.
+
+    When over budget, cached results whose tables no tool holds are evicted from memory
+    first, least-recently used first: nothing needs writing, and they are reloaded from
+    the cache's disk tier, if any. Then the least-recently used tables held by tools
+    are spilled to disk, from every result holding them at once; tables held by a
+    protected result are kept in memory.
+
+    :param max_size: maximum bytes of tables held in memory
+    :param store: `SpillStore` to spill to; a temporary one by default
+    '''
+
+    def __init__(self, max_size, store=None):
+        self.max_size = max_size
+        self.store = store or SpillStore()
+
+    def enforce(self, results, results_cache=None):
+        '''
+        Evict cached results and spill tables until within budget.
+
+        :param results: list of (result dict, last used time, protected) for each tool
+        :param results_cache: `cache.ResultCache` whose in-memory results count towards
+                              the budget, or None
+        :return: bytes spilled
+        '''
+        tables = {}  # id: [df, nbytes, last used, protected, [(container, key), ...], held by a tool, {cache key, ...}]
+
+        def add(result, used, protected, key=None):
+            for container, k in _slots(result):
+                v = container[k]
+                if not is_frame(v):
+                    continue
+                if id(v) not in tables:
+                    tables[id(v)] = [v, nbytes(v), used, protected, [], False, set()]
+
+                t = tables[id(v)]
+                t[2] = max(t[2], used)
+                t[3] = t[3] or protected
+                t[4].append((container, k))
+                if key is None:
+                    t[5] = True
+                else:
+                    t[6].add(key)
+
+        for result, used, protected in results:
+            add(result, used, protected)
+        if results_cache is not None:
+            for key, result, used in results_cache.entries():
+                add(result, used, False, key)
+
+        total = sum(t[1] for t in tables.values())
+        if total <= self.max_size:
+            return 0
+
+        # Tables only held by cached results are freed by evicting those results
+        cached = sorted([t for t in tables.values() if not t[5]], key=lambda t: t[2])
+        evicted = set()
+        for t in cached:
+            if total <= self.max_size:
+                break
+            if t[6] <= evicted:
+                continue
+
+            for key in t[6] - evicted:
+                results_cache.discard(key)
+            evicted |= t[6]
+
+            for u in cached:
+                if u[6] and u[6] <= evicted:
+                    total -= u[1]
+                    u[6] = set()
+
+        if evicted:
+            logging.info('Evicted %d cached results from memory' % len(evicted))
+
+        spilled = 0
+        for df, size, used, protected, slots, held, keys in sorted(tables.values(), key=lambda t: t[2]):
+            if total <= self.max_size:
+                break
+            if protected or not held:
+                continue
+
+            placeholder = self.store.spill(df)
+            if placeholder is None:
+                continue
+
+            for container, k in slots:
+                container[k] = placeholder
+            total -= size
+            spilled += size
+
+        logging.info('Spilled %.1f MB of tool data to disk; %.1f MB in memory' % (
+            spilled / 1024. ** 2, total / 1024. ** 2))
+        return spilled
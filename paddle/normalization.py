@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import os
+import logging
+logging.debug('Loading normalization.py')
+
+from collections import OrderedDict
+
+from . import process
+
+# Columns (samples) and rows per block for the blocked kernels; blocks are the unit of
+# work shared out to threads
+BLOCK_COLUMNS = 32
+BLOCK_ROWS = 4096
+
+# Threads for the blocked kernels; None for automatic, see `get_threads`
+threads = None
+
+
+class Method(object):
+    '''
+    A normalization (or imputation, see impute.py) method: `fn(values, threads=None,
+    **options)` processes a block of quantification values (rows, samples) in place.
+    Normalization methods that transform raw intensities themselves (`transforms`)
+    replace the log2 transformation.
+
+    :param name: key stored in tool configs
+    :param label: name shown in the user interface
+    :param fn: kernel function
+    :param transforms: method expects untransformed intensities
+    '''
+
+    def __init__(self, name, label, fn, transforms=False):
+        self.name = name
+        self.label = label
+        self.fn = fn
+        self.transforms = transforms
+
+
+# Available methods, in the order offered; see `register`
+METHODS = OrderedDict()
+
+
+def register(name, label, transforms=False):
+    '''
+    Decorator adding a kernel function to `METHODS`.
+    '''
+    def decorator(fn):
+        METHODS[name] = Method(name, label, fn, transforms)
+        return fn
+    return decorator
+
+
+def configure(n=None):
+    '''
+    Set the number of threads for the blocked kernels (0 or None for automatic).
+    '''
+    global threads
+    threads = n or None
+
+
+def get_threads(n=None):
+    '''
+    Resolve a thread count: `n`, or the configured `threads`, or automatically the
+    OMP_NUM_THREADS environment variable (as set for numerical libraries, e.g. by the
+    batch runner when processing files in parallel) falling back to the number of cores.
+    '''
+    n = n or threads
+    if not n:
+        n = int(os.environ.get('OMP_NUM_THREADS') or 0) or os.cpu_count() or 1
+    return n
+
+
+def normalize(values, method, threads=None, **options):
+    '''
+    Normalize a block of values (rows, samples) in place with the named method.
+
+    :param values: float numpy array, ideally column-major (see `process.value_block`)
+    :param method: key of `METHODS`
+    :param threads: threads to share column or row blocks across; see `get_threads`
+    :param options: method options, e.g. `log` (values are log-transformed) or
+                    `reference` (position of the reference sample)
+    :return: values
+    '''
+    METHODS[method].fn(values, threads=threads, **options)
+    return values
+
+
+def slices(size, step):
+    return [slice(i, min(i + step, size)) for i in range(0, size, step)]
+
+
+def map_blocks(fn, blocks, threads=None):
+    '''
+    Call `fn` on each of `blocks` (e.g. column slices), on a pool of threads if more
+    than one. NumPy releases the GIL in the sorting and arithmetic the kernels spend
+    their time in, so blocks run in parallel. Blocks must not overlap when written.
+
+    :return: list of results, in order
+    '''
+    threads = min(get_threads(threads), len(blocks))
+    if threads > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(threads) as pool:
+            return list(pool.map(fn, blocks))
+    return [fn(b) for b in blocks]
+
+
+def column_quantiles(values, q):
+    '''
+    Return the `q` quantile (0-1) of the non-NaN values of each column, by partitioning.
+    '''
+    import numpy as np
+
+    quantiles = np.full(values.shape[1], np.nan)
+    for j, c in enumerate(values.T):
+        v = c[~np.isnan(c)]
+        if v.size:
+            k = int(q * (v.size - 1))
+            quantiles[j] = np.partition(v, k)[k]
+    return quantiles
+
+
+@register('subtract_column_median', 'Subtract column median')
+def subtract_column_median(values, threads=None, **options):
+    '''
+    Center each sample on its median.
+    '''
+    def center(s):
+        process.subtract_column_median(values[:, s])
+
+    map_blocks(center, slices(values.shape[1], BLOCK_COLUMNS), threads)
+
+
+@register('quantile', 'Quantile')
+def quantile(values, threads=None, **options):
+    '''
+    Give every sample the same distribution: the mean of the samples' quantile
+    functions. Missing values are allowed: each sample's valid values are mapped by
+    their quantile (rank over number of valid values) onto the shared distribution,
+    which is sampled on a grid as fine as the most complete sample. With no missing
+    values this is classic quantile normalization.
+    '''
+    import numpy as np
+
+    column_blocks = slices(values.shape[1], BLOCK_COLUMNS)
+
+    counts = np.concatenate(map_blocks(lambda s: np.count_nonzero(~np.isnan(values[:, s]), axis=0), column_blocks, threads))
+    if not counts.any():
+        return
+
+    grid = (np.arange(counts.max()) + 0.5) / counts.max()
+
+    def accumulate(s):
+        total = np.zeros(len(grid))
+        for c in values[:, s].T:
+            v = np.sort(c[~np.isnan(c)])
+            if v.size:
+                total += np.interp(grid, (np.arange(v.size) + 0.5) / v.size, v)
+        return total
+
+    target = np.sum(map_blocks(accumulate, column_blocks, threads), axis=0) / np.count_nonzero(counts)
+
+    def assign(s):
+        for c in values[:, s].T:
+            valid = np.flatnonzero(~np.isnan(c))
+            if valid.size:
+                # Interpolated in rank order (much faster than in table order) and scattered back
+                order = valid[np.argsort(c[valid])]
+                c[order] = np.interp((np.arange(valid.size) + 0.5) / valid.size, grid, target)
+
+    map_blocks(assign, column_blocks, threads)
+
+
+@register('median_polish', 'Median polish')
+def median_polish(values, threads=None, iterations=10, tolerance=1e-3, **options):
+    '''
+    Fit row (protein or site) and column (sample) effects by Tukey's median polish,
+    alternating row and column sweeps of the residual medians, and remove the sample
+    effects. Unlike median centering, the sample effects are estimated from each row's
+    deviation from its own level, so are robust to samples missing different rows.
+    The effects are centered on their median, keeping the overall level of the data.
+    Residuals are formed a block at a time, so no copy of the whole table is made.
+    '''
+    import numpy as np
+
+    rows, columns = values.shape
+    row_effects = np.zeros(rows, dtype=values.dtype)
+    column_effects = np.zeros(columns, dtype=values.dtype)
+
+    def row_sweep(s):
+        d = process.nanmedian(values[s, :] - row_effects[s, None] - column_effects, axis=1)
+        d[np.isnan(d)] = 0
+        row_effects[s] += d
+        return np.abs(d).max(initial=0)
+
+    def column_sweep(s):
+        d = process.nanmedian(values[:, s] - row_effects[:, None] - column_effects[s], axis=0)
+        d[np.isnan(d)] = 0
+        column_effects[s] += d
+        return np.abs(d).max(initial=0)
+
+    for n in range(iterations):
+        change = max(map_blocks(row_sweep, slices(rows, BLOCK_ROWS), threads) +
+                     map_blocks(column_sweep, slices(columns, BLOCK_COLUMNS), threads))
+        if change < tolerance:
+            break
+
+    logging.debug('Median polish: %d iterations' % (n + 1))
+
+    column_effects -= np.median(column_effects)
+
+    def remove(s):
+        values[:, s] -= column_effects[s]
+
+    map_blocks(remove, slices(columns, BLOCK_COLUMNS), threads)
+
+
+@register('arcsinh', 'Variance stabilizing (arcsinh)', transforms=True)
+def arcsinh(values, threads=None, **options):
+    '''
+    Variance stabilizing transformation of raw intensities, in place of the log2
+    transformation. Samples are scaled to a common median, then transformed as
+    arcsinh(x / 2c) / ln 2: this is log2(x / c) for intensities well above c, but
+    linear (rather than diverging) towards zero, where log-transformed noise dominates.
+    c is the median of the samples' lower deciles. Zero intensities are missing values.
+    '''
+    import numpy as np
+
+    column_blocks = slices(values.shape[1], BLOCK_COLUMNS)
+
+    def medians(s):
+        block = values[:, s]
+        block[block <= 0] = np.nan
+        return process.column_medians(block), column_quantiles(block, 0.1)
+
+    results = map_blocks(medians, column_blocks, threads)
+    medians = np.concatenate([m for m, _ in results]).astype(np.float64)
+    deciles = np.concatenate([d for _, d in results])
+    if np.isnan(medians).all():
+        return
+
+    scale = np.nanmedian(medians) / medians
+    scale[~np.isfinite(scale)] = 1
+    cofactor = np.nanmedian(deciles * scale) or 1.0
+
+    def transform(s):
+        block = values[:, s]
+        block *= (scale[s] / (2 * cofactor)).astype(values.dtype)
+        np.arcsinh(block, out=block)
+        block /= np.log(2)
+
+    map_blocks(transform, column_blocks, threads)
+
+
+@register('reference', 'Reference sample scaling')
+def reference(values, threads=None, reference=0, log=True, **options):
+    '''
+    Scale each sample to a reference sample by the median difference (of log values;
+    ratio of untransformed values) over the rows quantified in both.
+
+    :param reference: position of the reference sample
+    :param log: values are log-transformed
+    '''
+    import numpy as np
+
+    ref = values[:, reference].copy()
+
+    def scale(s):
+        block = values[:, s]
+        if log:
+            offsets = process.column_medians(block - ref[:, None])
+            offsets[np.isnan(offsets)] = 0
+            block -= offsets
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratios = block / ref[:, None]
+            ratios[~np.isfinite(ratios)] = np.nan
+            ratios = process.column_medians(ratios)
+            ratios[~(np.isfinite(ratios) & (ratios > 0))] = 1
+            block /= ratios
+
+    map_blocks(scale, slices(values.shape[1], BLOCK_COLUMNS), threads)
@@ -34,6 +34,13 @@ import requests
 from .globals import settings, config
 
 from . import ui
+from . import cache
+from . import workflow
+from . import pool
+from . import plots
+from . import instrument
+from . import memory
+from . import normalization
 
 
 # Translation (@default context)
@@ -45,7 +52,7 @@ __version__ = 0.1
 from . import tools
 from .tools import ( import_data, localization, amino_acids, rank_intensity,
                      quantification, enrichment, design,
-                     filter, correlation
+                     filter, imputation, correlation
                      # correlation, export_data
                     )
 
@@ -74,6 +81,7 @@ class MainWindow(QMainWindow):
         #  UI setup etc
         self.menuBars = {
             'file': self.menuBar().addMenu(tr('&File')),
+            'view': self.menuBar().addMenu(tr('&View')),
             #'help': self.menuBar().addMenu(tr('&Help')),
         }
 
@@ -131,6 +139,11 @@ class MainWindow(QMainWindow):
 
         self.addToolBar(self.t)
 
+        export_profileAction = QAction(tr('Export run profile…'), self)
+        export_profileAction.setStatusTip('Export tool run timings and memory use')
+        export_profileAction.triggered.connect(self.onExportProfile)
+        self.menuBars['file'].addAction(export_profileAction)
+
 
         self.menuBars['file'].addSeparator()
 
@@ -166,6 +179,7 @@ class MainWindow(QMainWindow):
         self.toolPanel.setMaximumWidth(250)
 
         self.current_tool = None
+        self.dataset = None  # Header summary of the loaded data file; see io.sniff_maxquant
 
 
 
@@ -183,6 +197,8 @@ class MainWindow(QMainWindow):
             tools.design.Design(self),
             # Filter by valid values
             tools.filter.Filter(self),
+            # Impute missing values
+            tools.imputation.Imputation(self),
             # Correlation plot
             tools.correlation.Correlation(self),
             # Export processed data
@@ -194,50 +210,44 @@ class MainWindow(QMainWindow):
         ]
 
         # Workflow logic
-        # On completion of execution for any tool, clear all subsequent tools data
-        # empty outputs and clear figures (hacky); execute next tool
+        # Tools declare the tools they take data from (see workflow.py). On completion of
+        # any tool, start each dependent tool whose inputs are all complete; independent
+        # branches run concurrently on the thread pool
         def on_tool_complete(tn):
-
-            # On completion of load of data, design or msp file generate
-            # a activation-deactivation mask for tools that are affected
-            # then apply this mask
-            if tn == 0:
-                import_data = self.tools[0]
-                if 'data' in import_data.data and 'df' in import_data.data['data']:
-
-                    df = import_data.data['data']['df']
-                    is_mod_data = any('___' in c for c in df.columns)
-
-                    if is_mod_data:
-                        enable = [True, True,  True,  True, True, True, True, True, None]
-                    else:
-                        enable = [True, False, False, True, True, True, True, True, None]
-
-                    for n, s in enumerate(enable):
-                        if s is True:
-                            self.tools[n].enable()
-                        elif s is False:
-                            self.tools[n].disable()
+            self.enforce_memory_budget(keep=[self.tools[tn]])
 
             if tn == -1:
                 enrichment = self.tools[-1]
                 enrichment.enable()
 
-            # Get next active tool, and execute
-            t = self.tools[tn].get_next_tool()
-            if t is not None:
-                t.run_manual()
+            for t in workflow.dependents(self.tools[tn], self.tools, tools.base.ToolBase.is_active):
+                inputs = workflow.resolve_inputs(t, self.tools, tools.base.ToolBase.is_active)
+                if all(i.current_status == 'complete' for i in inputs):
+                    t.run_manual()
 
         def on_tool_status(s, tn):
             if s == 'active':
-                # Starting up, clear all subsequent tools
-                for n in range(tn+1, len(self.tools)):
-                    self.tools[n].setup()
-
+                # Starting up, mark all tools that depend on this one out of date; they keep
+                # their results until re-run, and those whose inputs come out unchanged
+                # complete without running (see ToolBase.run)
+                for t in workflow.downstream(self.tools[tn], self.tools, tools.base.ToolBase.is_active):
+                    t.invalidate()
+
+
+        # Run profiles; floating so as not to squeeze the fixed-size figure area
+        self.profilePanel = ui.ProfilePanel(self)
+        self.profileDock = QDockWidget(tr('Run profile'), self)
+        self.profileDock.setWidget(self.profilePanel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.profileDock)
+        self.profileDock.setFloating(True)
+        self.profileDock.resize(QSize(900, 300))
+        self.profileDock.hide()
+        self.menuBars['view'].addAction(self.profileDock.toggleViewAction())
 
         for n in range(len(self.tools)):
             self.tools[n].status.connect(lambda s, n=n: on_tool_status(s, n))
             self.tools[n].complete.connect(lambda n=n: on_tool_complete(n))
+            self.tools[n].profiled.connect(self.profilePanel.addRecord)
 
 
         self.viewStack = QStackedWidget()
@@ -312,7 +322,74 @@ class MainWindow(QMainWindow):
         self.threadpool = QThreadPool()
         logging.info("Multithreading with maximum %d threads" % self.threadpool.maxThreadCount())
 
+        if settings.get('cache/enabled'):
+            cache.configure(settings.get('cache/directory'), settings.get('cache/max_size') * 1024 ** 2)
+            logging.info("Caching parsed data in %s" % settings.get('cache/directory'))
+
+        cache.configure_results(
+            settings.get('cache/results_max_size') * 1024 ** 2,
+            settings.get('cache/results_directory') if settings.get('cache/results_on_disk') else None,
+            settings.get('cache/results_max_disk_size') * 1024 ** 2,
+        )
 
+        instrument.configure(settings.get('instrument/trace_memory'))
+        normalization.configure(settings.get('normalization/threads'))
+
+        self.memory_budget = None
+        if settings.get('memory/budget'):
+            self.memory_budget = memory.MemoryBudget(
+                settings.get('memory/budget') * 1024 ** 2,
+                memory.SpillStore(settings.get('memory/spill_directory')),
+            )
+            logging.info("Tool data memory budget %d MB" % settings.get('memory/budget'))
+
+        if settings.get('processes/enabled'):
+            cache_args = None
+            if cache.get_cache():
+                cache_args = (cache.get_cache().directory, cache.get_cache().max_size)
+            pool.configure(settings.get('processes/max_workers'), cache_args)
+            logging.info("Running tools in a process pool")
+
+
+
+    def set_dataset(self, dataset):
+        '''
+        Apply the header summary of a newly selected data file: enable/disable tools
+        according to the kind of data and update the available configuration choices.
+        This runs before the file is parsed.
+        '''
+        self.dataset = dataset
+
+        # Enable the tools that apply to this kind of data. Tools needing further input
+        # (e.g. a modificationSpecificPeptides file) are enabled once it is loaded
+        for t in self.tools:
+            if t.applies_to(dataset, t.config.as_dict()):
+                t.enable()
+            elif t.kinds is not None and dataset['kind'] not in t.kinds:
+                t.disable()
+            t.set_dataset(dataset)
+
+    def enforce_memory_budget(self, keep=()):
+        '''
+        Spill the least-recently used tool data to disk, and evict cached results from
+        memory, to stay within the memory budget. Data of the tool on view, running
+        tools and their inputs, and tools in `keep` stays in memory.
+        '''
+        if self.memory_budget is None:
+            return
+
+        protected = set(keep)
+        protected.add(self.current_tool)
+        for t in self.tools:
+            if t._worker_thread_lock_:
+                protected.add(t)
+                protected.update(t.get_input_tools())
+
+        self.memory_budget.enforce([(t._data_, t.data_used, t in protected) for t in self.tools],
+                                   cache.get_results())
+
+        for t in self.tools:
+            t.update_memory_usage()
 
     # FIXME: fugly wrapper to allow set tool on change
     def update_current_tool_from_item(self, item):
@@ -344,11 +421,11 @@ class MainWindow(QMainWindow):
     def onSaveData(self):
         filename, _ = QFileDialog.getSaveFileName(self, 'Save processed data', '', "Pickle Files (*.pickle);;CSV Files (*.csv);;All Files (*.*);;")
         if filename:
-            print(filename, _)
-            # Get data from the tool 6 (filter) output
-            td = self.tools[6].data
-            print(td.keys())
-            if 'data' in td and 'df' in td['data']:
+            # The processed data is the output of the last processing step, imputation;
+            # or of the tool before it in the chain, if it is not active
+            tool = workflow.resolve('imputation', self.tools, tools.base.ToolBase.is_active)
+            td = tool.data if tool else {}
+            if td.get('data') and td['data'].get('df') is not None:
                 df = td['data']['df']
                 ext = os.path.splitext(filename)[1]
                 save_fn = {
@@ -360,6 +437,12 @@ class MainWindow(QMainWindow):
 
 
 
+    def onExportProfile(self):
+        filename, filter = QFileDialog.getSaveFileName(self, 'Export run profile', '', "Chrome Trace (*.json);;JSON (*.json)")
+        if filename:
+            # Chrome trace format opens in chrome://tracing or Perfetto; JSON is the raw profiles
+            instrument.export(filename, instrument.records, trace=filter.startswith('Chrome'))
+
     def onSaveConfig(self):
         filename, _ = QFileDialog.getSaveFileName(self, 'Save configuration', '', "Paddle Config File (*.paddle)")
         if filename:
@@ -426,11 +509,10 @@ class MainWindow(QMainWindow):
                                                                                    "Scalable Vector Graphics (*.svg)")
 
         if filename:
-            try:
-                self.current_tool.data['fig'].savefig(filename, bbox_inches='tight')
-
-            except KeyError:
-                pass
+            # Figures are rendered on demand; tools not yet viewed may not have drawn theirs
+            fig = plots.render(self.current_tool.data.get('fig'))
+            if fig is not None:
+                fig.savefig(filename, bbox_inches='tight')
 
     def onSaveAllImage(self):
         filename, _ = QFileDialog.getSaveFileName(self, 'Save all figures', '', "Tagged Image File Format (*.tif);;"
@@ -445,11 +527,9 @@ class MainWindow(QMainWindow):
                 if tool.status != 'inactive' and tool.data is not None:
                     filename = "%s_(%s)%s" % (basename, tool.name, ext)
 
-                    try:
-                        tool.data['fig'].savefig(filename, bbox_inches='tight')
-
-                    except KeyError:
-                        pass
+                    fig = plots.render(tool.data.get('fig'))
+                    if fig is not None:
+                        fig.savefig(filename, bbox_inches='tight')
 
 
     def onAnnotateClasses(self):
@@ -534,6 +614,11 @@ def setIcons(app, path, filename):
     app.setWindowIcon(icon)
 
 def main():
+    # Process pool children are spawned; frozen builds must handle that before anything else
+    import multiprocessing
+    multiprocessing.freeze_support()
+
+    utils.enable_copy_on_write()
 
     locale = QLocale.system().name()
 
@@ -568,5 +653,7 @@ def main():
 
     app.exec_()  # Enter Qt application main loop
 
+    pool.shutdown()
+
 
     logging.info('Exiting.')
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading plots.py')
+
+from . import memory
+
+
+class LazyFigure(object):
+    '''
+    Deferred matplotlib figure: a plotting function and its arguments, only called when
+    the figure is needed (the tool is shown, or the figure exported).
+
+    Tool functions return a LazyFigure as their 'fig' so their data is available to
+    downstream tools without waiting for the figure to be drawn. The plotting function
+    may return a figure, an axes, or a sequence starting with an axes (as the
+    `padua.visualize` functions do). It must be importable by name (a module-level
+    function) for the spec to be picklable.
+
+    :param fn: plotting function
+    :param args: positional arguments for `fn`
+    :param progress: pass the progress callback given to `render` on to `fn`, as its
+                     `progress_callback` keyword argument
+    :param kwargs: keyword arguments for `fn`
+    '''
+
+    def __init__(self, fn, *args, progress=False, **kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.progress = progress
+        self._figure = None
+
+    def __getstate__(self):
+        # Rendered figures are not carried across processes or into the result cache
+        state = self.__dict__.copy()
+        state['_figure'] = None
+        return state
+
+    @property
+    def is_rendered(self):
+        return self._figure is not None
+
+    def render(self, progress_callback=None):
+        '''
+        Draw the figure, on first call, and return it.
+        '''
+        if self._figure is None:
+            # Arguments may have been spilled to disk (see memory.MemoryBudget)
+            args = [memory.resolve(a) for a in self.args]
+            kwargs = {k: memory.resolve(v) for k, v in self.kwargs.items()}
+            if self.progress:
+                kwargs['progress_callback'] = progress_callback
+            self._figure = as_figure(self.fn(*args, **kwargs))
+        return self._figure
+
+
+def as_figure(obj):
+    '''
+    Return the figure for a plotting function's return value: a figure, an axes, or a
+    sequence starting with an axes.
+    '''
+    from matplotlib.figure import Figure
+
+    if isinstance(obj, (list, tuple)):
+        obj = obj[0]
+    if isinstance(obj, Figure):
+        return obj
+    return obj.figure
+
+
+def render(fig, progress_callback=None):
+    '''
+    Return a drawn matplotlib figure for a tool result's 'fig', which may be a
+    LazyFigure, a figure or None.
+    '''
+    if isinstance(fig, LazyFigure):
+        return fig.render(progress_callback)
+    return fig
+
+
+def render_result(fig, progress_callback=None):
+    '''
+    Render a tool result's 'fig' (see `render`) on a worker thread, returning a result
+    dict of the spec ('spec') and the drawn figure ('fig').
+    '''
+    return {'spec': fig, 'fig': render(fig, progress_callback)}
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import os
+import sys
+import time
+import pickle
+import logging
+import traceback
+import multiprocessing
+logging.debug('Loading pool.py')
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+# Minimum buffer size moved through shared memory; smaller buffers are pickled in-band
+SHARED_MEMORY_THRESHOLD = 64 * 1024
+
+# Seconds between checks for progress messages and cancellation
+POLL_INTERVAL = 0.1
+
+_pool = None
+_max_workers = None
+_cache_args = None
+
+
+class ProcessCancelled(Exception):
+    pass
+
+
+def _initialize(cache_args):
+    # Child process setup: no display, no Qt application; figures render with Agg
+    os.environ['PADDLE_HEADLESS'] = '1'
+    import matplotlib
+    matplotlib.use('Agg')
+    logging.basicConfig(level=logging.INFO)
+
+    from . import utils
+    utils.enable_copy_on_write()
+
+    # Share the parent's parsed data cache
+    if cache_args:
+        from . import cache
+        cache.configure(*cache_args)
+
+
+def configure(max_workers=None, cache_args=None):
+    '''
+    Set the size of the process pool (0 or None for one process per core) and the
+    arguments for `cache.configure` in each child. Takes effect the next time the pool
+    is started.
+    '''
+    global _max_workers, _cache_args
+    _max_workers = max_workers or None
+    _cache_args = cache_args
+
+
+def worker_count(jobs, tasks):
+    '''
+    Return the number of processes to run `tasks` tasks with: `jobs` (0 or None for one
+    per core), but no more than there are tasks.
+    '''
+    return max(min(jobs or multiprocessing.cpu_count(), tasks), 1)
+
+
+def limit_threads():
+    '''
+    Set numerical libraries in processes started from here to a single thread each,
+    when running several in parallel. Thread counts already set in the environment are
+    kept; see also `normalization.get_threads`.
+    '''
+    for v in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ.setdefault(v, '1')
+
+
+def get_pool():
+    '''
+    Return the shared process pool, starting it on first use. Processes are spawned
+    (not forked) so they don't inherit the GUI's Qt state.
+    '''
+    global _pool
+    if _pool is None:
+        from concurrent.futures import ProcessPoolExecutor
+        _pool = ProcessPoolExecutor(max_workers=_max_workers,
+                                    mp_context=multiprocessing.get_context('spawn'),
+                                    initializer=_initialize,
+                                    initargs=(_cache_args,))
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
+
+
+def pack(obj):
+    '''
+    Pickle `obj` for transfer to another process, moving large buffers (e.g. the numpy
+    arrays behind DataFrames) into shared memory blocks rather than the pickle stream.
+
+    :return: tuple of (pickle payload, list of (block name, size), list of SharedMemory blocks).
+             The caller owns the blocks and must `release` them once the receiver has unpacked.
+    '''
+    if shared_memory is None:
+        return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL), [], []
+
+    buffers = []
+
+    def buffer_callback(b):
+        # Returning True keeps small buffers in-band
+        if b.raw().nbytes < SHARED_MEMORY_THRESHOLD:
+            return True
+        buffers.append(b)
+        return False
+
+    payload = pickle.dumps(obj, protocol=5, buffer_callback=buffer_callback)
+
+    blocks = []
+    specs = []
+    for b in buffers:
+        raw = b.raw()
+        shm = shared_memory.SharedMemory(create=True, size=raw.nbytes)
+        shm.buf[:raw.nbytes] = raw
+        blocks.append(shm)
+        specs.append((shm.name, raw.nbytes))
+
+    return payload, specs, blocks
+
+
+def unpack(payload, specs, unlink=False):
+    '''
+    Rebuild an object packed by `pack`. Buffers are copied out of shared memory so the
+    blocks can be closed straight away; if `unlink` is set the blocks are also destroyed.
+    '''
+    buffers = []
+    for name, size in specs:
+        shm = shared_memory.SharedMemory(name=name)
+        buffers.append(bytearray(shm.buf[:size]))
+        shm.close()
+        if unlink:
+            shm.unlink()
+
+    if buffers:
+        return pickle.loads(payload, buffers=buffers)
+    return pickle.loads(payload)
+
+
+def release(blocks, unlink=True):
+    for shm in blocks:
+        shm.close()
+        if unlink:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _execute(fn, payload, specs, conn, trace_memory=False):
+    '''
+    Child process entry point: unpack the keyword arguments, run `fn` with a progress
+    callback that relays progress (and receives cancellation) over `conn`, and pack the
+    result. The run is profiled here (see instrument.py), as CPU and memory use are
+    only visible from within this process.
+    '''
+    from . import instrument
+
+    kwargs = unpack(payload, specs)
+    recorder = instrument.Recorder(fn.__name__, trace=trace_memory, cpu_clock=time.process_time)
+
+    def progress_callback(progress):
+        while conn.poll():
+            if conn.recv() == 'cancel':
+                raise ProcessCancelled()
+        recorder.checkpoint(progress)
+        conn.send(progress)
+
+    kwargs['progress_callback'] = progress_callback
+
+    recorder.start(inputs=kwargs)
+    try:
+        result = fn(**kwargs)
+    except ProcessCancelled:
+        recorder.stop('cancelled')
+        return 'cancelled', None, None, recorder.as_dict()
+    except Exception:
+        exctype, value = sys.exc_info()[:2]
+        recorder.stop('error', error=repr(value))
+        return 'error', (exctype, value, traceback.format_exc()), None, recorder.as_dict()
+    finally:
+        conn.close()
+
+    recorder.stop('ok', outputs=result.get('data') if result else None)
+
+    # Detach figures from pyplot, so they unpickle as plain figures in the GUI process
+    import matplotlib.pyplot as plt
+    plt.close('all')
+
+    payload, specs, blocks = pack(result)
+    # Close our handles but leave the blocks in place; the receiver unlinks them
+    release(blocks, unlink=False)
+    return 'ok', payload, specs, recorder.as_dict()
+
+
+def run(fn, kwargs, progress_callback=None, is_cancelled=None):
+    '''
+    Run `fn(**kwargs)` in the process pool, blocking until it completes. Call from a
+    worker thread, not the GUI thread.
+
+    `fn` must be importable by name (e.g. a tool's static method) and `kwargs` picklable;
+    a `progress_callback` is provided in the child. Progress reported there is passed to
+    `progress_callback` here; once `is_cancelled()` returns True the child is asked to
+    stop at its next progress checkpoint.
+
+    :return: tuple of (status, value, profile): status and value are ('ok', result),
+             ('error', (exctype, value, traceback)) or ('cancelled', None); profile is the
+             run's `instrument.Recorder` profile dict
+    '''
+    from . import instrument
+
+    ctx = multiprocessing.get_context('spawn')
+    conn, child_conn = ctx.Pipe()
+
+    kwargs = {k: v for k, v in kwargs.items() if k != 'progress_callback'}
+    payload, specs, blocks = pack(kwargs)
+
+    try:
+        # child_conn stays open here until done; it is pickled lazily by the pool
+        future = get_pool().submit(_execute, fn, payload, specs, child_conn, instrument.trace_memory)
+
+        cancel_sent = False
+        while True:
+            done = future.done()
+            # Wait briefly for progress, then drain whatever has arrived
+            if conn.poll(0 if done else POLL_INTERVAL):
+                while conn.poll():
+                    progress = conn.recv()
+                    if progress_callback:
+                        progress_callback(progress)
+
+            if done:
+                break
+
+            if is_cancelled and is_cancelled() and not cancel_sent:
+                conn.send('cancel')
+                cancel_sent = True
+
+        status, value, result_specs, profile = future.result()
+
+    finally:
+        conn.close()
+        child_conn.close()
+        release(blocks)
+
+    if status == 'ok':
+        value = unpack(value, result_specs, unlink=True)
+
+    return status, value, profile
@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading process.py')
+
+from collections import OrderedDict
+
+from . import io
+
+
+def flag_mask(s):
+    '''
+    Return a boolean array of rows set in a MaxQuant flag column, which may be stored
+    as '+'/NaN strings, categorical or bool.
+    '''
+    import numpy as np
+
+    if s.dtype == bool:
+        return s.values
+    return np.asarray(s == '+', dtype=bool)
+
+
+def quality_filter(df, flags):
+    '''
+    Remove rows marked in any of the given flag columns, in a single pass.
+
+    A single boolean mask is built across all flag columns and the table sliced once,
+    rather than filtering (and copying) the full table for each flag in turn. Flag
+    columns not present in the table are ignored.
+
+    Removed row counts are attributed in the order given, so a row flagged as both
+    reverse and contaminant is counted against the first; the counts sum to the total
+    number of rows removed.
+
+    :param df: pandas DataFrame
+    :param flags: list of flag column names, e.g. ['Reverse', 'Potential contaminant']
+    :return: tuple of filtered DataFrame, OrderedDict of flag column to rows removed
+    '''
+    import numpy as np
+
+    remove = np.zeros(df.shape[0], dtype=bool)
+    counts = OrderedDict()
+
+    for c in flags:
+        if c not in df.columns:
+            continue
+        mask = flag_mask(df[c])
+        counts[c] = int(np.count_nonzero(mask & ~remove))
+        remove |= mask
+
+    if remove.any():
+        df = df.iloc[~remove]
+
+    return df, counts
+
+
+def compact_dtypes(df, flags=(), float32=False, category_ratio=0.5):
+    '''
+    Convert a table to a compact dtype layout:
+
+    - flag columns ('+' or empty) to bool
+    - string columns with repeated values to categoricals
+    - float64 quantification columns to float32, if `float32` is set
+
+    Only quantification values are downcast: scores and probabilities are compared
+    against thresholds, and in float32 a value such as 0.7 is stored as slightly less
+    than 0.7, so would fail a `>= 0.7` filter.
+
+    :param df: pandas DataFrame
+    :param flags: list of flag column names
+    :param float32: downcast float64 quantification columns (see `io.is_quantification_column`) to float32
+    :param category_ratio: convert string columns with fewer unique values than this fraction of rows
+    :return: tuple of compacted DataFrame, bytes saved
+    '''
+    import numpy as np
+    import pandas as pd
+
+    before = df.memory_usage(deep=True).sum()
+
+    columns = {}
+    for c in df.columns:
+        s = df[c]
+        if c in flags:
+            columns[c] = flag_mask(s)
+
+        elif s.dtype == object or pd.api.types.is_string_dtype(s.dtype):
+            if not isinstance(s.dtype, pd.CategoricalDtype) and s.nunique() < category_ratio * len(s):
+                columns[c] = s.astype('category')
+
+        elif float32 and s.dtype == np.float64 and io.is_quantification_column(c):
+            columns[c] = s.astype(np.float32)
+
+    if columns:
+        df = df.assign(**columns)
+
+    saved = before - df.memory_usage(deep=True).sum()
+    return df, saved
+
+
+def index_by_design(df, samples, design):
+    '''
+    Index the columns of a table by an experimental design, as
+    `padua.process.build_index_from_design`, dropping the columns assigned to 'REMOVE'.
+
+    Columns are matched to the design by sample name (e.g. 'A' for 'Intensity A'), so
+    the design applies whichever quantification the columns are of.
+
+    :param df: pandas DataFrame
+    :param samples: sample name of each column of `df`
+    :param design: experimental design DataFrame (Label, Group, Replicate, ...)
+    :return: DataFrame with the design levels as column MultiIndex
+    '''
+    import padua
+
+    df = padua.process.build_index_from_design(df.set_axis(samples, axis=1), design)
+    if 'REMOVE' in df.columns.get_level_values(0):
+        df = df.drop(('REMOVE',), axis=1)
+    return df
+
+
+class ThresholdIndex(object):
+    '''
+    Sorted index of a per-row score (e.g. localization probability, or number of valid
+    values) for filtering at any threshold without rescanning the table.
+
+    Rows are sorted once by score; the number of rows scoring at or above a threshold
+    is then a binary search, O(log n), and the rows themselves are the tail of the
+    sorted order. Rows with no score (NaN) never pass, as with a `>=` comparison.
+
+    :param values: array of scores, one per row
+    '''
+
+    def __init__(self, values):
+        import numpy as np
+
+        values = np.asarray(values, dtype=np.float64)
+        valid = np.flatnonzero(~np.isnan(values))
+        order = np.argsort(values[valid], kind='stable')
+
+        self.rows = valid[order]  # Row positions, by ascending score
+        self.values = values[self.rows]  # Sorted scores
+        self.n = len(values)
+
+    def start(self, threshold):
+        # Position in the sorted order of the first row scoring >= threshold
+        import numpy as np
+        return int(np.searchsorted(self.values, threshold, side='left'))
+
+    def count(self, threshold):
+        '''
+        Return the number of rows scoring at or above `threshold`.
+        '''
+        return len(self.values) - self.start(threshold)
+
+    def counts(self, thresholds):
+        '''
+        Return the number of rows scoring at or above each of `thresholds`, as an array.
+        '''
+        import numpy as np
+        return len(self.values) - np.searchsorted(self.values, thresholds, side='left')
+
+    def positions(self, threshold):
+        '''
+        Return the positions of the rows scoring at or above `threshold`, in table order.
+        '''
+        import numpy as np
+        return np.sort(self.rows[self.start(threshold):])
+
+    def subset(self, df, threshold):
+        '''
+        Return the rows of `df` (the table the index was built from) scoring at or above
+        `threshold`, in their original order.
+        '''
+        if df.shape[0] != self.n:
+            raise ValueError('Table has %d rows; index was built for %d' % (df.shape[0], self.n))
+
+        start = self.start(threshold)
+        if start == 0 and len(self.values) == self.n:
+            return df
+        return df.iloc[self.positions(threshold)]
+
+
+# Multiplicity suffixes of MaxQuant modification site columns (single, double, triple)
+MULTIPLICITY_SUFFIXES = ('___1', '___2', '___3')
+
+
+def expand_side_table(df, suffixes=MULTIPLICITY_SUFFIXES):
+    '''
+    Fold the multiplicity columns of a modification sites table down onto duplicate
+    rows, as `padua.process.expand_side_table` (Perseus 'expand side table').
+
+    Each multiplicity block (e.g. 'Intensity A___1', 'Intensity B___1') becomes its own
+    set of rows under the unsuffixed column names, with a 'Multiplicity' column and the
+    suffix appended to the 'id'. Columns without a multiplicity suffix are repeated for
+    each block. Rows are multiplicity-major (all ___1 rows, then ___2, ...), with the
+    input row number (or index) repeated for each block.
+
+    The blocks are concatenated into a single array, rather than filtering and
+    concatenating a table per multiplicity; the unsuffixed columns are repeated with a
+    single take.
+
+    :param df: pandas DataFrame
+    :param suffixes: multiplicity column suffixes, in output order
+    :return: expanded DataFrame
+    '''
+    import re
+    import numpy as np
+    import pandas as pd
+
+    index_names = df.index.names
+    df = df.reset_index()
+    n = df.shape[0]
+
+    # Unsuffixed column name and multiplicity of each suffixed column, in table order
+    stems = []
+    blocks = {s: {} for s in suffixes}
+    for c in df.columns:
+        for s in suffixes:
+            if c.endswith(s):
+                stem = c[:-len(s)]
+                blocks[s][stem] = c
+                if stem not in stems:
+                    stems.append(stem)
+                break
+
+    # Other columns are repeated for each multiplicity (unless superseded by a stem)
+    base = [c for c in df.columns if not re.search(r'___\d$', c) and c not in stems]
+
+    k = len(suffixes)
+    rows = np.tile(np.arange(n), k)
+
+    # Blocks missing a column (e.g. no ___3 columns at all) are filled with NaN
+    columns = [[blocks[s].get(stem) for stem in stems] for s in suffixes]
+    dtypes = set(df[c].dtype for cs in columns for c in cs if c is not None)
+    if len(dtypes) == 1 and all(c is not None for cs in columns for c in cs):
+        # Concatenated column-major, the layout pandas holds blocks in, so the frame
+        # wraps the array without a further copy
+        values = np.concatenate([df[cs].to_numpy().T for cs in columns], axis=1)
+        expanded = pd.DataFrame(values.T, columns=stems, copy=False)
+    else:
+        expanded = pd.concat([df.reindex(columns=cs).set_axis(stems, axis=1) for cs in columns], ignore_index=True)
+
+    multiplicity = np.repeat(np.array(suffixes, dtype=object), n)
+    expanded['Multiplicity'] = multiplicity
+
+    repeated = df[base].take(rows)
+    repeated.index = expanded.index
+    if 'id' in repeated.columns:
+        repeated['id'] = np.tile(df['id'].astype(str).to_numpy(dtype=object), k) + multiplicity
+
+    df = pd.concat([expanded, repeated], axis=1)
+    df.index = rows
+
+    if index_names[0] is not None:
+        df.set_index(index_names, inplace=True)
+
+    return df
+
+
+def value_block(df, positions, dtype='float32'):
+    '''
+    Copy the columns at `positions` into a single column-major array of `dtype`, for
+    the in-place kernels below. Each column of the result is contiguous; columns are
+    converted one at a time, so no intermediate copy of the whole block is made.
+
+    :param df: pandas DataFrame
+    :param positions: positions of the (numeric) columns
+    :param dtype: 'float32' or 'float64'
+    :return: numpy array of shape (rows, columns), Fortran order
+    '''
+    import numpy as np
+
+    values = np.empty((df.shape[0], len(positions)), dtype=dtype, order='F')
+    for j, n in enumerate(positions):
+        values[:, j] = df.iloc[:, n].to_numpy()
+    return values
+
+
+def log2_transform(values):
+    '''
+    Log2 transform a block of values in place. Zero and negative values become NaN
+    (rather than -inf and NaN, with warnings), so unmeasured (zero) intensities count as
+    missing values downstream, e.g. in the Filter tool's valid value counts.
+    '''
+    import numpy as np
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for c in values.T:
+            np.log2(c, out=c)
+            c[np.isinf(c)] = np.nan
+    return values
+
+
+def column_medians(values):
+    '''
+    Return the median of the non-NaN values of each column of a block (NaN where there
+    are none). Each column's valid values are copied once and the median found by
+    partitioning the copy, rather than sorting.
+    '''
+    import numpy as np
+
+    medians = np.full(values.shape[1], np.nan, dtype=values.dtype)
+    for j, c in enumerate(values.T):
+        v = c[~np.isnan(c)]
+        if v.size:
+            medians[j] = np.median(v, overwrite_input=True)
+    return medians
+
+
+def subtract_column_median(values):
+    '''
+    Center each column of a block of values on its median, in place.
+    '''
+    values -= column_medians(values)
+    return values
+
+
+# Longest axis `nanmedian` sorts with a sorting network rather than `np.sort`
+SORT_NETWORK_SIZE = 5
+
+
+def nanmedian(a, axis, counts=None):
+    '''
+    Median of the non-NaN values along an axis of an array, NaN where there are none.
+    Sorts along the axis (NaNs last) and takes the middle of the valid values, so runs
+    vectorized where `np.nanmedian` falls back to a loop per row.
+
+    Short axes (e.g. the replicates of a group) are sorted by compare-exchanges of
+    whole slices (odd-even transposition), as `np.sort` is slow on many short lanes.
+
+    :param counts: number of non-NaN values along the axis, if already known
+    '''
+    import numpy as np
+
+    k = np.count_nonzero(~np.isnan(a), axis=axis) if counts is None else counts
+
+    if a.shape[axis] <= SORT_NETWORK_SIZE:
+        s = np.moveaxis(a, axis, 0).copy()
+        s[np.isnan(s)] = np.inf
+        for r in range(len(s)):
+            for i in range(r % 2, len(s) - 1, 2):
+                lo = np.minimum(s[i], s[i + 1])
+                np.maximum(s[i], s[i + 1], out=s[i + 1])
+                s[i] = lo
+        axis = 0
+    else:
+        s = np.sort(a, axis=axis)
+
+    lo = np.expand_dims(np.maximum(k - 1, 0) // 2, axis)
+    hi = np.expand_dims(k // 2, axis)
+    medians = ((np.take_along_axis(s, lo, axis) + np.take_along_axis(s, hi, axis)) / 2).squeeze(axis)
+    medians[k == 0] = np.nan
+    return medians
+
+
+# Rows reduced at a time by `Groups.reduce`; bounds the temporary copies of the values
+GROUP_CHUNK_ROWS = 2 ** 16
+
+
+class GroupIndex(object):
+    '''
+    Integer codes of the values of each level of a table's column MultiIndex (e.g. the
+    experimental design's Group and Replicate), built once from the design so tools can
+    group the columns by any combination of levels (see `groups`) without regrouping
+    the index.
+
+    Rows may be removed from the table (e.g. by filtering) and the index still applies;
+    once columns change, build a new one.
+
+    :param columns: column index, e.g. `df.columns`
+    '''
+
+    def __init__(self, columns):
+        import pandas as pd
+
+        self.columns = columns
+        self.names = list(columns.names)
+        self.codes = {}  # Level name: code of each column's value, -1 for missing
+        self.uniques = {}  # Level name: values, sorted
+        for n, name in enumerate(self.names):
+            self.codes[name], self.uniques[name] = pd.factorize(columns.get_level_values(n), sort=True)
+
+    def __repr__(self):
+        return '<GroupIndex %d columns: %s>' % (len(self.columns), ', '.join(str(n) for n in self.names))
+
+    def matches(self, df):
+        return df.columns.equals(self.columns)
+
+    def groups(self, levels=None):
+        '''
+        Return the `Groups` of columns with the same values at `levels` (names or
+        positions), as `DataFrame.groupby(level=levels, axis=1)` would: keys in sorted
+        order, columns missing a value at any of the levels left out. Levels not in the
+        index (e.g. 'Timepoint' in a design without one) are ignored; by default, or if
+        none are left, group by the 'Group' level (or the first).
+        '''
+        import numpy as np
+        import pandas as pd
+
+        levels = [self.names[l] if isinstance(l, int) and l not in self.names else l for l in levels or []]
+        levels = [l for l in levels if l in self.names]
+        if not levels:
+            levels = ['Group'] if 'Group' in self.names else self.names[:1]
+
+        # Combine the levels' codes into one, in the levels' sort order
+        combined = np.zeros(len(self.columns), dtype=np.int64)
+        for name in levels:
+            combined = combined * len(self.uniques[name]) + self.codes[name]
+        valid = np.all([self.codes[name] >= 0 for name in levels], axis=0)
+
+        found, codes = np.unique(combined[valid], return_inverse=True)
+        group_codes = np.full(len(self.columns), -1, dtype=np.intp)
+        group_codes[valid] = codes
+
+        # Split the combined codes of the groups found back into each level's values
+        keys = []
+        for name in reversed(levels):
+            size = len(self.uniques[name])
+            keys.insert(0, self.uniques[name].take(found % size))
+            found = found // size
+
+        if len(levels) == 1:
+            keys = pd.Index(keys[0], name=levels[0])
+        else:
+            keys = pd.MultiIndex.from_arrays(keys, names=levels)
+
+        return Groups(group_codes, keys)
+
+
+class Groups(object):
+    '''
+    Columns of a table in groups, with reducers computing a statistic of each group's
+    values in every row (see `reduce`), e.g. the median of each experimental group.
+
+    Columns are sorted by group once, so each group is a contiguous range of columns and
+    all groups are reduced together, in one vectorized pass over the values.
+
+    :param codes: group of each column, as a position in `keys`; -1 for no group
+    :param keys: group keys, a pandas Index
+    '''
+
+    STATISTICS = ('median', 'mean', 'count', 'size')
+
+    def __init__(self, codes, keys):
+        import numpy as np
+
+        self.codes = codes
+        self.keys = keys
+
+        grouped = np.flatnonzero(codes >= 0)
+        self.order = grouped[np.argsort(codes[grouped], kind='stable')]  # Columns by group
+        self.sizes = np.bincount(codes[grouped], minlength=len(keys))  # Columns per group
+        self.starts = np.cumsum(self.sizes) - self.sizes  # Group starts, in `order`
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __repr__(self):
+        return '<Groups %d groups of %d columns>' % (len(self), len(self.order))
+
+    def reduce(self, df, how='median', chunk_rows=GROUP_CHUNK_ROWS):
+        '''
+        Reduce the values of each group of columns of `df` in each row: one of
+        'median' or 'mean' (of the non-NaN values; NaN where there are none), 'count'
+        (number of non-NaN values) or 'size' (number of values). Several statistics can
+        be computed in the same pass by giving a sequence.
+
+        Rows are reduced a chunk at a time, so memory use is bounded by the chunk size
+        rather than the table.
+
+        :param df: pandas DataFrame, with the columns the groups were built for
+        :param how: statistic, or sequence of statistics
+        :return: DataFrame of the statistic, indexed as `df` with a column per group;
+                 for a sequence, a dict of statistic to DataFrame
+        '''
+        import numpy as np
+        import pandas as pd
+
+        single = isinstance(how, str)
+        stats = [how] if single else list(how)
+        for s in stats:
+            if s not in self.STATISTICS:
+                raise ValueError('Unknown statistic %s; expected one of %s' % (s, ', '.join(self.STATISTICS)))
+
+        if df.shape[1] != len(self.codes):
+            raise ValueError('Table has %d columns; groups were built for %d' % (df.shape[1], len(self.codes)))
+
+        values = df.to_numpy()
+        if not len(self):
+            empty = pd.DataFrame(np.empty((values.shape[0], 0)), index=df.index, columns=self.keys)
+            return empty if single else {s: empty for s in stats}
+
+        # Position of each column (in group order) within its group, to lay the groups
+        # out side by side for the median
+        group = np.repeat(np.arange(len(self)), self.sizes)
+        slot = np.arange(len(self.order)) - np.repeat(self.starts, self.sizes)
+        uniform = (self.sizes == self.sizes[0]).all()
+
+        results = {s: [] for s in stats}
+        for i in range(0, max(values.shape[0], 1), chunk_rows):
+            v = values[i:i + chunk_rows][:, self.order]
+            if not np.issubdtype(v.dtype, np.floating):
+                v = v.astype(np.float64)
+            valid = ~np.isnan(v)
+            count = np.add.reduceat(valid, self.starts, axis=1, dtype=np.intp)
+
+            for s in stats:
+                if s == 'count':
+                    r = count
+                elif s == 'size':
+                    r = np.broadcast_to(self.sizes, count.shape).copy()
+                elif s == 'mean':
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        r = np.add.reduceat(np.where(valid, v, 0), self.starts, axis=1) / count
+                elif uniform and self.sizes[0] == 1:
+                    r = v.copy()
+                elif uniform:
+                    r = nanmedian(v.reshape(v.shape[0], len(self), -1), axis=2, counts=count)
+                else:
+                    # Groups padded with NaN to the largest
+                    padded = np.full((v.shape[0], len(self), self.sizes.max()), np.nan, dtype=v.dtype)
+                    padded[:, group, slot] = v
+                    r = nanmedian(padded, axis=2, counts=count)
+                results[s].append(r)
+
+        results = {s: pd.DataFrame(np.concatenate(r), index=df.index, columns=self.keys, copy=False)
+                   for s, r in results.items()}
+        return results[how] if single else results
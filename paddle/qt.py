@@ -4,6 +4,9 @@ import os
 
 # ReadTheDocs
 ON_RTD = os.environ.get('READTHEDOCS', None) == 'True'
+# Headless (process pool workers, batch runs): Qt is imported (for the tool classes and
+# settings) but no application object is created, so no display or event loop is needed
+HEADLESS = os.environ.get('PADDLE_HEADLESS', None) == '1'
 if not ON_RTD:
 
     import PyQt5
@@ -15,12 +18,17 @@ if not ON_RTD:
     os.environ['QT_API'] = 'pyqt5'
 
 
+    # Names used by QSettings; static, so set without an application when headless
+    QCoreApplication.setOrganizationName("Paddle")
+    QCoreApplication.setOrganizationDomain("paddle.org")
+    QCoreApplication.setApplicationName("Paddle")
+
     # Create a Qt application
-    app = QApplication(sys.argv)
+    if HEADLESS:
+        app = None
+    else:
+        app = QApplication(sys.argv)
     # app.setStyle('fusion')
-    app.setOrganizationName("Paddle")
-    app.setOrganizationDomain("paddle.org")
-    app.setApplicationName("Paddle")
 
 else:
 
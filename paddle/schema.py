@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import re
+import logging
+logging.debug('Loading schema.py')
+
+from . import io
+
+# Column roles
+ANNOTATION = 'annotation'
+FLAG = 'flag'
+QUANTIFICATION = 'quantification'
+OTHER = 'other'
+
+_multiplicity_re = re.compile(r'(___\d+)$')
+
+
+def parse_column(c, quantification=io.MAXQUANT_QUANTIFICATION):
+    '''
+    Split a MaxQuant column name into its role, quantification type, sample and
+    multiplicity, e.g. 'LFQ intensity A___2' is ('quantification', 'LFQ intensity', 'A',
+    '___2'). The summed quantification column (e.g. 'Intensity') has no sample.
+    '''
+    if not isinstance(c, str):
+        return OTHER, None, None, None
+
+    m = _multiplicity_re.search(c)
+    multiplicity = m.group(1) if m else None
+    name = c[:m.start()] if m else c
+
+    # Longest prefix first, so e.g. 'Reporter intensity' isn't taken for 'Intensity'
+    for q in sorted(quantification, key=len, reverse=True):
+        if name == q:
+            return QUANTIFICATION, q, None, multiplicity
+        if name.startswith('%s ' % q):
+            return QUANTIFICATION, q, name[len(q) + 1:], multiplicity
+
+    if name in io.MAXQUANT_FLAGS:
+        return FLAG, None, None, multiplicity
+    if name in io.MAXQUANT_ANNOTATION:
+        return ANNOTATION, None, None, multiplicity
+    return OTHER, None, None, multiplicity
+
+
+class ColumnSchema(object):
+    '''
+    Roles of the columns of a table, parsed once from their names: annotation, quality
+    flag or quantification, and for quantification columns the type (e.g. 'LFQ
+    intensity'), sample name and multiplicity ('___1'...).
+
+    Tools select columns by role as integer positions (`positions`, `select`) rather
+    than matching names with regular expressions on every call; selecting by position
+    with `DataFrame.iloc` doesn't copy the data under copy-on-write. The schema
+    describes a table's columns by position, so once columns are selected or
+    reordered use `subset` to get the schema of the result.
+
+    :param columns: column names, e.g. `df.columns`
+    '''
+
+    def __init__(self, columns=None, _parsed=None):
+        if _parsed is None:
+            columns = list(columns)
+            _parsed = [(c,) + parse_column(c) for c in columns]
+
+        self._parsed = _parsed
+        self.columns = [p[0] for p in _parsed]
+        self.roles = [p[1] for p in _parsed]
+        self.quantification_types = [p[2] for p in _parsed]
+        self.samples = [p[3] for p in _parsed]
+        self.multiplicities = [p[4] for p in _parsed]
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __repr__(self):
+        return '<ColumnSchema %d columns: %s>' % (len(self), ', '.join(self.available_quantification()))
+
+    def matches(self, df):
+        return list(df.columns) == self.columns
+
+    def positions(self, role=None, quantification=None, sample=True, multiplicity=None):
+        '''
+        Return the positions of the columns with the given role and, for quantification
+        columns, type. Summed quantification columns (no sample) are skipped unless
+        `sample` is False; `multiplicity` is True for only columns with a multiplicity
+        suffix, False for only those without, None for either.
+
+        :return: list of int
+        '''
+        import numpy as np
+
+        found = []
+        for n, (_, r, q, s, m) in enumerate(self._parsed):
+            if role is not None and r != role:
+                continue
+            if quantification is not None and q != quantification:
+                continue
+            if r == QUANTIFICATION and sample and s is None:
+                continue
+            if multiplicity is not None and (m is not None) != multiplicity:
+                continue
+            found.append(n)
+
+        return np.array(found, dtype=np.intp)
+
+    def exclude(self, positions):
+        '''
+        Return the positions of all columns not in `positions`.
+        '''
+        import numpy as np
+        mask = np.ones(len(self), dtype=bool)
+        mask[positions] = False
+        return np.flatnonzero(mask)
+
+    def select(self, df, positions):
+        '''
+        Return the columns of `df` at `positions` and their schema, as a tuple.
+        '''
+        return df.iloc[:, positions], self.subset(positions)
+
+    def subset(self, positions):
+        '''
+        Return the schema of the columns at `positions`, in that order.
+        '''
+        return ColumnSchema(_parsed=[self._parsed[n] for n in positions])
+
+    def available_quantification(self):
+        '''
+        Return the quantification types with per-sample columns, in table order.
+        '''
+        types = []
+        for _, r, q, s, _ in self._parsed:
+            if r == QUANTIFICATION and s is not None and q not in types:
+                types.append(q)
+        return types
+
+    def sample_names(self, positions=None):
+        '''
+        Return the sample names of the columns at `positions` (all columns by default),
+        or the column name for columns without one.
+        '''
+        if positions is None:
+            positions = range(len(self))
+        return [self.samples[n] if self.samples[n] is not None else self.columns[n] for n in positions]
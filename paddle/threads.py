@@ -5,8 +5,38 @@ logging.debug('Loading threads.py')
 
 # Import PyQt5 classes
 from .qt import *
+from . import pool
+from . import instrument
 import sys
 import traceback
+import threading
+
+
+class WorkerCancelled(Exception):
+    '''
+    Raised inside a worker's function, from its progress callback, once the worker has been cancelled.
+    '''
+    pass
+
+
+class CancelToken(object):
+    '''
+    Cooperative cancellation flag shared between a worker and the code that started it.
+    Long-running functions call `check` (via their progress callback) at checkpoints.
+    '''
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise WorkerCancelled()
 
 
 class WorkerSignals(QObject):
@@ -26,9 +56,17 @@ class WorkerSignals(QObject):
         
     status
         `str` one of standard status flag message types
+
+    cancelled
+        No data; emitted instead of result or error when the worker was cancelled
+
+    profile
+        `dict` timings and memory use of the run, see `instrument.Recorder`
         
     '''
     finished = pyqtSignal()
+    profile = pyqtSignal(dict)
+    cancelled = pyqtSignal()
     error = pyqtSignal(tuple)
     result = pyqtSignal(dict)
     status = pyqtSignal(str)
@@ -46,6 +84,10 @@ class Worker(QRunnable):
     :param args: Arguments to pass to the callback function
     :param kwargs: Keywords to pass to the callback function
 
+    If a `progress_callback` keyword is supplied it is wrapped to check for cancellation
+    on every call, so functions can be stopped at any progress checkpoint. Each call is
+    also recorded as a stage checkpoint in the run's profile.
+
     '''
 
     def __init__(self, fn, *args, **kwargs):
@@ -55,6 +97,22 @@ class Worker(QRunnable):
         self.args = args
         self.kwargs = kwargs
         self.signals = WorkerSignals()
+        self.token = CancelToken()
+        self.recorder = instrument.Recorder(getattr(fn, '__name__', repr(fn)))
+
+        self.progress_callback = kwargs.get('progress_callback')
+        if self.progress_callback:
+            callback = self.progress_callback
+
+            def progress_callback(progress):
+                self.token.check()
+                self.recorder.checkpoint(progress)
+                callback(progress)
+
+            self.kwargs['progress_callback'] = progress_callback
+
+    def cancel(self):
+        self.token.cancel()
 
     @pyqtSlot()
     def run(self):
@@ -63,13 +121,25 @@ class Worker(QRunnable):
         '''
 
         # Retrieve args/kwargs here; and fire processing using them
+        self.recorder.start(inputs=self.kwargs)
         try:
+            self.token.check()
             result = self.fn(*self.args, **self.kwargs)
+            # Discard results that completed after cancellation was requested
+            self.token.check()
+        except WorkerCancelled:
+            self.recorder.stop('cancelled')
+            self.signals.profile.emit(self.recorder.as_dict())
+            self.signals.cancelled.emit()
         except:
             traceback.print_exc()
             exctype, value = sys.exc_info()[:2]
+            self.recorder.stop('error', error=repr(value))
+            self.signals.profile.emit(self.recorder.as_dict())
             self.signals.error.emit((exctype, value, traceback.format_exc()))
         else:
+            self.recorder.stop('ok', outputs=result.get('data') if result else None)
+            self.signals.profile.emit(self.recorder.as_dict())
             self.signals.result.emit(result)  # Return the result of the processing
         finally:
             self.signals.finished.emit()  # Done
@@ -77,3 +147,43 @@ class Worker(QRunnable):
     # Stub to be over-wridden on subclass
     def process(self, *args, **kwargs):
         return False
+
+
+class ProcessWorker(Worker):
+    '''
+    Worker running its function in the process pool (see pool.py) rather than on
+    the worker thread itself, so CPU-bound work doesn't hold the GUI process's GIL and
+    concurrent workers run truly in parallel. The thread relays progress from the child
+    process and passes on cancellation. Signals are as for `Worker`.
+
+    The function must be importable by name (e.g. a tool's static method) and its
+    arguments and result picklable. The run profile is recorded in the child process.
+    '''
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            status, value, profile = pool.run(self.fn, self.kwargs,
+                                                   progress_callback=self.progress_callback,
+                                                   is_cancelled=self.token.is_cancelled)
+            if status == 'ok' and self.token.is_cancelled():
+                status = 'cancelled'
+
+            if profile:
+                self.signals.profile.emit(profile)
+
+        except:
+            traceback.print_exc()
+            exctype, value = sys.exc_info()[:2]
+            self.signals.error.emit((exctype, value, traceback.format_exc()))
+
+        else:
+            if status == 'ok':
+                self.signals.result.emit(value)
+            elif status == 'cancelled':
+                self.signals.cancelled.emit()
+            else:
+                self.signals.error.emit(value)
+
+        finally:
+            self.signals.finished.emit()
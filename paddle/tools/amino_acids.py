@@ -1,4 +1,5 @@
 from .base import ToolBase
+from .. import plots
 from ..ui import ConfigPanel, QFolderLineEdit, QFileOpenLineEdit
 from ..globals import settings
 from ..qt import *
@@ -38,6 +39,13 @@ class ModifiedAminoAcids(ToolBase):
 
     shortname = 'amino_acids'
 
+    inputs = ('localization',)
+    outputs = ('df',)
+    uses = ('df',)
+
+    function = 'amino_acids'
+    kinds = ('sites',)
+
     is_manual_runnable = True
     is_auto_runnable = False
     is_auto_rerunnable = False
@@ -46,22 +54,14 @@ class ModifiedAminoAcids(ToolBase):
     def __init__(self, *args, **kwargs):
         super(ModifiedAminoAcids, self).__init__(*args, **kwargs)
 
-        self.config.set_defaults({
-        })
-
         self.addConfigPanel(ModifiedAminoAcidsConfig)
         self.addButtonBar(self.defaultButtons())
 
-    def run_manual(self):
-        self.run( self.amino_acids )
-
     @staticmethod
     def amino_acids(df, config, progress_callback):
-        from matplotlib.pyplot import Figure
         import padua
-        df = df.copy()
 
-        fig = padua.visualize.modifiedaminoacids(df).figure
+        fig = plots.LazyFigure(padua.visualize.modifiedaminoacids, df)
 
         #df = padua.filters.filter_localization_probability(df, config.get('localization_prob'))
 
@@ -1,16 +1,34 @@
 from ..qt import *
 from .. import utils
 from pyqtconfig import ConfigManager
+import copy
 import logging
-from ..threads import Worker
-from ..globals import custom_pyqtconfig_hooks
+import time
+import hashlib
+import json
+from ..threads import Worker, ProcessWorker
+from .. import workflow
+from .. import cache
+from .. import memory
+from .. import plots
+from .. import instrument
+from ..globals import settings, custom_pyqtconfig_hooks
 
 import numpy as np
+import pandas as pd
 
-from copy import deepcopy
-
-from ..ui import MplView, SVGMplView
+from ..ui import MplView, SVGMplView, ConfigPanel
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+
+# Outputs up to this size are fingerprinted by content, so a re-run upstream producing
+# identical values (e.g. the same experimental design) doesn't invalidate dependent tools
+CONTENT_FINGERPRINT_MAX_BYTES = 1024 ** 2
+
+# Delay before re-running a tool whose in-flight run was superseded, so a burst of
+# config changes results in a single run with the latest settings
+RERUN_DEBOUNCE_MS = 250
 
 SPECTRUM_COLOR = QColor(0, 0, 0, 100)
 
@@ -40,9 +58,35 @@ class ToolBase(QObject):
     is_auto_rerunnable = True
     is_disableable = True
 
+    # Tool function can run in the process pool (importable by name, picklable in/out)
+    is_process_safe = True
+
+    # Shortnames of the tools this tool takes data from, and the data keys it outputs
+    inputs = ()
+    outputs = ()
+
+    # Data keys (from the input tools' outputs) the tool function uses, or None for all;
+    # changes to other keys upstream don't invalidate the tool's result
+    uses = None
+
+    # Name of the static tool function; run from the GUI by `run_manual`, or headless (batch.py)
+    function = None
+
+    # Kinds of data file the tool applies to (see io.sniff_maxquant), or None for all
+    kinds = None
+
+    # Config keys that must be set (e.g. to an input file) for the tool to run
+    requires = ()
+
+    # Default config; merged with those of the base classes by `config_defaults`
+    defaults = {
+        'auto_run_on_config_change': True,
+    }
+
     progress = pyqtSignal(float)
     status = pyqtSignal(str)
     complete = pyqtSignal()
+    profiled = pyqtSignal(dict)
 
     config_panel_size = 150
     view = None
@@ -53,9 +97,7 @@ class ToolBase(QObject):
 
         self.config = ConfigManager()
         self.config.hooks.update(custom_pyqtconfig_hooks.items())
-        self.config.set_defaults({
-            'auto_run_on_config_change': True
-            })
+        self.config.set_defaults(self.config_defaults())
         self.current_status = 'inactive'
         self.config.updated.connect(self.auto_run_on_config_change)
 
@@ -71,6 +113,18 @@ class ToolBase(QObject):
 
         self._worker_thread_ = None
         self._worker_thread_lock_ = False
+        self._result_key_ = None
+        self._input_fingerprints_ = None
+        self._input_data_ = None
+        self._cancelled_ = False
+        self.profile = None  # Timings and memory use of the last run; see instrument.py
+
+        # Pending (fn, extra) run superseding the in-flight one
+        self._rerun_ = None
+        self._rerun_timer_ = QTimer()
+        self._rerun_timer_.setSingleShot(True)
+        self._rerun_timer_.setInterval(RERUN_DEBOUNCE_MS)
+        self._rerun_timer_.timeout.connect(self.rerun)
 
         self.view = MplView(self.parent())
 
@@ -82,18 +136,53 @@ class ToolBase(QObject):
         self.status.connect(self.status_callback)
 
 
+    @property
+    def data(self):
+        # Tables may have been spilled to disk to stay within the memory budget (see
+        # MainWindow.enforce_memory_budget); reload them on access
+        self.data_used = time.time()
+        memory.restore(self._data_)
+        return self._data_
+
+    @data.setter
+    def data(self, data):
+        self.data_used = time.time()
+        self._data_ = data
+
+    def update_memory_usage(self):
+        # Show the size of this tool's tables in the tool list
+        if getattr(self, 'item', None) is None:
+            return
+
+        in_memory, spilled = memory.usage(self._data_)
+        text = '%.0f MB' % (in_memory / 1024. ** 2) if in_memory else ''
+        if spilled:
+            text += ' +%.0f MB on disk' % (spilled / 1024. ** 2)
+        self.item.setData(Qt.UserRole + 4, text.strip())
+
     def setup(self):
+        # Any in-flight run is now stale
+        self.cancel()
+
         self.data = {
             'data': None,
         }
-        self.view.figure.clear()
+        self.fingerprint = None  # Key of the result currently held in self.data
+        self.output_fingerprints = {}  # Data key: fingerprint of each value in self.data
+        self._shown_figure_ = None  # Figure spec currently drawn in the view
+        self._rendering_figure_ = None  # Figure spec being rendered on a worker thread
+        # Swap in a blank figure rather than clearing: the shown one may belong to a cached result
+        self.view.figure = Figure()
         self.view.redraw()
+        self.update_memory_usage()
         self.status.emit('inactive' if self.current_status == 'inactive' else 'ready')
 
 
 
     def addConfigPanel(self, panel):
-        self.configLayout.addWidget( panel(self) )
+        panel = panel(self)
+        self.configLayout.addWidget( panel )
+        return panel
 
     def addButtonBar(self, buttons):
         '''
@@ -114,8 +203,46 @@ class ToolBase(QObject):
         btnlayout.addSpacerItem(QSpacerItem(250, 1, QSizePolicy.Maximum, QSizePolicy.Maximum))
 
     def run_manual(self):
-        pass
+        if self.function:
+            self.run(getattr(self, self.function), **self.function_args(self.parent().dataset))
+
+    @classmethod
+    def config_defaults(cls):
+        '''
+        Default config of the tool: the `defaults` of the class and its base classes,
+        the most derived taking precedence. A fresh copy, so may be modified.
+        '''
+        defaults = {}
+        for c in reversed(cls.__mro__):
+            defaults.update(vars(c).get('defaults', {}))
+        return copy.deepcopy(defaults)
+
+    @classmethod
+    def function_args(cls, dataset):
+        '''
+        Extra keyword arguments for the tool function, given the header summary of the
+        data file (see `io.sniff_maxquant`; None if no file is loaded). Application
+        state the function needs (e.g. `normalization.threads`) is passed from here, as
+        the function may run in a pool process where that state is not set.
+        '''
+        return {}
 
+    @classmethod
+    def applies_to(cls, dataset, config):
+        '''
+        Whether the tool can run on a data file with header summary `dataset`, given
+        the tool `config` dict.
+        '''
+        if cls.kinds is not None and dataset['kind'] not in cls.kinds:
+            return False
+        return all(config.get(k) for k in cls.requires)
+
+    def set_dataset(self, dataset):
+        '''
+        Update configuration choices for a newly selected data file, with header summary
+        `dataset`. Override to offer only what the data provides.
+        '''
+        pass
 
     def disable(self):
         self.status.emit('inactive')
@@ -188,17 +315,115 @@ class ToolBase(QObject):
 
 
 
+    def is_active(self):
+        return self.current_status != 'inactive'
+
+    def get_input_tools(self):
+        # Get the ACTIVE tools this tool takes data from
+        return workflow.resolve_inputs(self, self.parent().tools, ToolBase.is_active)
+
     def get_previous_data(self):
-        t = self.get_previous_tool()
-        if t and 'data' in t.data:
-            return t.data['data']
-        else:
-            return None
+        # Merge the data of all input tools, in declared order
+        data = {}
+        for t in self.get_input_tools():
+            if t.data.get('data'):
+                data.update(t.data['data'])
+
+        if self.uses is not None:
+            data = {k: v for k, v in data.items() if k in self.uses}
+
+        return data or None
+
+    def input_fingerprints(self):
+        '''
+        Return the fingerprints of the input data this tool uses, merged across the input
+        tools as for `get_previous_data`, or None if any input can't be fingerprinted.
+        '''
+        fingerprints = {}
+        for t in self.get_input_tools():
+            if t._data_.get('data') is not None:
+                if t.fingerprint is None:
+                    return None
+                fingerprints.update(t.output_fingerprints)
+
+        if self.uses is not None:
+            fingerprints = {k: v for k, v in fingerprints.items() if k in self.uses}
+
+        return fingerprints
+
+    def get_output_fingerprints(self, data):
+        '''
+        Fingerprint each value of a result's data: values passed through unchanged keep
+        their input's fingerprint, small values are hashed by content and anything else
+        is identified by the result key.
+        '''
+        if not data or self._result_key_ is None:
+            return {}
+
+        inputs = self._input_data_ or {}
+        fingerprints = {}
+        for k, v in data.items():
+            if k in inputs and inputs[k] is v and k in self._input_fingerprints_:
+                fingerprints[k] = self._input_fingerprints_[k]
+                continue
+
+            fingerprint = cache.content_fingerprint(memory.resolve(v), CONTENT_FINGERPRINT_MAX_BYTES)
+            if fingerprint is None:
+                fingerprint = hashlib.sha1(('%s:%s' % (self._result_key_, k)).encode('utf-8')).hexdigest()
+            fingerprints[k] = fingerprint
+
+        return fingerprints
 
     def plot(self, **kwargs):
-        pass
-        #if 'spc' in self.data:
-        #    self.parent().spectraViewer.plot(self.data['spc'], **kwargs)
+        # Figures are only drawn for the tool on view
+        if self.parent().current_tool is self:
+            self.render_figure()
+
+    def render_figure(self):
+        '''
+        Draw the result figure into the view. A figure not yet rendered from its spec is
+        rendered on a worker thread, as plotting can be slow (e.g. the rank intensity
+        plot's GO enrichment); only the finished figure is attached to the view, here on
+        the GUI thread (see `show_figure`).
+        '''
+        # Spilled figure arguments are reloaded by the spec; no need to reload all the data
+        spec = self._data_.get('fig')
+        if not spec or spec is self._shown_figure_ or spec is self._rendering_figure_:
+            return
+
+        if isinstance(spec, plots.LazyFigure) and not spec.is_rendered:
+            self._rendering_figure_ = spec
+            worker = Worker(fn=plots.render_result, fig=spec, progress_callback=self.progress.emit)
+            worker.signals.result.connect(self.figure_rendered)
+            worker.signals.error.connect(self.figure_error)
+            self.parent().threadpool.start(worker)
+            return
+
+        self.show_figure(spec, plots.render(spec))
+
+    def figure_rendered(self, result):
+        self._rendering_figure_ = None
+        self.progress.emit(1)
+        # Only shown if still the current result, and on view
+        if result['spec'] is self._data_.get('fig') and self.parent().current_tool is self:
+            self.show_figure(result['spec'], result['fig'])
+
+    def figure_error(self, error):
+        self._rendering_figure_ = None
+        self.progress.emit(1.0)
+        self.status.emit('error')
+        logging.error('%s: failed to draw figure\n%s' % (self.name, error[2]))
+
+    def show_figure(self, spec, fig):
+        '''
+        Attach a drawn figure to the view; on the GUI thread only.
+        '''
+        fig.set_size_inches(self.view.get_size_inches(fig.get_dpi()))
+        fig.set_tight_layout(False)
+        fig.tight_layout(pad=0.5, rect=[0.25, 0.10, 0.75, 0.90])
+        self.view.figure = fig
+        self.view.redraw()
+        self._shown_figure_ = spec
 
     def get_plotitem(self):
         return self.parent().spectraViewer.spectraViewer.plotItem
@@ -207,18 +432,80 @@ class ToolBase(QObject):
         if self.is_auto_runnable and self.current_status == 'ready' and self.config.get('auto_run_on_config_change'):
             self.run_manual()
 
-    def run(self, fn):
+    def result_key(self, fn, extra):
+        '''
+        Build a fingerprint for running `fn` in the current state: the fingerprints of
+        the input data it uses (standing in for the data), this tool's config, the size
+        and modification time of any files named in the config, the function's code,
+        paddle's code and library versions (see `cache.code_fingerprint`) and any extra
+        arguments. Returns None if the upstream data can't be fingerprinted.
+        '''
+        self._input_fingerprints_ = self.input_fingerprints()
+        if self._input_fingerprints_ is None:
+            return None
+        upstream = sorted(self._input_fingerprints_.items())
+
+        config = self.config.as_dict()
+        files = {}
+        for k, v in config.items():
+            if isinstance(v, str) and v and os.path.isfile(v):
+                st = os.stat(v)
+                files[k] = (os.path.abspath(v), st.st_size, st.st_mtime)
+
+        code = fn.__code__
+
+        h = hashlib.sha1()
+        h.update(repr((
+            upstream,
+            self.__class__.__name__,
+            fn.__module__,
+            fn.__name__,
+            code.co_code,
+            repr(code.co_consts),
+            cache.code_fingerprint(),
+            json.dumps(config, sort_keys=True, default=repr),
+            sorted(files.items()),
+            sorted((k, repr(v)) for k, v in extra.items()),
+        )).encode('utf-8'))
+        return h.hexdigest()
+
+    def run(self, fn, **extra):
         '''
         Run the target function, passing in the current spectra, and config settings (as dict)
         :param fn:
+        :param extra: additional keyword arguments passed through to the function
         :return:
         '''
         if self._worker_thread_lock_:
-            return False # Can't run
+            # Supersede the in-flight run: cancel it and run again (with the latest
+            # config) once it has stopped
+            self._worker_thread_.cancel()
+            self._rerun_ = (fn, extra)
+            return False
+
+        self._result_key_ = self.result_key(fn, extra)
+        if self._result_key_ is not None and self._result_key_ == self.fingerprint:
+            # The data this tool uses is unchanged upstream; its result still stands
+            logging.info('%s: inputs unchanged' % self.name)
+            self.progress.emit(1)
+            self.status.emit('complete')
+            self.complete.emit()
+            return True
 
         self.progress.emit(0)
         self.status.emit('active')
 
+        # Re-use a previous result for identical inputs, config and code
+        results = cache.get_results()
+        if self._result_key_ and results:
+            result = results.get(self._result_key_)
+            if result is not None:
+                logging.info('%s: using cached result' % self.name)
+                self._input_data_ = self.get_previous_data()
+                self.result(result)
+                self.complete.emit()
+                return True
+
         data = self.get_previous_data()
 
         self._worker_thread_lock_ = True
@@ -227,17 +514,25 @@ class ToolBase(QObject):
             'config': self.config.as_dict(),
             'progress_callback': self.progress.emit,
         }
+        # Passed by reference; tool functions must not modify their inputs in place
         if data:
-            kwargs.update(deepcopy(data))
+            kwargs.update(data)
+        kwargs.update(extra)
+        self._input_data_ = data
 
-        # Close any open figures; ensure new axes.
-        plt.close()
+        plt.close(self.view.figure)
 
-        self._worker_thread_ = Worker(fn = fn, **kwargs)
+        if settings.get('processes/enabled') and self.is_process_safe:
+            self._worker_thread_ = ProcessWorker(fn = fn, **kwargs)
+        else:
+            self._worker_thread_ = Worker(fn = fn, **kwargs)
 
         self._worker_thread_.signals.finished.connect(self.finished)
         self._worker_thread_.signals.result.connect(self.result)
         self._worker_thread_.signals.error.connect(self.error)
+        self._worker_thread_.signals.cancelled.connect(self.cancelled)
+        self._worker_thread_.signals.profile.connect(self.profile_callback)
+        self._cancelled_ = False
 
         self.parent().threadpool.start(self._worker_thread_)
 
@@ -251,17 +546,15 @@ class ToolBase(QObject):
 
 
     def result(self, result):
-
-        # Apply post-processing
-        if 'fig' in result and result['fig']:
-            fig = result['fig']
-            fig.set_size_inches(self.view.get_size_inches(fig.get_dpi()))
-            fig.set_tight_layout(False)
-            fig.tight_layout(pad=0.5, rect=[0.25, 0.10, 0.75, 0.90])
-            self.view.figure = fig
-            self.view.redraw()
+        memory.report(self.name, self._input_data_, result.get('data'))
+        self.output_fingerprints = self.get_output_fingerprints(result.get('data'))
+        self._input_data_ = None
 
         self.data = result
+        self.fingerprint = self._result_key_
+        if self._result_key_ and cache.get_results():
+            cache.get_results().put(self._result_key_, result)
+        self.update_memory_usage()
         self.plot()
 
         self.progress.emit(1)
@@ -270,9 +563,54 @@ class ToolBase(QObject):
     def finished(self):
         # Cleanup
         self._worker_thread_lock_ = False
-        self.complete.emit()
+
+        if self._rerun_:
+            # Superseded; restart (debounced) rather than signalling completion
+            self._rerun_timer_.start()
+
+        elif not self._cancelled_:
+            self.complete.emit()
+
+    def invalidate(self):
+        '''
+        Mark the result out of date, as a tool upstream is re-running. The result and
+        figure are kept: if the data this tool uses comes out unchanged, it stands
+        without re-running (see `run`); otherwise the next run replaces it.
+        '''
+        self.cancel()
+        if self.current_status in ('complete', 'active'):
+            self.progress.emit(0)
+            self.status.emit('stale')
+
+    def cancel(self):
+        '''
+        Cancel any in-flight or pending run of this tool.
+        '''
+        self._rerun_ = None
+        self._rerun_timer_.stop()
+        if self._worker_thread_lock_ and self._worker_thread_:
+            self._worker_thread_.cancel()
+
+    def cancelled(self):
+        self._cancelled_ = True
+        self.progress.emit(0)
+        self.status.emit('ready')
+        logging.info('%s: run cancelled' % self.name)
+
+    def rerun(self):
+        if self._rerun_:
+            fn, extra = self._rerun_
+            self._rerun_ = None
+            self.run(fn, **extra)
 
 
+    def profile_callback(self, profile):
+        profile['function'] = profile['name']
+        profile['name'] = self.name
+        self.profile = profile
+        instrument.add(profile)
+        self.profiled.emit(profile)
+
     def progress_callback(self, progress):
         self.current_progress = progress
         self.item.setData(Qt.UserRole + 2, progress)
@@ -280,3 +618,120 @@ class ToolBase(QObject):
     def status_callback(self, status):
         self.current_status = status
         self.item.setData(Qt.UserRole + 3, status)
+
+
+class ThresholdTool(ToolBase):
+    '''
+    Tool filtering rows by a score threshold (config key `threshold`), whose function
+    keeps a `process.ThresholdIndex` of the scores with its result ('threshold_index').
+
+    A change of threshold alone is applied to the input using the index, on the GUI
+    thread, rather than re-running the tool (see `refilter`).
+    '''
+
+    # Config key of the threshold applied with the index
+    threshold = None
+
+    def run_manual(self):
+        if not self.refilter():
+            super(ThresholdTool, self).run_manual()
+
+    def can_refilter(self):
+        '''
+        Whether the index from the last run still applies, given the current config.
+        '''
+        return True
+
+    def refiltered(self, data, index):
+        '''
+        Return the result of applying the current threshold to input `data` with `index`.
+        '''
+        df = index.subset(data['df'], self.config.get(self.threshold))
+        return {'data': dict(data, df=df), 'fig': self._data_['fig'], 'threshold_index': index}
+
+    def refilter(self):
+        '''
+        Apply the current threshold to the input using the index from the last run, on
+        the GUI thread. Only possible if the tool is complete and its input is unchanged
+        since; returns False otherwise, for a full run.
+        '''
+        index = self._data_.get('threshold_index')
+        if index is None or self.current_status != 'complete' or self._worker_thread_lock_:
+            return False
+
+        if not self.can_refilter():
+            return False
+
+        inputs = self._input_fingerprints_
+        key = self.result_key(getattr(self, self.function), self.function_args(self.parent().dataset))
+        if key is None or key == self.fingerprint or self._input_fingerprints_ != inputs:
+            # Nothing to do, or the input has changed
+            return False
+
+        data = self.get_previous_data()
+        self.status.emit('active')
+
+        self._result_key_ = key
+        self._input_data_ = data
+        self.result(self.refiltered(data, index))
+        self.complete.emit()
+        return True
+
+
+class ThresholdConfigPanel(ConfigPanel):
+    '''
+    Config panel of a `ThresholdTool`, showing how many rows the threshold keeps: a
+    label, and a plot of rows retained against threshold from the index kept by the
+    last run. Both are redrawn as the threshold changes, without re-running the tool.
+    Call `add_sweep` once the panel's controls are laid out.
+    '''
+
+    # What the rows are, for the retained label
+    rows_label = 'rows'
+
+    def add_sweep(self, grid, row):
+        '''
+        Add the retained label to row `row` of `grid`, and the plot to the panel.
+        '''
+        self.retained = QLabel()
+        grid.addWidget(self.retained, row, 0, 1, 2)
+
+        self.figure = Figure(figsize=(3, 1.2), dpi=72)
+        self.ax = self.figure.add_subplot(111)
+        self.canvas = FigureCanvas(self.figure)
+        self.canvas.setFixedSize(300, 120)
+        self.layout.addWidget(self.canvas)
+
+        self.config.updated.connect(self.update_sweep)
+        self.tool.status.connect(self.update_sweep)
+
+    def plot_sweep(self, index, threshold):
+        '''
+        Plot rows retained against threshold into `self.ax`: by default a step at each
+        distinct score, up to the threshold if above them. Override for a fixed scale.
+        '''
+        scores = np.unique(index.values)
+        if not len(scores):
+            return
+        # Rows with a score above the previous one pass thresholds up to the next
+        self.ax.step(scores, index.counts(scores), where='pre', color='k', lw=1)
+        self.ax.set_xlim(scores[0], max(scores[-1], threshold))
+
+    def update_sweep(self, *args):
+        index = self.tool._data_.get('threshold_index')
+        threshold = self.config.get(self.tool.threshold)
+
+        self.ax.clear()
+        if index is None:
+            self.retained.setText('')
+            self.canvas.draw_idle()
+            return
+
+        self.retained.setText('%d of %d %s retained' % (index.count(threshold), index.n, self.rows_label))
+
+        self.plot_sweep(index, threshold)
+        self.ax.axvline(threshold, color='r', lw=1)
+        self.ax.set_ylim(0, max(index.n, 1))
+        self.ax.tick_params(labelsize=7)
+        self.figure.subplots_adjust(left=0.2, right=0.95, bottom=0.2, top=0.95)
+        self.canvas.draw_idle()
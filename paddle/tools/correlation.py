@@ -1,4 +1,6 @@
 from .base import ToolBase
+from .. import plots
+from .. import process
 from ..ui import ConfigPanel, QFolderLineEdit, QFileOpenLineEdit
 from ..globals import settings
 from ..qt import *
@@ -55,41 +57,46 @@ class Correlation(ToolBase):
 
     shortname = 'correlation'
 
+    inputs = ('imputation',)
+    outputs = ('df', 'design', 'quantification_type', 'groups')
+
+    function = 'correlation'
+
     is_manual_runnable = False
     is_auto_runnable = True
     is_auto_rerunnable = False
     is_disableable = False
 
+    defaults = {
+        'vmin': 0.0,
+        'labels': 'Group',
+        'correlation_levels': ['Group','Replicate'],
+        'show_scatter': False,
+    }
+
     def __init__(self, *args, **kwargs):
         super(Correlation, self).__init__(*args, **kwargs)
 
-        self.config.set_defaults({
-            'vmin': 0.0,
-            'labels': 'Group',
-            'correlation_levels': ['Group','Replicate'],
-            'show_scatter': False,
-        })
-
         self.addConfigPanel(CorrelationConfig)
         self.addButtonBar(self.defaultButtons())
 
-    def run_manual(self):
-        self.run( self.correlation )
-
     @staticmethod
-    def correlation(df, config, progress_callback, **kwargs):
+    def correlation(df, config, progress_callback, groups=None, **kwargs):
         import padua
-        import numpy as np
 
-        dfm = df.copy()
-        dfm = dfm.median(axis=1, level=config['correlation_levels'])
+        if groups is None or not groups.matches(df):
+            groups = process.GroupIndex(df.columns)
+
+        dfm = groups.groups(config['correlation_levels']).reduce(df, 'median')
+
+        progress_callback(0.5)
 
         labels = config['labels'] if config['labels'] and dfm.shape[1] < 50 else None
 
-        fig = padua.visualize.correlation(dfm,
-                                          show_scatter=config['show_scatter'],
-                                          labels=labels,
-                                          vmin=config['vmin'],
-                                          vmax=1)
+        fig = plots.LazyFigure(padua.visualize.correlation, dfm,
+                               show_scatter=config['show_scatter'],
+                               labels=labels,
+                               vmin=config['vmin'],
+                               vmax=1)
 
-        return {'data': {'df': df, **kwargs}, 'fig': fig}
+        return {'data': {'df': df, 'groups': groups, **kwargs}, 'fig': fig}
@@ -3,6 +3,8 @@ from ..ui import ConfigPanel, QFolderLineEdit, QFileOpenLineEdit
 from ..globals import settings
 from ..qt import *
 from .. import utils
+from .. import process
+from ..schema import ColumnSchema
 import padua
 
 class DesignConfig(ConfigPanel):
@@ -36,38 +38,44 @@ class Design(ToolBase):
 
     shortname = 'design'
 
+    inputs = ('quantification',)
+    outputs = ('df', 'design', 'quantification_type', 'groups')
+
+    function = 'design'
+
     is_manual_runnable = True
     is_auto_runnable = False
     is_auto_rerunnable = False
     is_disableable = False
 
+    defaults = {
+        'filename_design': "",
+    }
+
     def __init__(self, *args, **kwargs):
         super(Design, self).__init__(*args, **kwargs)
 
-        self.config.set_defaults({
-            'filename_design': "",
-        })
-
         self.addConfigPanel(DesignConfig)
         self.addButtonBar(self.defaultButtons())
 
 
-    def run_manual(self):
-        self.run( self.design )
-
     @staticmethod
-    def design(config, progress_callback, df=None, quantification_type="Intensity "):
+    def design(config, progress_callback, df=None, quantification_type="Intensity ", schema=None):
         import matplotlib.pyplot as plt
-        import padua
         import pandas as pd
 
+        # Sample names of the quantification columns, from the schema built at import
+        if df is not None:
+            if schema is None or not schema.matches(df):
+                schema = ColumnSchema(df.columns)
+            ls = schema.sample_names()
+
         # TODO: If no design file specified, build an 'automatic' design, assigning each sample to a different group
 
         if config['filename_design']:
             design = pd.read_csv(config['filename_design'])
 
         elif df is not None:
-            ls = [l.replace('%s ' % quantification_type, '') for l in df.columns.values]
             design = pd.DataFrame([(l,l,n) for n, l in enumerate(ls)], columns=["Label", "Group","Replicate"])
 
         else:
@@ -75,10 +83,9 @@ class Design(ToolBase):
             design = None
 
         if design is not None and df is not None:
-            df = df.copy()
-            df = padua.process.build_index_from_design(df, design, remove=['%s ' % quantification_type])
+            df = process.index_by_design(df, ls, design)
 
-            if 'REMOVE' in df.columns.get_level_values(0):
-                df = df.drop(('REMOVE',), axis=1)
+        # Design levels of the columns, indexed once for the tools grouping by them
+        groups = process.GroupIndex(df.columns) if design is not None and df is not None else None
 
-        return {'data': {'df': df, 'design': design, 'quantification_type': quantification_type}}
+        return {'data': {'df': df, 'design': design, 'quantification_type': quantification_type, 'groups': groups}}
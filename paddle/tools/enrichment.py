@@ -1,8 +1,11 @@
 from .base import ToolBase
+from .. import plots
+from .. import process
 from ..ui import ConfigPanel, QFolderLineEdit, QFileOpenLineEdit
 from ..globals import settings
 from ..qt import *
 from .. import utils
+from ..schema import ColumnSchema
 import padua
 
 LEVELS = ["Group", "Replicate", "Technical", "Timepoint"]
@@ -47,26 +50,30 @@ class Enrichment(ToolBase):
 
     shortname = 'enrichment'
 
+    inputs = ('design',)
+    outputs = ()
+    uses = ('design',)
+
+    function = 'enrichment'
+    requires = ('filename_msp',)
+
     is_manual_runnable = True
     is_auto_runnable = False
     is_auto_rerunnable = False
     is_disableable = False
 
+    defaults = {
+        'filename_msp': "",
+        'enrichment_prob': 0.75,
+        'enrichment_levels': ['Group']
+    }
+
     def __init__(self, *args, **kwargs):
         super(Enrichment, self).__init__(*args, **kwargs)
 
-        self.config.set_defaults({
-            'filename_msp': "",
-            'enrichment_prob': 0.75,
-            'enrichment_levels': ['Group']
-        })
-
         self.addConfigPanel(EnrichmentConfig)
         self.addButtonBar(self.defaultButtons())
 
-    def run_manual(self):
-        self.run( self.enrichment )
-
     @staticmethod
     def enrichment(config, progress_callback, design=None, **kwargs):
         import padua
@@ -75,16 +82,16 @@ class Enrichment(ToolBase):
         df_msp = padua.io.read_maxquant(config['filename_msp'])
         dfr = padua.analysis.enrichment_from_msp(df_msp)
 
+        progress_callback(0.5)
+
         if design is not None:
-            print("!!", dfr, design, "!!")
-            dfr = padua.process.build_index_from_design(dfr, design, remove=["Intensity "])
-            print("OK?")
-            if 'REMOVE' in dfr.columns.get_level_values(0):
-                dfr = dfr.drop(('REMOVE',), axis=1)
+            dfr = process.index_by_design(dfr, ColumnSchema(dfr.columns).sample_names(), design)
 
-            fig = padua.visualize.enrichment( dfr.median(axis=1, level=config['enrichment_levels']) )[0].figure
+            dfr = process.GroupIndex(dfr.columns).groups(config['enrichment_levels']).reduce(dfr, 'median')
 
         else:
-            fig = padua.visualize.enrichment( pd.DataFrame(dfr.mean(axis=1)) )[0].figure
+            dfr = pd.DataFrame(dfr.mean(axis=1))
+
+        fig = plots.LazyFigure(padua.visualize.enrichment, dfr)
 
         return {'data': None, 'fig': fig}
@@ -1,13 +1,17 @@
-from .base import ToolBase
+from .base import ThresholdTool, ThresholdConfigPanel
+from .. import plots
+from .. import process
 from ..ui import ConfigPanel, QFolderLineEdit, QFileOpenLineEdit
 from ..globals import settings
 from ..qt import *
 from .. import utils
 import padua
 
+import numpy as np
+
 LEVELS = ["Group", "Replicate", "Technical", "Timepoint"]
 
-class FilterConfig(ConfigPanel):
+class FilterConfig(ThresholdConfigPanel):
 
     def __init__(self, parent, *args, **kwargs):
         super(FilterConfig, self).__init__(parent, *args, **kwargs)
@@ -30,16 +34,22 @@ class FilterConfig(ConfigPanel):
         gd.addWidget(filter_n, 1, 1)
         self.config.add_handler('filter_n', filter_n)
 
-
-
         gb.setLayout(gd)
         self.layout.addWidget(gb)
 
+        self.add_sweep(gd, 2)
+
         self.finalise()
 
+    def plot_sweep(self, index, n):
+        # Up to the most valid values in any group
+        ns = np.arange(int(index.values[-1]) + 2 if len(index.values) else 2)
+        self.ax.step(ns, index.counts(ns), where='mid', color='k', lw=1)
+        self.ax.set_xlim(0, max(ns[-1], n))
 
 
-class Filter(ToolBase):
+
+class Filter(ThresholdTool):
 
     name = "Filter valid values"
     description = "Filter N valid values"
@@ -47,38 +57,55 @@ class Filter(ToolBase):
 
     shortname = 'filter'
 
+    inputs = ('design',)
+    outputs = ('df', 'design', 'quantification_type', 'groups')
+
+    function = 'filter'
+    threshold = 'filter_n'
+
     is_manual_runnable = True
     is_auto_runnable = False
     is_auto_rerunnable = False
     is_disableable = False
 
+    defaults = {
+        'filter_n': 1,
+        'filter_levels': ['Group','Replicate'],
+    }
+
     def __init__(self, *args, **kwargs):
         super(Filter, self).__init__(*args, **kwargs)
 
-        self.config.set_defaults({
-            'filter_n': 1,
-            'filter_levels': ['Group','Replicate'],
-        })
-
         self.addConfigPanel(FilterConfig)
         self.addButtonBar(self.defaultButtons())
 
-    def run_manual(self):
-        self.run( self.filter )
-
     @staticmethod
-    def filter(df, config, progress_callback, **kwargs):
+    def filter(df, config, progress_callback, groups=None, **kwargs):
         import padua
-        import numpy as np
 
-        df = df.copy()
-        dfn = df.copy()
+        if groups is None or not groups.matches(df):
+            groups = process.GroupIndex(df.columns)
+
+        # Most valid values in any group, for each row; rows are kept with at least n.
+        # Indexed and kept with the result so other n can be applied without a re-run
+        # (see `ThresholdTool`)
+        counts = groups.groups(config['filter_levels']).reduce(df, 'count')
+        index = process.ThresholdIndex(counts.to_numpy().max(axis=1, initial=0))
+
+        dfn = df
+        df = index.subset(df, config['filter_n'])
+
+        fig = plots.LazyFigure(padua.visualize.venn, dfn, df, labels=["Total","Remaining"])
 
-        df = padua.filters.minimum_valid_values_in_any_group(df,
-                                                             levels=config['filter_levels'],
-                                                             n=config['filter_n'],
-                                                             invalid=np.nan)
+        return {'data': {'df': df, 'groups': groups, **kwargs}, 'fig': fig,
+                'threshold_index': index, 'filter_levels': list(config['filter_levels'])}
 
-        fig = padua.visualize.venn(dfn, df, labels=["Total","Remaining"]).figure
+    def can_refilter(self):
+        # The index counts valid values per group of the levels it was built with
+        return self._data_.get('filter_levels') == list(self.config.get('filter_levels'))
 
-        return {'data': {'df': df, **kwargs}, 'fig': fig}
+    def refiltered(self, data, index):
+        df = index.subset(data['df'], self.config.get('filter_n'))
+        fig = plots.LazyFigure(padua.visualize.venn, data['df'], df, labels=["Total","Remaining"])
+        return {'data': dict(data, df=df, groups=self._data_['data']['groups']), 'fig': fig,
+                'threshold_index': index, 'filter_levels': self._data_['filter_levels']}
@@ -1,10 +1,37 @@
 from .base import ToolBase
+from .. import plots
 from ..ui import ConfigPanel, QFolderLineEdit, QFileOpenLineEdit
 from ..globals import settings
 from ..qt import *
+import logging
 from .. import utils
+from .. import io
+from .. import cache
+from .. import process
+from ..schema import ColumnSchema
 import padua
 
+def plot_quality_filters(total, removed, remaining):
+    '''
+    Bar chart of total rows, rows removed by each quality filter and rows remaining.
+    '''
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(8, 4))
+    ax = fig.add_subplot(1, 1, 1)
+    labels = ['Total'] + ['%s (removed)' % c for c in removed.keys()] + ['Remaining']
+    values = [total] + list(removed.values()) + [remaining]
+    ax.barh(range(len(values)), values, color=['#1f77b4'] + ['#d62728'] * len(removed) + ['#2ca02c'])
+    ax.set_yticks(range(len(values)))
+    ax.set_yticklabels(labels)
+    ax.invert_yaxis()
+    ax.set_xlabel('Rows')
+    for n, v in enumerate(values):
+        ax.text(v, n, ' %d' % v, va='center')
+
+    return fig
+
+
 class ImportDataConfig(ConfigPanel):
 
 
@@ -53,6 +80,17 @@ class ImportDataConfig(ConfigPanel):
         gb.setLayout(gd)
         self.layout.addWidget(gb)
 
+        gb = QGroupBox('Storage')
+        gd = QGridLayout()
+
+        float32 = QCheckBox('Store values as float32?')
+        float32.setToolTip('Store quantification values in single precision, halving memory use')
+        self.config.add_handler('float32', float32)
+        gd.addWidget(float32, 0, 0)
+
+        gb.setLayout(gd)
+        self.layout.addWidget(gb)
+
         self.finalise()
 
 
@@ -65,23 +103,30 @@ class ImportData(ToolBase):
 
     shortname = 'import'
 
+    inputs = ()
+    outputs = ('df', 'schema')
+
+    function = 'load_data'
+
     is_manual_runnable = True
     is_auto_runnable = False
     is_auto_rerunnable = False
     is_disableable = False
 
+    defaults = {
+        'filename': '',
+        # Filters
+        'remove_identified_by_site': True,
+        'remove_potential_contaminants': True,
+        'remove_contaminants': True,
+        'remove_reverse': True,
+        # Storage
+        'float32': True,
+    }
+
     def __init__(self, *args, **kwargs):
         super(ImportData, self).__init__(*args, **kwargs)
 
-        self.config.set_defaults({
-            'filename': '',
-            # Filters
-            'remove_identified_by_site': True,
-            'remove_potential_contaminants': True,
-            'remove_contaminants': True,
-            'remove_reverse': True,
-        })
-
         self.addConfigPanel(ImportDataConfig)
         self.addButtonBar(self.defaultButtons())
 
@@ -90,29 +135,55 @@ class ImportData(ToolBase):
         super(ImportData, self).result(*args, **kwargs)
 
     def run_manual(self):
-        self.run( self.load_data )
+        # Classify from the header first, so the tools can be set up before the full parse
+        if self.config.get('filename'):
+            self.parent().set_dataset(io.sniff_maxquant(self.config.get('filename')))
+
+        super(ImportData, self).run_manual()
 
     @staticmethod
     def load_data(config, progress_callback, **kwargs):
-        from matplotlib.pyplot import Figure
-        import padua
         # data is None here
         fn = config['filename']
 
-        df = padua.io.read_maxquant(fn)
+        # Re-use a previous parse of this file if unchanged
+        data_cache = cache.get_cache()
+        df = None
+        if data_cache:
+            key = data_cache.key(fn, 'maxquant', io.maxquant_columns(io.read_header(fn)), config['float32'])
+            df = data_cache.get(key)
+
+        if df is None:
+            # Stream only the columns used by the tools; parsing is the bulk of the work (0-80%)
+            df = io.read_maxquant(fn, float32=config['float32'],
+                                  progress_callback=lambda p: progress_callback(p * 0.8))
+
+            # Compact before caching, so cached copies are compact too
+            df, saved = process.compact_dtypes(df, flags=io.MAXQUANT_FLAGS, float32=config['float32'])
+            logging.info('Compacted data types, saving %.1f MB (now %.1f MB)' % (
+                saved / 1024. ** 2, df.memory_usage(deep=True).sum() / 1024. ** 2))
+
+            if data_cache:
+                data_cache.put(key, df)
 
-        fig = padua.visualize.quality_control(df).figure
+        progress_callback(0.8)
 
-        if config['remove_reverse'] and 'Reverse' in df.columns:
-            df = padua.filters.remove_reverse(df)
+        # Quality filters applied as a single mask; maps config option to flag column
+        filters = [
+            ('remove_reverse', 'Reverse'),
+            ('remove_identified_by_site', 'Only identified by site'),
+            ('remove_potential_contaminants', 'Potential contaminant'),
+            ('remove_contaminants', 'Contaminant'),
+        ]
+        total = df.shape[0]
+        df, removed = process.quality_filter(df, [c for k, c in filters if config[k]])
+        logging.info('Quality filters removed %d of %d rows: %s' % (total - df.shape[0], total, dict(removed)))
 
-        if config['remove_identified_by_site'] and 'Only identified by site' in df.columns:
-            df = padua.filters.remove_only_identified_by_site(df)
+        fig = plots.LazyFigure(plot_quality_filters, total, removed, df.shape[0])
 
-        if config['remove_potential_contaminants'] and 'Potential contaminant' in df.columns:
-            df = padua.filters.remove_potential_contaminants(df)
+        # Column roles are parsed once here; downstream tools select columns by position
+        schema = ColumnSchema(df.columns)
 
-        if config['remove_contaminants'] and 'Contaminant' in df.columns:
-            df = padua.filters.remove_contaminants(df)
+        progress_callback(1.0)
 
-        return {'data': {'df': df}, 'fig': fig}
+        return {'data': {'df': df, 'schema': schema}, 'fig': fig}
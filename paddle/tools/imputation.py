@@ -0,0 +1,177 @@
+from .base import ToolBase
+from .. import plots
+from .. import process
+from .. import impute
+from .. import normalization
+from ..ui import ConfigPanel, QFolderLineEdit, QFileOpenLineEdit
+from ..globals import settings
+from ..qt import *
+from .. import utils
+import logging
+
+# Imputation methods offered, from the registry (see impute.py)
+IMPUTE = {'None': None}
+IMPUTE.update((m.label, m.name) for m in impute.METHODS.values())
+
+
+def plot_imputation(measured, imputed, edges):
+    '''
+    Histogram of the measured values with the imputed values stacked on top.
+
+    :param measured: counts of measured values in each bin
+    :param imputed: counts of imputed values in each bin
+    :param edges: bin edges
+    '''
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(12,4))
+    ax = fig.add_subplot(1,1,1)
+    ax.hist([edges[:-1], edges[:-1]], bins=edges, weights=[measured, imputed],
+            stacked=True, color=['lightgrey', 'tomato'], label=['Measured', 'Imputed'])
+    ax.legend(fontsize=8, loc='upper right')
+
+    return fig
+
+
+class ImputationConfig(ConfigPanel):
+
+    def __init__(self, parent, *args, **kwargs):
+        super(ImputationConfig, self).__init__(parent, *args, **kwargs)
+
+        self.v = parent
+        gb = QGroupBox('Imputation')
+        gd = QGridLayout()
+
+        method = QComboBox()
+        method.addItems(IMPUTE)
+        method.setToolTip('Select method to replace missing values with')
+        self.config.add_handler('imputation', method, mapper=IMPUTE)
+        gd.addWidget(QLabel('Imputation method'), 0, 0)
+        gd.addWidget(method, 0, 1)
+
+        width = QDoubleSpinBox()
+        width.setRange(0, 2)
+        width.setSingleStep(0.05)
+        width.setToolTip('Width of the distribution drawn from, in standard deviations of the measured values')
+        self.config.add_handler('imputation_width', width)
+        gd.addWidget(QLabel('Width (Gaussian)'), 1, 0)
+        gd.addWidget(width, 1, 1)
+
+        shift = QDoubleSpinBox()
+        shift.setRange(0, 5)
+        shift.setSingleStep(0.1)
+        shift.setToolTip('Shift of the distribution drawn from below the mean, in standard deviations of the measured values')
+        self.config.add_handler('imputation_shift', shift)
+        gd.addWidget(QLabel('Down shift (Gaussian)'), 2, 0)
+        gd.addWidget(shift, 2, 1)
+
+        quantile = QDoubleSpinBox()
+        quantile.setRange(0, 0.5)
+        quantile.setDecimals(3)
+        quantile.setSingleStep(0.005)
+        quantile.setToolTip('Quantile of the measured values the distribution drawn from is centered on')
+        self.config.add_handler('imputation_quantile', quantile)
+        gd.addWidget(QLabel('Quantile (MinProb)'), 1, 2)
+        gd.addWidget(quantile, 1, 3)
+
+        k = QSpinBox()
+        k.setRange(1, 100)
+        k.setToolTip('Number of nearest rows to average')
+        self.config.add_handler('imputation_k', k)
+        gd.addWidget(QLabel('Neighbours (kNN)'), 2, 2)
+        gd.addWidget(k, 2, 3)
+
+        seed = QSpinBox()
+        seed.setRange(0, 2 ** 31 - 1)
+        seed.setToolTip('Seed for random draws; the same seed gives the same imputed values')
+        self.config.add_handler('imputation_seed', seed)
+        gd.addWidget(QLabel('Random seed'), 0, 2)
+        gd.addWidget(seed, 0, 3)
+
+        gb.setLayout(gd)
+        self.layout.addWidget(gb)
+
+        self.finalise()
+
+
+
+class Imputation(ToolBase):
+
+    name = "Imputation"
+    description = "Replace missing values"
+    icon = 'imputation.png'
+
+    shortname = 'imputation'
+
+    inputs = ('filter',)
+    outputs = ('df', 'design', 'quantification_type', 'groups')
+
+    function = 'imputation'
+
+    is_manual_runnable = True
+    is_auto_runnable = True
+    is_auto_rerunnable = False
+    is_disableable = False
+
+    defaults = {
+        'imputation': None,  # Missing values are kept unless a method is chosen
+        'imputation_width': 0.3,
+        'imputation_shift': 1.8,
+        'imputation_quantile': 0.01,
+        'imputation_k': 10,
+        'imputation_seed': 0,
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(Imputation, self).__init__(*args, **kwargs)
+
+        self.addConfigPanel(ImputationConfig)
+        self.addButtonBar(self.defaultButtons())
+
+    @classmethod
+    def function_args(cls, dataset):
+        return {'threads': normalization.threads}
+
+    @staticmethod
+    def imputation(df, config, progress_callback, threads=None, **kwargs):
+        import numpy as np
+        import pandas as pd
+
+        method = config['imputation']
+        # Nothing to impute into a table without value columns
+        if method is None or not df.shape[1]:
+            return {'data': {'df': df, **kwargs}, 'fig': None}
+
+        # Imputed in place on a copy of the values, in their precision
+        values = process.value_block(df, range(df.shape[1]), np.result_type(*df.dtypes))
+        missing = np.isnan(values)
+
+        progress_callback(0.1)
+
+        options = {
+            'gaussian': {'width': config['imputation_width'], 'shift': config['imputation_shift']},
+            'minprob': {'quantile': config['imputation_quantile']},
+            'knn': {'k': config['imputation_k']},
+        }.get(method, {})
+        impute.impute(values, method, seed=config['imputation_seed'], threads=threads, **options)
+
+        progress_callback(0.8)
+
+        # Histograms of measured and imputed values on shared bins, a column at a time
+        edges = np.histogram_bin_edges([np.nanmin(values), np.nanmax(values)] if np.isfinite(values).any() else [], bins=50)
+        measured = np.zeros(len(edges) - 1, dtype=np.intp)
+        imputed = np.zeros(len(edges) - 1, dtype=np.intp)
+        for c, m in zip(values.T, missing.T):
+            finite = np.isfinite(c)
+            measured += np.histogram(c[finite & ~m], bins=edges)[0]
+            imputed += np.histogram(c[finite & m], bins=edges)[0]
+
+        logging.info('Imputation: %d of %d values imputed' % (imputed.sum(), values.size))
+
+        df = pd.DataFrame(values, index=df.index, columns=df.columns, copy=False)
+
+        progress_callback(1.0)
+
+        fig = plots.LazyFigure(plot_imputation, measured, imputed, edges)
+
+        return {'data': {'df': df, **kwargs}, 'fig': fig}
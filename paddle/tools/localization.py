@@ -1,12 +1,20 @@
-from .base import ToolBase
+from .base import ThresholdTool, ThresholdConfigPanel
+from .. import plots
+from .. import process
 from ..ui import ConfigPanel, QFolderLineEdit, QFileOpenLineEdit
 from ..globals import settings
 from ..qt import *
 from .. import utils
 import padua
 
-class LocalizationConfig(ConfigPanel):
+import numpy as np
 
+# Thresholds at which the sites retained curve is drawn
+SWEEP_THRESHOLDS = np.linspace(0, 1, 101)
+
+class LocalizationConfig(ThresholdConfigPanel):
+
+    rows_label = 'sites'
 
     def __init__(self, parent, *args, **kwargs):
         super(LocalizationConfig, self).__init__(parent, *args, **kwargs)
@@ -17,7 +25,7 @@ class LocalizationConfig(ConfigPanel):
 
         localization_prob = QDoubleSpinBox()
         localization_prob.setRange(0,1)
-        localization_prob.setSingleStep (0.25)
+        localization_prob.setSingleStep (0.05)
         localization_prob.setToolTip('Select localization probability cut-off filter')
         self.config.add_handler('localization_prob', localization_prob)
         gd.addWidget(QLabel('Localization probability'), 0, 0)
@@ -26,11 +34,17 @@ class LocalizationConfig(ConfigPanel):
         gb.setLayout(gd)
         self.layout.addWidget(gb)
 
+        self.add_sweep(gd, 1)
+
         self.finalise()
 
+    def plot_sweep(self, index, threshold):
+        self.ax.plot(SWEEP_THRESHOLDS, index.counts(SWEEP_THRESHOLDS), color='k', lw=1)
+        self.ax.set_xlim(0, 1)
 
 
-class Localization(ToolBase):
+
+class Localization(ThresholdTool):
 
     name = "Localisation probability"
     description = "Filter poorly localized peptides"
@@ -38,31 +52,37 @@ class Localization(ToolBase):
 
     shortname = 'localization'
 
+    inputs = ('import',)
+    outputs = ('df', 'schema')
+
+    function = 'localization'
+    kinds = ('sites',)
+    threshold = 'localization_prob'
+
     is_manual_runnable = True
     is_auto_runnable = False
     is_auto_rerunnable = False
     is_disableable = False
 
+    defaults = {
+        'localization_prob': 0.75,
+    }
+
     def __init__(self, *args, **kwargs):
         super(Localization, self).__init__(*args, **kwargs)
 
-        self.config.set_defaults({
-            'localization_prob': 0.75,
-        })
-
         self.addConfigPanel(LocalizationConfig)
         self.addButtonBar(self.defaultButtons())
 
-    def run_manual(self):
-        self.run( self.localization )
-
     @staticmethod
-    def localization(df, config, progress_callback):
-        from matplotlib.pyplot import Figure
+    def localization(df, config, progress_callback, **kwargs):
         import padua
-        df = df.copy()
 
-        fig = padua.visualize.modificationlocalization(df).figure
-        df = padua.filters.filter_localization_probability(df, config.get('localization_prob'))
+        # Plotted from the unfiltered data
+        fig = plots.LazyFigure(padua.visualize.modificationlocalization, df)
+
+        # Kept with the result so other thresholds can be applied without a re-run (see `ThresholdTool`)
+        index = process.ThresholdIndex(df['Localization prob'].values)
+        df = index.subset(df, config.get('localization_prob'))
 
-        return {'data': {'df': df}, 'fig': fig}
+        return {'data': {'df': df, **kwargs}, 'fig': fig, 'threshold_index': index}
@@ -1,22 +1,119 @@
 from .base import ToolBase
+from .. import plots
+from .. import process
+from .. import normalization
+from ..schema import ColumnSchema, ANNOTATION, QUANTIFICATION as QUANTIFICATION_ROLE
 from ..ui import ConfigPanel, QFolderLineEdit, QFileOpenLineEdit
 from ..globals import settings
 from ..qt import *
 from .. import utils
 import padua
 
-NORMALIZE = {
-    'None': None,
-    'Subtract column median': 'subtract_column_median',
+# Normalization methods offered, from the registry (see normalization.py)
+NORMALIZE = {'None': None}
+NORMALIZE.update((m.label, m.name) for m in normalization.METHODS.values())
+
+PRECISION = {
+    'Single (float32)': 'float32',
+    'Double (float64)': 'float64',
 }
 
 QUANTIFICATION = [
-    'Ratio',
     'Intensity',
     'LFQ Intensity',
 ]
 
 
+# Rows binned at a time by `histogram`; bounds the temporary copies of the values
+HISTOGRAM_CHUNK_ROWS = 2 ** 16
+
+
+def _finite_chunks(v, chunk_rows):
+    # Finite values of a column, a chunk of rows at a time
+    import numpy as np
+
+    for i in range(0, len(v), chunk_rows):
+        c = v[i:i + chunk_rows]
+        yield c[np.isfinite(c)]
+
+
+def histogram(columns, samples=None, bins=25, chunk_rows=HISTOGRAM_CHUNK_ROWS):
+    '''
+    Histograms of the finite values in each sample, on shared bins.
+
+    Columns are binned a chunk of rows at a time, so memory use is bounded by the chunk
+    size rather than the table; pass views of the table's data (e.g. the columns of a
+    value block) to avoid copying. Counts summed over the samples are the histogram of
+    all the values, as `np.histogram` would give.
+
+    :param columns: sequence of 1-d arrays of values
+    :param samples: sample name of each column, to sum columns of the same sample (e.g.
+                    multiplicities); by default each column is a sample
+    :return: tuple of (counts, bin edges); counts is an array of shape (samples, bins),
+             with samples in order of first appearance
+    '''
+    import numpy as np
+
+    columns = list(columns)
+
+    # Bins span the finite values of all columns
+    lo, hi = np.inf, -np.inf
+    for v in columns:
+        for c in _finite_chunks(v, chunk_rows):
+            if c.size:
+                lo, hi = min(lo, c.min()), max(hi, c.max())
+
+    dtype = np.result_type(*columns) if columns else np.float64
+    edges = np.histogram_bin_edges(np.array([lo, hi] if lo <= hi else [], dtype=dtype), bins=bins)
+
+    if samples is None:
+        samples = range(len(columns))
+    rows = {}
+    for sample in samples:
+        rows.setdefault(sample, len(rows))
+
+    counts = np.zeros((len(rows), len(edges) - 1), dtype=np.intp)
+    for sample, v in zip(samples, columns):
+        for c in _finite_chunks(v, chunk_rows):
+            counts[rows[sample]] += np.histogram(c, bins=edges)[0]
+
+    return counts, edges
+
+
+def plot_histograms(raw, transformed, normalized, labels=None):
+    '''
+    Stacked histograms of the quantification values before and after transformation
+    and normalization; each a tuple of (counts, bin edges) from `histogram`. The
+    distribution of each sample is overlaid on that of all values.
+
+    :param labels: sample names, for the legend
+    '''
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    fig = plt.figure(figsize=(12,4))
+
+    for n, (counts, edges) in enumerate([raw, transformed, normalized]):
+        ax = fig.add_subplot(3,1,n+1)
+        ax.hist(edges[:-1], bins=edges, weights=counts.sum(axis=0), color='lightgrey')
+
+        if counts.shape[0] > 1:
+            centers = (edges[:-1] + edges[1:]) / 2
+            for c in counts:
+                ax.plot(centers, c, lw=0.75, alpha=0.75)
+
+        if n == 0:
+            ax.set_yscale("log", nonpositive='clip')
+
+            if labels and len(labels) <= 12:
+                ax.legend(labels, fontsize=6, ncol=2, loc='upper right')
+
+    xlim = np.max(np.abs(ax.get_xlim()))
+    ax.set_xlim(-xlim, xlim)
+
+    return fig
+
+
 class QuantificationConfig(ConfigPanel):
 
 
@@ -27,12 +124,12 @@ class QuantificationConfig(ConfigPanel):
         gb = QGroupBox("Quantification type")
         gd = QGridLayout()
 
-        quantification = QComboBox()
-        quantification.addItems(QUANTIFICATION)
-        quantification.setToolTip('Select quantification data type')
-        self.config.add_handler('quantification', quantification)
+        self.quantification = QComboBox()
+        self.quantification.addItems(QUANTIFICATION)
+        self.quantification.setToolTip('Select quantification data type')
+        self.config.add_handler('quantification', self.quantification)
         gd.addWidget(QLabel("Quantification type"), 0, 0)
-        gd.addWidget(quantification, 0, 1)
+        gd.addWidget(self.quantification, 0, 1)
 
         gb.setLayout(gd)
         self.layout.addWidget(gb)
@@ -47,16 +144,59 @@ class QuantificationConfig(ConfigPanel):
 
         normalization = QComboBox()
         normalization.addItems(NORMALIZE)
-        normalization.setToolTip('Select normalization to apply to data')
+        normalization.setToolTip('Select normalization to apply to data; variance stabilizing (arcsinh) replaces the log2 transformation')
         self.config.add_handler('normalization', normalization, mapper=NORMALIZE)
         gd.addWidget(QLabel("Normalisation type"), 1, 0)
         gd.addWidget(normalization, 1, 1)
 
+        self.reference = QComboBox()
+        self.reference.setToolTip('Sample other samples are scaled to, for reference sample scaling')
+        self.config.add_handler('normalization_reference', self.reference)
+        gd.addWidget(QLabel("Reference sample"), 3, 0)
+        gd.addWidget(self.reference, 3, 1)
+
+        precision = QComboBox()
+        precision.addItems(PRECISION)
+        precision.setToolTip('Floating point precision of the quantification values; single precision halves memory use')
+        self.config.add_handler('precision', precision, mapper=PRECISION)
+        gd.addWidget(QLabel("Precision"), 2, 0)
+        gd.addWidget(precision, 2, 1)
+
         gb.setLayout(gd)
         self.layout.addWidget(gb)
 
         self.finalise()
 
+    def setQuantificationTypes(self, types):
+        '''
+        Replace the available quantification types, keeping the current selection if still available.
+        '''
+        current = self.config.get('quantification')
+        if current not in types:
+            current = types[0]
+
+        self.quantification.blockSignals(True)
+        self.quantification.clear()
+        self.quantification.addItems(types)
+        self.quantification.setCurrentText(current)
+        self.quantification.blockSignals(False)
+        self.config.set('quantification', current)
+
+    def setSamples(self, samples):
+        '''
+        Replace the samples offered as the normalization reference, keeping the current selection if still available.
+        '''
+        current = self.config.get('normalization_reference')
+        if current not in samples:
+            current = samples[0]
+
+        self.reference.blockSignals(True)
+        self.reference.clear()
+        self.reference.addItems(samples)
+        self.reference.setCurrentText(current)
+        self.reference.blockSignals(False)
+        self.config.set('normalization_reference', current)
+
 
 
 class Quantification(ToolBase):
@@ -67,100 +207,116 @@ class Quantification(ToolBase):
 
     shortname = 'quantification'
 
+    inputs = ('localization',)
+    outputs = ('df', 'quantification_type', 'schema')
+
+    function = 'quantification'
+
     is_manual_runnable = True
     is_auto_runnable = False
     is_auto_rerunnable = False
     is_disableable = False
 
+    defaults = {
+        'quantification': 'Intensity',
+        'log2_transformation': True,
+        'normalization': 'subtract_column_median',
+        'precision': 'float32',
+        'normalization_reference': '',  # First sample if empty
+    }
+
     def __init__(self, *args, **kwargs):
         super(Quantification, self).__init__(*args, **kwargs)
 
-        self.config.set_defaults({
-            'quantification': 'Intensity',
-            'log2_transformation': True,
-            'normalization': 'subtract_column_median',
-        })
-
-        self.addConfigPanel(QuantificationConfig)
+        self.panel = self.addConfigPanel(QuantificationConfig)
         self.addButtonBar(self.defaultButtons())
 
-    def run_manual(self):
-        self.run( self.quantification )
+    def set_dataset(self, dataset):
+        # Only offer quantification types present in the data
+        if dataset['quantification']:
+            self.panel.setQuantificationTypes(dataset['quantification'])
+        if dataset['samples']:
+            self.panel.setSamples(dataset['samples'])
+
+    @classmethod
+    def function_args(cls, dataset):
+        return {'dataset': dataset, 'threads': normalization.threads}
 
     @staticmethod
-    def quantification(df, config, progress_callback):
-        import matplotlib.pyplot as plt
-        import padua
-        import pandas as pd
+    def quantification(df, config, progress_callback, dataset=None, schema=None, threads=None):
         import numpy as np
+        import pandas as pd
 
-        df = df.copy()
-
-        is_mod_data = any('___' in c for c in df.columns)
-        quantification = config['quantification']
-        data_filter = '^%s .*'  % quantification
-
-        if is_mod_data:
-            # Drop the non__N columns from mod data
-            # Drop columns without a space following the quantification word
-            dft = df.filter(regex='^(?!%s ).*$' % quantification)
-            dfi = df.filter(regex='^(%s ).*__\d$' % quantification)
+        if schema is None or not schema.matches(df):
+            schema = ColumnSchema(df.columns)
 
+        if dataset is not None:
+            is_mod_data = dataset['kind'] == 'sites'
         else:
-            # Drop columns without a space following the quantification word
-            dft = df.filter(regex='^(?!%s ).*$' % quantification)
-            dfi = df.filter(regex='^(%s ).*$' % quantification)
-
+            is_mod_data = any(schema.multiplicities)
+        quantification = config['quantification']
 
-        df = pd.concat([dft,dfi], axis=1)
+        # Per-sample columns of the selected quantification type; from mod data, only the
+        # ___N multiplicity columns. Other quantification columns of this type are dropped
+        quantified = schema.positions(QUANTIFICATION_ROLE, quantification)
+        keep = schema.positions(QUANTIFICATION_ROLE, quantification, multiplicity=True if is_mod_data else None)
+        df, schema = schema.select(df, np.concatenate([schema.exclude(quantified), keep]))
+        quantified = schema.positions(QUANTIFICATION_ROLE, quantification)
 
         progress_callback(0.1)
 
-        fig = plt.figure(figsize=(12,4))
-        ax = fig.add_subplot(3,1,1)
-
-        v = df.filter(regex=data_filter).values.flatten()
-        v = v[np.isfinite(v)]
-        ax.hist(v, bins=25)
-        ax.set_yscale("log", nonposy='clip')
+        # Histograms are computed here, but only drawn once the figure is shown
+        hist_raw = histogram((df.iloc[:, n].to_numpy() for n in quantified), schema.sample_names(quantified))
 
         progress_callback(0.2)
 
-        if config['log2_transformation']:
-            df = padua.process.transform_expression_columns(df, np.log2, prefix="%s " % quantification)
+        if is_mod_data:
+            df = process.expand_side_table(df)
+            # Multiplicities are folded into rows, so the columns are new
+            schema = ColumnSchema(df.columns)
+            quantified = schema.positions(QUANTIFICATION_ROLE, quantification)
 
         progress_callback(0.4)
 
-        if is_mod_data:
-            df = padua.process.expand_side_table(df)
+        # Values are copied once into a block of the chosen precision, then transformed
+        # and normalized in place (log2 is per value, so can follow the expansion)
+        values = process.value_block(df, quantified, config.get('precision', 'float32'))
+        samples = schema.sample_names(quantified)
+
+        # Methods transforming raw intensities themselves replace the log2 transformation
+        method = normalization.METHODS.get(config['normalization'])
+        log2 = config['log2_transformation'] and not (method and method.transforms)
+        if log2:
+            process.log2_transform(values)
 
         progress_callback(0.5)
 
-        ax = fig.add_subplot(3,1,2)
-        v = df.filter(regex=data_filter).values.flatten()
-        v = v[np.isfinite(v)]
-        ax.hist(v, bins=25)
+        hist_transformed = histogram(values.T, samples)
 
-        if config['normalization'] == 'subtract_column_median':
-            df = padua.normalization.subtract_column_median(df, prefix="%s " % quantification)
+        if method is not None:
+            reference = config.get('normalization_reference')
+            normalization.normalize(values, method.name, threads,
+                                    log=log2, reference=samples.index(reference) if reference in samples else 0)
 
         progress_callback(0.7)
 
-        ax = fig.add_subplot(3,1,3)
-        v = df.filter(regex=data_filter).values.flatten()
-        v = v[np.isfinite(v)]
-        ax.hist(v, bins=25)
-        xlim = np.max(np.abs(ax.get_xlim()))
-        ax.set_xlim(-xlim, xlim)
+        hist_normalized = histogram(values.T, samples)
 
         # Process data into columns, vs. index
         columns = ['Proteins','Protein IDs','Protein names','Gene names','Positions within proteins','Amino acid','Multiplicity','id']
-        df = df.filter(regex='^(%s .*|%s)$' % (quantification, '|'.join(columns)))
-        df.set_index([c for c in columns if c in df.columns.values], inplace=True)
+        annotation = [schema.columns[n] for n in schema.positions(ANNOTATION)]
+        index = df[[c for c in columns if c in annotation]]
+        index = index.set_index(list(index.columns)).index
+
+        df = pd.DataFrame(values, index=index, columns=[schema.columns[n] for n in quantified], copy=False)
+        schema = schema.subset(quantified)
 
         # Drop all complete-nan rows
         df.dropna(how='all', axis=0, inplace=True)
 
         progress_callback(1.0)
 
-        return {'data': {'df': df, 'quantification_type': quantification}, 'fig': fig}
+        fig = plots.LazyFigure(plot_histograms, hist_raw, hist_transformed, hist_normalized,
+                               labels=schema.sample_names())
+
+        return {'data': {'df': df, 'quantification_type': quantification, 'schema': schema}, 'fig': fig}
@@ -1,4 +1,5 @@
 from .base import ToolBase
+from .. import plots
 from ..ui import ConfigPanel, QFolderLineEdit, QFileOpenLineEdit
 from ..globals import settings
 from ..qt import *
@@ -33,32 +34,34 @@ class RankIntensity(ToolBase):
 
     shortname = 'rank_intensity'
 
+    inputs = ('localization',)
+    outputs = ('df',)
+    uses = ('df',)
+
+    function = 'rank_intensity'
+
     is_manual_runnable = True
     is_auto_runnable = False
     is_auto_rerunnable = False
     is_disableable = False
 
+    defaults = {
+        'show_go': False,
+        #'rank_intensity_prob': 0.75,
+    }
+
     def __init__(self, *args, **kwargs):
         super(RankIntensity, self).__init__(*args, **kwargs)
 
-        self.config.set_defaults({
-            'show_go': False,
-            #'rank_intensity_prob': 0.75,
-        })
-
         self.addConfigPanel(RankIntensityConfig)
         self.addButtonBar(self.defaultButtons())
 
-    def run_manual(self):
-        self.run( self.rank_intensity )
-
     @staticmethod
     def rank_intensity(df, config, progress_callback):
-        from matplotlib.pyplot import Figure
         import padua
-        # data is None here
-        df = df.copy()
 
-        fig = padua.visualize.rankintensity(df, show_go_enrichment=config['show_go'], progress_callback=progress_callback).figure
+        # The plot (with GO enrichment) is the slow part; it reports progress as it is drawn
+        fig = plots.LazyFigure(padua.visualize.rankintensity, df, show_go_enrichment=config['show_go'],
+                               progress=True)
 
         return {'data': {'df': df}, 'fig': fig}
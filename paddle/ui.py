@@ -14,6 +14,7 @@ from collections import OrderedDict
 
 from pyqtconfig import ConfigManager
 from . import utils
+from . import instrument
 
 from .globals import settings, STATUS_QCOLORS, custom_pyqtconfig_hooks
 
@@ -21,7 +22,6 @@ from .globals import settings, STATUS_QCOLORS, custom_pyqtconfig_hooks
 from .translate import tr
 
 from matplotlib.transforms import Bbox, Affine2D, TransformedBbox
-import matplotlib.tight_bbox as tight_bbox
 import io
 try:
     unicode
@@ -859,6 +859,7 @@ class ToolListDelegate(QAbstractItemDelegate):
 
         progress = index.data(Qt.UserRole+2)
         status = index.data(Qt.UserRole+3)
+        memory_usage = index.data(Qt.UserRole+4)
 
         text_color = QPalette().text().color()
 
@@ -902,6 +903,13 @@ class ToolListDelegate(QAbstractItemDelegate):
         r = option.rect.adjusted(40, 18, 0, 0)
         painter.drawText(r.left(), r.top(), r.width(), r.height(), Qt.AlignLeft, description)
 
+        # MEMORY USAGE
+        if memory_usage:
+            font.setPointSize(8)
+            painter.setFont(font)
+            r = option.rect.adjusted(40, 32, 0, 0)
+            painter.drawText(r.left(), r.top(), r.width(), r.height(), Qt.AlignLeft, memory_usage)
+
         painter.setRenderHint(QPainter.Antialiasing)
 
         status_r = QRectF(215, option.rect.y() + (option.rect.height()/2)-12.5, 25, 25)
@@ -922,7 +930,7 @@ class ToolListDelegate(QAbstractItemDelegate):
 
 
     def sizeHint(self, option, index):
-        return QSize(200, 40)
+        return QSize(200, 50)
 
 
 class ToolListWidget(QListWidget):
@@ -958,6 +966,49 @@ class ToolListWidget(QListWidget):
 
 
 
+class ProfilePanel(QTreeWidget):
+    '''
+    Table of tool run profiles (see instrument.py), most recent first: timings, memory
+    and data shapes, with the stages of each run between progress checkpoints below.
+    '''
+
+    columns = ['Tool', 'Status', 'Wall (s)', 'CPU (s)', 'Peak RSS (MB)', 'Peak traced (MB)', 'Input', 'Output']
+
+    def __init__(self, parent=None, **kwargs):
+        super(ProfilePanel, self).__init__(parent, **kwargs)
+
+        self.setColumnCount(len(self.columns))
+        self.setHeaderLabels(self.columns)
+        self.setAlternatingRowColors(True)
+
+    @staticmethod
+    def format_shapes(shapes):
+        return ', '.join('%s %s' % (k, ' x '.join(str(n) for n in v)) for k, v in sorted(shapes.items()))
+
+    @staticmethod
+    def format_mb(nbytes):
+        return '' if nbytes is None else '%.1f' % (nbytes / 1024. ** 2)
+
+    def addRecord(self, record):
+        item = QTreeWidgetItem([
+            record['name'],
+            record['status'],
+            '%.3f' % record['wall'],
+            '%.3f' % record['cpu'],
+            self.format_mb(record['peak_rss']),
+            self.format_mb(record['peak_traced']),
+            self.format_shapes(record['inputs']),
+            self.format_shapes(record['outputs']),
+        ])
+        if record['error']:
+            item.setToolTip(1, record['error'])
+
+        for label, start, duration in instrument.stage_intervals(record):
+            QTreeWidgetItem(item, [label, '', '%.3f' % duration])
+
+        self.insertTopLevelItem(0, item)
+
+
 class AnnotateClasses(GenericDialog):
 
     def __init__(self, parent, config=None, *args, **kwargs):
@@ -227,6 +227,25 @@ def mkdir_p(path):
             raise
 
 
+def enable_copy_on_write():
+    '''
+    Turn on pandas copy-on-write, for the whole process. Tools share their input data
+    rather than copying it; with copy-on-write pandas only materializes the columns a
+    tool actually modifies (pandas >= 1.5; always on from 3.0). Called once at startup
+    of the GUI, batch runs and pool processes.
+    '''
+    import logging
+    import warnings
+    import pandas as pd
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            pd.set_option('mode.copy_on_write', True)
+    except (AttributeError, KeyError):
+        logging.info('pandas copy-on-write unavailable; tool inputs are not copied')
+
+
 # http://stackoverflow.com/questions/377017/test-if-executable-exists-in-python
 def which(program):
     import os
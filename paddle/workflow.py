@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+'''
+Dependency graph between tools.
+
+Each tool declares the tools it takes data from as `inputs` (a tuple of shortnames) and
+the data keys it produces as `outputs`. Inactive tools are transparent: a tool taking
+input from an inactive tool takes it from that tool's inputs instead.
+
+These helpers work on anything with `shortname` and `inputs` attributes, so the same
+graph drives both the GUI (tool instances) and headless runs (tool classes). Whether a
+tool takes part is decided by the `is_active` callable passed in.
+'''
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading workflow.py')
+
+
+def _always(tool):
+    return True
+
+
+def resolve_inputs(tool, tools, is_active=_always):
+    '''
+    Return the active tools that `tool` takes data from, in declared order, skipping
+    through inactive tools to their own inputs.
+    '''
+    toolmap = {t.shortname: t for t in tools}
+
+    resolved = []
+    for name in tool.inputs:
+        t = toolmap.get(name)
+        if t is None:
+            continue
+        if is_active(t):
+            candidates = [t]
+        else:
+            candidates = resolve_inputs(t, tools, is_active)
+
+        for c in candidates:
+            if c not in resolved:
+                resolved.append(c)
+
+    return resolved
+
+
+def resolve(name, tools, is_active=_always):
+    '''
+    Return the active tool standing in for the tool with shortname `name`: the tool
+    itself if active, otherwise the last of the active tools it takes data from (see
+    `resolve_inputs`). None if there is no such tool.
+    '''
+    for t in tools:
+        if t.shortname == name:
+            if is_active(t):
+                return t
+            inputs = resolve_inputs(t, tools, is_active)
+            return inputs[-1] if inputs else None
+
+    return None
+
+
+def dependents(tool, tools, is_active=_always):
+    '''
+    Return the active tools that take data directly from `tool`.
+    '''
+    return [t for t in tools if t is not tool and is_active(t) and tool in resolve_inputs(t, tools, is_active)]
+
+
+def downstream(tool, tools, is_active=_always):
+    '''
+    Return all active tools that depend on `tool`, directly or indirectly, in tool order.
+    '''
+    found = set()
+    pending = [tool]
+    while pending:
+        for t in dependents(pending.pop(), tools, is_active):
+            if t not in found:
+                found.add(t)
+                pending.append(t)
+
+    return [t for t in tools if t in found]
+
+
+def order(tools, is_active=_always):
+    '''
+    Return the active tools sorted so every tool comes after its inputs. Tools that don't
+    depend on each other keep their relative order from `tools`.
+    '''
+    active = [t for t in tools if is_active(t)]
+
+    ordered = []
+    remaining = list(active)
+    while remaining:
+        for t in remaining:
+            if all(i in ordered for i in resolve_inputs(t, tools, is_active)):
+                ordered.append(t)
+                remaining.remove(t)
+                break
+        else:
+            raise ValueError('Tool dependencies contain a cycle: %s' % ', '.join(t.shortname for t in remaining))
+
+    return ordered
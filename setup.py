@@ -32,7 +32,10 @@ setup(
     entry_points={
         'gui_scripts': [
             'Paddle = paddle.paddle:main',
-        ]
+        ],
+        'console_scripts': [
+            'paddle-batch = paddle.batch:main',
+        ],
     },
 
     install_requires = [
@@ -45,6 +48,11 @@ setup(
             'padua',
             ],
 
+    extras_require = {
+            # Feather storage for the data cache and spilled tables; pickle otherwise
+            'cache': ['pyarrow'],
+            },
+
 
     keywords='bioinformatics data analysis proteomics research science',
     license='GPL',
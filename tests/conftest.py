@@ -0,0 +1,135 @@
+import os
+import sys
+
+# Run against the source tree, wherever pytest is started from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Qt widgets are created without a display
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import time
+
+import numpy as np
+import pytest
+
+
+def write_protein_groups(path, rows=40, samples=('A_1', 'A_2', 'B_1', 'B_2'), seed=0):
+    '''
+    Write a small proteinGroups.txt-like table: annotations, quality flags, unused
+    columns and per-sample intensities with some missing (zero) values.
+    '''
+    rng = np.random.default_rng(seed)
+    header = ['Protein IDs', 'Majority protein IDs', 'Proteins', 'Gene names', 'Score',
+              'Intensity'] + ['Intensity %s' % s for s in samples] + \
+             ['LFQ intensity %s' % s for s in samples] + \
+             ['Only identified by site', 'Reverse', 'Potential contaminant', 'id']
+
+    lines = ['\t'.join(header)]
+    for n in range(rows):
+        values = rng.lognormal(20, 2, size=len(samples))
+        values[rng.random(len(samples)) < 0.2] = 0
+        line = ['P%05d' % n, 'P%05d' % n, '1', 'GENE%d' % n, '%.3f' % rng.random(),
+                '%.0f' % values.sum()] + ['%.0f' % v for v in values] + ['%.0f' % v for v in values] + \
+               ['+' if n % 13 == 1 else '', '+' if n % 17 == 2 else '', '+' if n % 19 == 3 else '', str(n)]
+        lines.append('\t'.join(line))
+
+    with open(str(path), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return str(path)
+
+
+@pytest.fixture
+def protein_groups(tmp_path):
+    return write_protein_groups(tmp_path / 'proteinGroups.txt')
+
+
+@pytest.fixture
+def qapp():
+    '''
+    The Qt application; created here if paddle was imported headless (see
+    test_batch.py). Skips where PyQt5 or pyqtconfig are not installed.
+    '''
+    pytest.importorskip('PyQt5')
+    pytest.importorskip('pyqtconfig')
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def host(qapp):
+    '''
+    Stand-in for the main window tools are created in: the tools, a thread pool and
+    the data file summary. Tools are run by the tests, not started by each other.
+    '''
+    from paddle.qt import QWidget, QThreadPool, QListWidgetItem, QCoreApplication
+
+    class ThreadPool(QThreadPool):
+        # Counts the workers started, to tell runs from work done on the GUI thread
+
+        started = 0
+
+        def start(self, worker):
+            self.started += 1
+            super(ThreadPool, self).start(worker)
+
+    class Host(QWidget):
+
+        def __init__(self):
+            super(Host, self).__init__()
+            self.threadpool = ThreadPool()
+            self.tools = []
+            self.dataset = None
+            self.current_tool = None
+
+        def add(self, cls):
+            tool = cls(self)
+            tool.item = QListWidgetItem(tool.name)
+            self.tools.append(tool)
+            return tool
+
+        def wait(self, condition, timeout=10):
+            # Deliver signals from workers and fire timers until `condition()` holds
+            deadline = time.time() + timeout
+            while not condition():
+                assert time.time() < deadline, 'timed out waiting for tools'
+                QCoreApplication.processEvents()
+                time.sleep(0.005)
+            self.threadpool.waitForDone()
+            QCoreApplication.processEvents()
+
+    host = Host()
+    yield host
+    for tool in host.tools:
+        tool.cancel()
+    host.threadpool.waitForDone()
+
+
+@pytest.fixture
+def source(host):
+    '''
+    Return a function adding a tool to `host` with shortname `shortname`, outputting the
+    data given, and running it to completion. Re-run it with new data by `tool.feed`.
+    '''
+    from paddle.tools.base import ToolBase
+
+    def add_source(shortname, **data):
+
+        class Source(ToolBase):
+            name = 'Source'
+            function = 'source'
+            outputs = tuple(data)
+
+            @staticmethod
+            def source(config, progress_callback, **data):
+                return {'data': data}
+
+            def feed(self, **data):
+                self.run(self.source, **data)
+                host.wait(lambda: self.current_status == 'complete')
+
+        Source.shortname = shortname
+        tool = host.add(Source)
+        tool.feed(**data)
+        return tool
+
+    return add_source
@@ -0,0 +1,102 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip('PyQt5')
+pytest.importorskip('pyqtconfig')
+pytest.importorskip('padua')
+
+os.environ['PADDLE_HEADLESS'] = '1'
+
+from paddle import batch
+from paddle.tools import import_data, imputation, filter, quantification
+
+
+def write_configuration(path, tools):
+    with open(str(path), 'w') as f:
+        json.dump({'version': 0.1, 'tools': tools}, f)
+    return str(path)
+
+
+def test_old_configuration_takes_tool_defaults(tmp_path):
+    # Saved before the float32 and imputation settings existed
+    fn = write_configuration(tmp_path / 'old.paddle', {
+        'ImportData': {'filename': 'elsewhere.txt', 'remove_reverse': False},
+        'Filter': {'filter_n': 2},
+    })
+    configs = batch.tool_configs(batch.load_configuration(fn), 'proteinGroups.txt')
+
+    assert set(configs) == set(batch.TOOLS)
+    assert configs[import_data.ImportData]['filename'] == 'proteinGroups.txt'
+    assert configs[import_data.ImportData]['remove_reverse'] is False
+    assert configs[import_data.ImportData]['float32'] == import_data.ImportData.defaults['float32']
+    assert configs[filter.Filter]['filter_n'] == 2
+    assert configs[filter.Filter]['filter_levels'] == filter.Filter.defaults['filter_levels']
+    assert configs[imputation.Imputation]['imputation'] == imputation.Imputation.defaults['imputation']
+    assert configs[quantification.Quantification]['auto_run_on_config_change'] is True
+
+
+def test_tool_configs_are_independent():
+    configs = batch.tool_configs({}, 'a.txt')
+    configs[filter.Filter]['filter_levels'].append('Other')
+
+    assert 'Other' not in batch.tool_configs({}, 'a.txt')[filter.Filter]['filter_levels']
+
+
+def test_output_names(tmp_path):
+    assert batch.output_names(['x/a.txt', 'x/b.txt']) == ['a', 'b']
+    assert batch.output_names([os.path.join('s1', 'txt', 'proteinGroups.txt'),
+                               os.path.join('s2', 'txt', 'proteinGroups.txt')]) == \
+        ['s1_txt_proteinGroups', 's2_txt_proteinGroups']
+
+
+def test_process_task(tmp_path, protein_groups):
+    configuration = batch.load_configuration(write_configuration(tmp_path / 'old.paddle', {}))
+    output = str(tmp_path / 'results')
+
+    summary = batch.process_task(configuration, 'proteinGroups', protein_groups, output, figures=False)
+
+    assert summary['status'] == 'ok', summary.get('error')
+    assert summary['kind'] == 'proteins'
+    assert summary['samples'] == 4
+    assert os.path.exists(os.path.join(output, 'import.csv'))
+    assert os.path.exists(os.path.join(output, 'trace.json'))
+
+
+def test_main_processes_folders_in_parallel(tmp_path, monkeypatch):
+    import pandas as pd
+    from conftest import write_protein_groups
+
+    for search in ('search_a', 'search_b'):
+        (tmp_path / search / 'txt').mkdir(parents=True)
+        write_protein_groups(tmp_path / search / 'txt' / 'proteinGroups.txt')
+    configuration = write_configuration(tmp_path / 'analysis.paddle', {})
+    output = str(tmp_path / 'results')
+    monkeypatch.delenv('OMP_NUM_THREADS', raising=False)
+    # Restored afterwards for other users of the pool
+    monkeypatch.setattr(batch.pool, '_max_workers', batch.pool._max_workers)
+    monkeypatch.setattr(batch.pool, '_cache_args', batch.pool._cache_args)
+
+    # The same file twice, by a folder and by name. main turns on copy-on-write for the
+    # process, so restore it for other tests
+    with pd.option_context('mode.copy_on_write', pd.get_option('mode.copy_on_write')):
+        assert batch.main([configuration, str(tmp_path), str(tmp_path / 'search_a' / 'txt' / 'proteinGroups.txt'),
+                           '-o', output, '-j', '4', '--no-figures', '--no-cache']) == 0
+
+    summary = pd.read_csv(os.path.join(output, 'summary.csv'))
+    assert list(summary['name']) == ['search_a_txt_proteinGroups', 'search_b_txt_proteinGroups']
+    assert list(summary['status']) == ['ok', 'ok']
+    for name in summary['name']:
+        assert os.path.exists(os.path.join(output, name, 'import.csv'))
+    # Two files, so two processes, each with one numerical thread
+    assert batch.pool._max_workers == 2
+    assert os.environ['OMP_NUM_THREADS'] == '1'
+
+
+def test_processed_data_from_final_tool():
+    # Save processed data in the GUI takes the imputation output, not the filter's
+    from paddle import workflow
+
+    assert workflow.resolve('imputation', batch.TOOLS) is imputation.Imputation
+    assert workflow.resolve('imputation', batch.TOOLS, lambda t: t is not imputation.Imputation) is filter.Filter
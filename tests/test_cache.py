@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from paddle import cache
+
+
+def test_frame_round_trip(tmp_path):
+    df = pd.DataFrame({'a': np.arange(5, dtype=np.float32), 'b': list('abcde')},
+                      index=pd.Index(range(10, 15), name='id'))
+    path = str(tmp_path / ('frame' + cache.frame_extension()))
+    cache.write_frame(df, path)
+
+    pd.testing.assert_frame_equal(cache.read_frame(path), df, check_index_type=False)
+    assert os.listdir(str(tmp_path)) == [os.path.basename(path)]
+
+
+@pytest.mark.parametrize('use_pyarrow', [True, False])
+def test_failed_frame_write_leaves_no_file(tmp_path, monkeypatch, use_pyarrow):
+    if use_pyarrow and cache.pyarrow is None:
+        pytest.skip('pyarrow not installed')
+
+    def fail(obj, path, *args, **kwargs):
+        # Fail part way through, as on a full disk
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+        raise OSError('No space left on device')
+
+    if use_pyarrow:
+        monkeypatch.setattr(cache.pyarrow.feather, 'write_feather', fail)
+    else:
+        monkeypatch.setattr(cache, 'pyarrow', None)
+        monkeypatch.setattr(pd.DataFrame, 'to_pickle', fail)
+
+    path = str(tmp_path / 'frame')
+    with pytest.raises(OSError):
+        cache.write_frame(pd.DataFrame({'a': [1.0, 2.0]}), path)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_data_cache_key_follows_content(tmp_path):
+    fn = tmp_path / 'proteinGroups.txt'
+    fn.write_text('a\tb\n1\t2\n')
+    dc = cache.DataCache(str(tmp_path / 'cache'))
+
+    key = dc.key(str(fn), 'tab')
+    assert dc.key(str(fn), 'tab') == key
+    assert dc.key(str(fn), 'comma') != key
+
+    fn.write_text('a\tb\n1\t3\n')
+    os.utime(str(fn), (0, 0))
+    assert dc.key(str(fn), 'tab') != key
+
+
+def test_data_cache_get_put(tmp_path):
+    dc = cache.DataCache(str(tmp_path))
+    df = pd.DataFrame({'x': [1.0, 2.0]})
+
+    assert dc.get('missing') is None
+    dc.put('k', df)
+    pd.testing.assert_frame_equal(dc.get('k'), df)
+
+
+def test_result_cache_evicts_least_recently_used():
+    df = pd.DataFrame({'x': np.zeros(100)})
+    size = cache.result_nbytes({'data': {'df': df}})
+    rc = cache.ResultCache(max_size=2 * size)
+
+    for key in 'abc':
+        rc.put(key, {'data': {'df': df.copy()}})
+
+    assert rc.get('a') is None
+    assert rc.get('b') is not None and rc.get('c') is not None
+
+
+def test_source_fingerprint_follows_code(tmp_path):
+    (tmp_path / 'tools').mkdir()
+    (tmp_path / 'process.py').write_text('A = 1\n')
+    (tmp_path / 'tools' / 'base.py').write_text('B = 1\n')
+    (tmp_path / 'notes.txt').write_text('ignored\n')
+
+    fingerprint = cache.source_fingerprint(str(tmp_path), ('numpy',))
+    assert cache.source_fingerprint(str(tmp_path), ('numpy',)) == fingerprint
+    assert cache.source_fingerprint(str(tmp_path), ('numpy', 'pandas')) != fingerprint
+
+    (tmp_path / 'notes.txt').write_text('still ignored\n')
+    assert cache.source_fingerprint(str(tmp_path), ('numpy',)) == fingerprint
+
+    (tmp_path / 'tools' / 'base.py').write_text('B = 2\n')
+    assert cache.source_fingerprint(str(tmp_path), ('numpy',)) != fingerprint
+
+
+def test_code_fingerprint_is_stable():
+    assert cache.code_fingerprint() == cache.code_fingerprint()
+
+
+def test_content_fingerprint():
+    df = pd.DataFrame({'a': [1.0, 2.0]})
+
+    assert cache.content_fingerprint(df) == cache.content_fingerprint(df.copy())
+    assert cache.content_fingerprint(df) != cache.content_fingerprint(df.astype(np.float32))
+    assert cache.content_fingerprint(df.rename(columns={'a': 'b'})) != cache.content_fingerprint(df)
+    assert cache.content_fingerprint(df, max_nbytes=1) is None
+    assert cache.content_fingerprint(object()) is None
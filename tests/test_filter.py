@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('PyQt5')
+pytest.importorskip('pyqtconfig')
+pytest.importorskip('padua')
+
+from paddle.tools import filter
+
+
+LEVEL_SETS = [['Group'], ['Replicate'], ['Group', 'Replicate'], ['Group', 'Replicate', 'Technical']]
+
+
+def design_table(rows=200, seed=0):
+    # Three groups of uneven size, two technical replicates each, many values missing
+    rng = np.random.default_rng(seed)
+    columns = pd.MultiIndex.from_tuples(
+        [(g, r, t) for g, replicates in (('A', 3), ('B', 2), ('C', 4))
+         for r in range(1, replicates + 1) for t in (1, 2)],
+        names=['Group', 'Replicate', 'Technical'])
+    values = rng.normal(20, 2, (rows, len(columns)))
+    values[rng.random(values.shape) < rng.random((rows, 1))] = np.nan
+    return pd.DataFrame(values, columns=columns)
+
+
+def groupby_filter(df, levels, n):
+    # At least n valid values in any group
+    counts = df.notna().T.groupby(level=levels).sum().T
+    return df[counts.max(axis=1) >= n]
+
+
+@pytest.mark.parametrize('levels', LEVEL_SETS)
+def test_filter_matches_groupby_count(levels):
+    df = design_table()
+    for n in range(0, 10):
+        result = filter.Filter.filter(df, {'filter_n': n, 'filter_levels': levels}, lambda p: None)
+        pd.testing.assert_frame_equal(result['data']['df'], groupby_filter(df, levels, n))
+
+
+def test_filter_index_applies_to_any_n():
+    df = design_table()
+    levels = ['Group', 'Replicate']
+    index = filter.Filter.filter(df, {'filter_n': 1, 'filter_levels': levels}, lambda p: None)['threshold_index']
+
+    for n in range(0, 10):
+        expected = groupby_filter(df, levels, n)
+        assert index.count(n) == len(expected)
+        pd.testing.assert_frame_equal(index.subset(df, n), expected)
+
+
+def run(host, tool):
+    tool.run_manual()
+    host.wait(lambda: tool.current_status == 'complete')
+
+
+def test_filter_refilters_without_a_run(host, source):
+    df = design_table()
+    upstream = source('design', df=df)
+    tool = host.add(filter.Filter)
+    tool.config.set('filter_levels', ['Group', 'Replicate'])
+    tool.config.set('filter_n', 1)
+    run(host, tool)
+    started = host.threadpool.started
+
+    # A new n with the same input and levels is applied from the index, at once
+    tool.config.set('filter_n', 3)
+    tool.run_manual()
+    assert host.threadpool.started == started
+    assert tool.current_status == 'complete'
+    pd.testing.assert_frame_equal(tool.data['data']['df'], groupby_filter(df, ['Group', 'Replicate'], 3))
+
+    # New levels need the counts per group again: a full run
+    tool.config.set('filter_levels', ['Group'])
+    run(host, tool)
+    assert host.threadpool.started == started + 1
+    pd.testing.assert_frame_equal(tool.data['data']['df'], groupby_filter(df, ['Group'], 3))
+
+    # As does new input
+    other = design_table(seed=1)
+    upstream.feed(df=other)
+    started = host.threadpool.started
+    run(host, tool)
+    assert host.threadpool.started == started + 1
+    pd.testing.assert_frame_equal(tool.data['data']['df'], groupby_filter(other, ['Group'], 3))
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from paddle import impute
+
+
+def block(rows=200, columns=6, missing=0.2, seed=0, dtype=np.float64):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(20, 2, size=(rows, columns)) + rng.normal(0, 3, size=(rows, 1))
+    values[rng.random(values.shape) < missing] = np.nan
+    return np.asfortranarray(values.astype(dtype))
+
+
+def brute_force_knn(values, k):
+    # Reference implementation: nan-euclidean distances (as sklearn), mean of the k
+    # nearest rows measured in the sample, the sample mean where none are
+    observed = ~np.isnan(values)
+    rows, columns = values.shape
+    result = values.copy()
+    means = np.nanmean(values, axis=0)
+    for r in np.flatnonzero(~observed.all(axis=1)):
+        shared = observed & observed[r]
+        diff = np.where(shared, values - np.where(observed[r], values[r], 0), 0)
+        n = shared.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            d = (diff ** 2).sum(axis=1) * columns / n
+        d[n == 0] = np.inf
+        d[r] = np.inf
+        nearest = np.argsort(d, kind='stable')[:k]
+        nearest = nearest[np.isfinite(d[nearest])]
+        for c in np.flatnonzero(~observed[r]):
+            v = values[nearest, c]
+            v = v[~np.isnan(v)]
+            result[r, c] = v.mean() if v.size else means[c]
+    return result
+
+
+@pytest.mark.parametrize('method', list(impute.METHODS))
+def test_fills_only_missing(method):
+    values = block()
+    missing = np.isnan(values)
+    measured = values[~missing]
+
+    impute.impute(values, method, seed=1)
+
+    assert not np.isnan(values).any()
+    np.testing.assert_array_equal(values[~missing], measured)
+
+
+@pytest.mark.parametrize('method', ['gaussian', 'minprob'])
+def test_draws_reproducible_across_threads(method):
+    a, b = block(columns=40), block(columns=40)
+    impute.impute(a, method, seed=3, threads=1)
+    impute.impute(b, method, seed=3, threads=4)
+    np.testing.assert_array_equal(a, b)
+
+    c = block(columns=40)
+    impute.impute(c, method, seed=4)
+    assert not np.array_equal(a, c)
+
+
+def test_gaussian_draws_below_measured():
+    values = block(rows=2000, columns=3)
+    missing = np.isnan(values)
+    mean, sd = np.nanmean(values, axis=0), np.nanstd(values, axis=0, ddof=1)
+
+    impute.impute(values, 'gaussian', width=0.3, shift=1.8)
+
+    for j in range(values.shape[1]):
+        drawn = values[missing[:, j], j]
+        assert abs(drawn.mean() - (mean[j] - 1.8 * sd[j])) < 0.1 * sd[j]
+        assert abs(drawn.std() - 0.3 * sd[j]) < 0.1 * sd[j]
+
+
+def test_minprob_centered_on_low_quantile():
+    values = block(rows=2000, columns=3)
+    missing = np.isnan(values)
+    minima = np.nanquantile(values, 0.01, axis=0)
+
+    impute.impute(values, 'minprob', quantile=0.01, width=0.1)
+
+    for j in range(values.shape[1]):
+        assert abs(np.median(values[missing[:, j], j]) - minima[j]) < 0.5
+
+
+def test_minprob_without_well_measured_rows():
+    values = np.full((10, 4), np.nan)
+    values[:, 0] = 1.0
+    impute.impute(values, 'minprob')
+    assert np.isnan(values[:, 1:]).all()
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_knn_matches_brute_force(dtype):
+    values = block(rows=300, columns=8, missing=0.3, dtype=dtype)
+    expected = brute_force_knn(values.astype(np.float64), k=5)
+
+    impute.impute(values, 'knn', k=5)
+
+    rtol = 1e-10 if dtype == np.float64 else 1e-4
+    np.testing.assert_allclose(values, expected, rtol=rtol)
+
+
+def test_knn_independent_of_blocks(monkeypatch):
+    a, b = block(rows=300, missing=0.3), block(rows=300, missing=0.3)
+    impute.impute(a, 'knn', k=4)
+
+    # Small query and candidate blocks, shared across threads
+    nearest_neighbours = impute.nearest_neighbours
+    monkeypatch.setattr(impute, 'KNN_QUERY_ROWS', 7)
+    monkeypatch.setattr(impute, 'nearest_neighbours', lambda *args: nearest_neighbours(*args, candidates=13))
+    impute.impute(b, 'knn', k=4, threads=3)
+
+    np.testing.assert_allclose(a, b, rtol=1e-12)
@@ -0,0 +1,46 @@
+import json
+
+import numpy as np
+
+from paddle import instrument
+
+
+def test_recorder_profile():
+    recorder = instrument.Recorder('run', trace=True)
+    recorder.start(inputs={'df': np.zeros((10, 3)), 'threshold': 0.75})
+    data = np.ones((1000, 100))
+    recorder.checkpoint(0.5)
+    recorder.stop('ok', outputs={'df': data})
+    profile = recorder.as_dict()
+
+    assert profile['status'] == 'ok'
+    assert profile['inputs'] == {'df': [10, 3]}
+    assert profile['outputs'] == {'df': [1000, 100]}
+    assert profile['wall'] >= profile['stages'][0][1] >= 0
+    assert profile['peak_traced'] >= data.nbytes
+
+
+def test_stage_intervals():
+    record = {'stages': [(0.25, 1.0), (0.5, 1.0), (0.75, 3.0)], 'wall': 4.0}
+    # Stages of no length (two checkpoints at once) are left out
+    assert instrument.stage_intervals(record) == [
+        ('0-25%', 0.0, 1.0),
+        ('50-75%', 1.0, 2.0),
+        ('75-100%', 3.0, 1.0),
+    ]
+
+
+def test_export_chrome_trace(tmp_path):
+    recorder = instrument.Recorder('run')
+    recorder.start()
+    recorder.checkpoint(0.5)
+    recorder.stop()
+
+    fn = str(tmp_path / 'trace.json')
+    instrument.export(fn, [recorder.as_dict()], trace=True)
+    with open(fn) as f:
+        events = json.load(f)['traceEvents']
+
+    assert [e['cat'] for e in events][0] == 'tool'
+    assert events[0]['name'] == 'run'
+    assert all(e['ph'] == 'X' for e in events)
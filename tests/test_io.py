@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from paddle import io
+
+
+def test_maxquant_columns_skips_unused(protein_groups):
+    columns = io.maxquant_columns(io.read_header(protein_groups))
+
+    assert 'Score' not in columns and 'Majority protein IDs' not in columns
+    assert columns[:4] == ['Protein IDs', 'Proteins', 'Gene names', 'Intensity']
+    assert 'LFQ intensity B_2' in columns and 'Reverse' in columns and 'id' in columns
+
+
+def test_read_maxquant(protein_groups):
+    progress = []
+    df = io.read_maxquant(protein_groups, chunksize=7, progress_callback=progress.append)
+
+    assert df.shape == (40, 15)
+    assert df.index.name == 'id' and list(df.index) == list(range(40))
+    assert df['Intensity A_1'].dtype == np.float64
+    assert isinstance(df['Reverse'].dtype, pd.CategoricalDtype)
+    assert len(progress) == 6 and progress[-1] == 1.0
+
+    # Chunked parsing gives the same table as a single pass
+    reference = pd.read_csv(protein_groups, sep='\t', index_col='id', usecols=io.maxquant_columns(io.read_header(protein_groups)))
+    np.testing.assert_array_equal(df['LFQ intensity A_2'].values, reference['LFQ intensity A_2'].values)
+    assert list(df['Reverse'] == '+') == list(reference['Reverse'] == '+')
+
+
+def test_read_maxquant_float32(tmp_path):
+    fn = tmp_path / 'sites.txt'
+    fn.write_text('id\tLocalization prob\tIntensity A\tRatio H/L A\n0\t0.7\t123456789\t0.5\n1\t1\t\t\n')
+    df = io.read_maxquant(str(fn), float32=True)
+
+    # Values parsed to float32 directly; thresholded probabilities kept in float64
+    assert list(df.columns) == ['Localization prob', 'Intensity A']
+    assert df['Intensity A'].dtype == np.float32
+    assert df['Intensity A'].iloc[0] == np.float32(123456789) and np.isnan(df['Intensity A'].iloc[1])
+    assert df['Localization prob'].dtype == np.float64 and df['Localization prob'].iloc[0] >= 0.7
+
+
+def test_read_maxquant_empty(tmp_path):
+    fn = tmp_path / 'empty.txt'
+    fn.write_text('id\tIntensity A\n')
+    df = io.read_maxquant(str(fn))
+    assert df.shape == (0, 1)
+
+
+def write_header(tmp_path, columns):
+    fn = tmp_path / 'table.txt'
+    fn.write_text('\t'.join(columns) + '\n')
+    return str(fn)
+
+
+def test_sniff_proteins(protein_groups):
+    dataset = io.sniff_maxquant(protein_groups)
+
+    assert dataset == {
+        'kind': 'proteins',
+        'quantification': ['Intensity', 'LFQ intensity'],
+        'samples': ['A_1', 'A_2', 'B_1', 'B_2'],
+        'multiplicities': [],
+    }
+
+
+def test_sniff_sites(tmp_path):
+    fn = write_header(tmp_path, ['Proteins', 'Localization prob', 'Intensity', 'Intensity___1',
+                                 'Intensity A___1', 'Intensity A___10', 'Intensity A___2', 'Intensity B___1',
+                                 'Ratio H/L A___1', 'id'])
+    dataset = io.sniff_maxquant(fn)
+
+    assert dataset['kind'] == 'sites'
+    assert dataset['multiplicities'] == ['___1', '___2', '___10']
+    assert dataset['samples'] == ['A', 'B']
+    # Ratios are not used
+    assert dataset['quantification'] == ['Intensity']
+
+
+def test_sniff_other_kinds(tmp_path):
+    assert io.sniff_maxquant(write_header(tmp_path, ['Sequence', 'Intensity X']))['kind'] == 'peptides'
+    assert io.sniff_maxquant(write_header(tmp_path, ['Name', 'Value']))['kind'] == 'unknown'
+
+    dataset = io.sniff_maxquant(write_header(tmp_path, ['Protein IDs', 'Ratio H/L X']))
+    assert dataset['quantification'] == [] and dataset['samples'] == []
+
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('id\n')
+    return str(path)
+
+
+def test_expand_filenames(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    a = touch(tmp_path / 'search_a' / 'txt' / 'proteinGroups.txt')
+    sites = touch(tmp_path / 'search_a' / 'txt' / 'Phospho (STY)Sites.txt')
+    touch(tmp_path / 'search_a' / 'txt' / 'evidence.txt')
+    b = touch(tmp_path / 'search_b' / 'txt' / 'proteinGroups.txt')
+    other = touch(tmp_path / 'other.txt')
+
+    # Globs in sorted order; folders searched for MaxQuant tables
+    assert io.expand_filenames([str(tmp_path / 'search_*' / 'txt' / 'proteinGroups.txt')]) == [a, b]
+    assert io.expand_filenames([str(tmp_path / 'search_a')]) == [sites, a]
+    assert io.find_maxquant_tables(str(tmp_path)) == [sites, a, b]
+
+    # Given order kept, each file once however it is given
+    assert io.expand_filenames([other, str(tmp_path / 'search_*' / 'txt' / 'proteinGroups.txt'),
+                                os.path.join('search_b', 'txt', '..', 'txt', 'proteinGroups.txt'),
+                                str(tmp_path), other]) == [other, a, b, sites]
+
+    # Names given as they are, whether or not they exist; patterns matching nothing dropped
+    assert io.expand_filenames(['missing.txt', str(tmp_path / 'none*')]) == ['missing.txt']
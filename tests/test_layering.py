@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import paddle
+
+# Imports each module in a fresh interpreter with Qt blocked, so modules already imported
+# by other tests can't hide a dependency
+CHECK = '''
+import sys
+
+class BlockQt(object):
+    def find_spec(self, name, path=None, target=None):
+        if name.split('.')[0] in ('PyQt5', 'pyqtconfig'):
+            raise ImportError('Qt imported by %s' % name)
+
+sys.meta_path.insert(0, BlockQt())
+import paddle.{module}
+assert not [m for m in sys.modules if m.startswith(('PyQt5', 'pyqtconfig'))]
+'''
+
+
+@pytest.mark.parametrize('module', paddle.QT_FREE_MODULES)
+def test_module_imports_without_qt(module):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(paddle.__file__)))
+    subprocess.check_call([sys.executable, '-c', CHECK.format(module=module)], cwd=root)
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from paddle import cache
+from paddle import memory
+
+
+def frame(rows=1000, value=0.0):
+    return pd.DataFrame({'a': np.full(rows, value), 'b': np.full(rows, value)})
+
+
+def result(**data):
+    return {'data': data, 'fig': None}
+
+
+def test_shared_tables_counted_once(tmp_path):
+    df = frame()
+    size = memory.nbytes(df)
+    # Passed through from the first tool to the second and cached
+    first, second = result(df=df), result(df=df, design=None)
+    rc = cache.ResultCache(max_size=10 * size)
+    rc.put('first', first)
+    rc.put('second', second)
+
+    budget = memory.MemoryBudget(size, memory.SpillStore(str(tmp_path)))
+    assert budget.enforce([(first, 1, False), (second, 2, False)], rc) == 0
+    assert first['data']['df'] is df
+    assert cache.result_nbytes(first, second) == size
+    assert rc.size() == size
+
+
+@pytest.mark.parametrize('copy_on_write', [False, True])
+def test_report_counts_each_table_once(copy_on_write):
+    pytest.importorskip('pandas', minversion='2.0')
+    with pd.option_context('mode.copy_on_write', copy_on_write):
+        check_report_counts_each_table_once()
+
+
+def check_report_counts_each_table_once():
+    df = frame()
+    df['name'] = ['protein %d' % n for n in range(len(df))]
+    df['kind'] = pd.Categorical(['a', 'b'] * (len(df) // 2))
+    new = df[['a']] * 2
+
+    def size(*frames):
+        return sum(int(f.memory_usage(index=False, deep=True).sum()) for f in frames)
+
+    # Passed through, and held under two names; and a new table
+    total, shared = memory.report('Tool', {'df': df}, {'df': df, 'passed': df, 'new': new})
+    assert total == size(df, new)
+    assert shared == size(df)
+
+    # Columns of the input selected without copying are shared; copies are new
+    numeric = frame()
+    passed = numeric.iloc[:, :1]
+    assert np.shares_memory(passed['a'].values, numeric['a'].values)
+    assert memory.report('Tool', {'df': numeric}, {'df': passed}) == (size(passed), size(passed))
+    assert memory.report('Tool', {'df': df}, {'df': df.copy()}) == (size(df), 0)
+    assert memory.report('Tool', None, {'df': df, 'design': None}) == (size(df), 0)
+
+
+def test_cached_results_evicted_before_spilling(tmp_path):
+    held, cached = frame(value=1), frame(value=2)
+    size = memory.nbytes(held)
+    tool = result(df=held)
+    rc = cache.ResultCache(max_size=10 * size)
+    rc.put('old', result(df=cached))
+    rc.put('current', tool)
+
+    budget = memory.MemoryBudget(size, memory.SpillStore(str(tmp_path)))
+    assert budget.enforce([(tool, 0, False)], rc) == 0
+
+    assert [key for key, _, _ in rc.entries()] == ['current']
+    assert tool['data']['df'] is held
+
+
+def test_least_recently_used_spilled(tmp_path):
+    old, new = frame(value=1), frame(value=2)
+    size = memory.nbytes(old)
+    first, second = result(df=old), result(df=new)
+
+    budget = memory.MemoryBudget(size, memory.SpillStore(str(tmp_path)))
+    assert budget.enforce([(first, 1, False), (second, 2, False)]) == size
+
+    assert isinstance(first['data']['df'], memory.SpilledFrame)
+    assert second['data']['df'] is new
+    memory.restore(first)
+    pd.testing.assert_frame_equal(first['data']['df'], old)
+
+
+def test_protected_tables_kept(tmp_path):
+    old, new = frame(value=1), frame(value=2)
+    size = memory.nbytes(old)
+    first, second = result(df=old), result(df=new)
+
+    budget = memory.MemoryBudget(size, memory.SpillStore(str(tmp_path)))
+    budget.enforce([(first, 1, True), (second, 2, False)])
+
+    assert first['data']['df'] is old
+    assert isinstance(second['data']['df'], memory.SpilledFrame)
+
+
+def test_usage_counts_spilled(tmp_path):
+    df = frame()
+    r = result(df=df, other=df)
+    assert memory.usage(r) == (memory.nbytes(df), 0)
+
+    memory.MemoryBudget(0, memory.SpillStore(str(tmp_path))).enforce([(r, 0, False)])
+    assert memory.usage(r) == (0, memory.nbytes(df))
+
+
+def test_indexes_in_data_are_not_tables(tmp_path):
+    # Filter and Imputation pass on a GroupIndex of the table's columns
+    from paddle import process
+
+    df = frame()
+    data = result(df=df, groups=process.GroupIndex(df.columns), threshold_index=process.ThresholdIndex(df['a']))
+    assert memory.frames(data['data']) == [df]
+    assert memory.usage(data) == (memory.nbytes(df), 0)
+
+    budget = memory.MemoryBudget(0, memory.SpillStore(str(tmp_path)))
+    assert budget.enforce([(data, 1, False)]) == memory.nbytes(df)
+    assert isinstance(data['data']['df'], memory.SpilledFrame)
+    assert isinstance(data['data']['groups'], process.GroupIndex)
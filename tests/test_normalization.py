@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from paddle import normalization
+
+
+def block(rows=300, columns=5, missing=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(25, 2, (rows, columns)) + rng.normal(0, 1, columns)
+    values[rng.random(values.shape) < missing] = np.nan
+    return np.asfortranarray(values)
+
+
+def test_quantile_complete():
+    # With no missing values, every sample gets the mean of the sorted samples
+    values = block()
+    expected = np.sort(values, axis=0).mean(axis=1)
+    normalization.normalize(values, 'quantile', threads=1)
+
+    for c in values.T:
+        assert np.allclose(np.sort(c), expected)
+
+
+def test_quantile_keeps_ranks_and_missing():
+    values = block(missing=0.2)
+    original = values.copy()
+    normalization.normalize(values, 'quantile', threads=1)
+
+    assert np.array_equal(np.isnan(values), np.isnan(original))
+    for c, o in zip(values.T, original.T):
+        valid = ~np.isnan(o)
+        assert np.array_equal(np.argsort(c[valid]), np.argsort(o[valid]))
+
+
+def test_median_polish_removes_sample_effects():
+    rng = np.random.default_rng(1)
+    rows = rng.normal(25, 2, 200)
+    samples = np.array([0.0, 1.0, -0.5, 2.0])
+    values = np.asfortranarray(rows[:, None] + samples)
+    values[rng.random(values.shape) < 0.2] = np.nan
+    normalization.normalize(values, 'median_polish', threads=1)
+
+    # Each row is level across samples, at the median sample's level
+    spread = np.nanmax(values, axis=1) - np.nanmin(values, axis=1)
+    assert np.allclose(spread, 0, atol=1e-3)
+    assert np.allclose(np.nanmean(values, axis=1), rows + np.median(samples), atol=1e-3)
+
+
+def test_subtract_column_median():
+    values = block(missing=0.1)
+    normalization.normalize(values, 'subtract_column_median', threads=1)
+    assert np.allclose(np.nanmedian(values, axis=0), 0)
+
+
+@pytest.mark.parametrize('log', [True, False])
+def test_reference(log):
+    rng = np.random.default_rng(2)
+    ref = rng.normal(25, 2, 100)
+    shifts = np.array([0.0, 1.0, -2.0])
+    values = ref[:, None] + shifts
+    if not log:
+        values = 2 ** values
+    values = np.asfortranarray(values)
+    normalization.normalize(values, 'reference', threads=1, reference=0, log=log)
+
+    for c in values.T:
+        assert np.allclose(c, values[:, 0])
+
+
+def test_arcsinh_scales_samples_and_drops_zeros():
+    rng = np.random.default_rng(3)
+    raw = 2 ** rng.normal(25, 2, 100)
+    values = np.asfortranarray(np.column_stack([raw, raw * 4]))
+    values[0] = 0
+    normalization.normalize(values, 'arcsinh', threads=1)
+
+    assert np.isnan(values[0]).all()
+    assert np.allclose(values[1:, 0], values[1:, 1])
+    assert normalization.METHODS['arcsinh'].transforms
+
+
+@pytest.mark.parametrize('method', ['quantile', 'median_polish', 'subtract_column_median', 'reference'])
+def test_threads_give_same_result(method, monkeypatch):
+    # Small blocks, so work is shared across threads
+    monkeypatch.setattr(normalization, 'BLOCK_COLUMNS', 2)
+    monkeypatch.setattr(normalization, 'BLOCK_ROWS', 64)
+    values = block(columns=7, missing=0.2)
+
+    single = normalization.normalize(values.copy(order='F'), method, threads=1)
+    threaded = normalization.normalize(values.copy(order='F'), method, threads=4)
+    assert np.array_equal(single, threaded, equal_nan=True)
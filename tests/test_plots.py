@@ -0,0 +1,69 @@
+import pickle
+
+import numpy as np
+import pytest
+
+matplotlib = pytest.importorskip('matplotlib')
+matplotlib.use('Agg')
+
+from matplotlib.figure import Figure
+
+from paddle import plots
+
+
+def bars(values, color='k'):
+    # Returns an axes, as the padua plots do
+    import matplotlib.pyplot as plt
+    fig = plt.figure()
+    ax = fig.add_subplot(1, 1, 1)
+    ax.bar(np.arange(len(values)), values, color=color)
+    return ax, values
+
+
+def panels(n, progress_callback=None):
+    import matplotlib.pyplot as plt
+    fig = plt.figure()
+    for i in range(n):
+        fig.add_subplot(n, 1, i + 1)
+        if progress_callback:
+            progress_callback((i + 1) / n)
+    return fig
+
+
+def test_lazy_figure_pickles_without_rendering():
+    spec = plots.LazyFigure(bars, np.arange(5), color='r')
+    spec.render()
+    assert spec.is_rendered
+
+    copy = pickle.loads(pickle.dumps(spec))
+    assert not copy.is_rendered
+    assert copy.fn is bars and copy.kwargs == {'color': 'r'}
+    np.testing.assert_array_equal(copy.args[0], np.arange(5))
+
+
+def test_render_result():
+    spec = plots.LazyFigure(bars, [1, 2, 3])
+    result = plots.render_result(spec)
+
+    fig = result['fig']
+    assert result['spec'] is spec
+    assert isinstance(fig, Figure)
+    assert len(fig.axes) == 1 and len(fig.axes[0].patches) == 3
+    # Drawn once
+    assert plots.render(spec) is fig
+
+    assert plots.render_result(None) == {'spec': None, 'fig': None}
+    assert plots.render(fig) is fig
+
+
+def test_render_passes_progress_on():
+    seen = []
+    spec = plots.LazyFigure(panels, 3, progress=True)
+    fig = plots.render(spec, seen.append)
+    assert len(fig.axes) == 3
+    assert seen == [1 / 3, 2 / 3, 1.0]
+
+    # Not passed unless asked for
+    spec = plots.LazyFigure(panels, 2)
+    plots.render(spec, seen.append)
+    assert len(seen) == 3
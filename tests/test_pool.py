@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from paddle import pool
+
+
+@pytest.mark.skipif(pool.shared_memory is None, reason='no shared memory')
+def test_pack_round_trip():
+    df = pd.DataFrame(np.arange(100000, dtype=np.float64).reshape(-1, 4), columns=list('ABCD'))
+    small = np.arange(10)
+    payload, specs, blocks = pool.pack({'df': df, 'small': small, 'name': 'x'})
+    try:
+        # Only the large buffer goes through shared memory
+        assert len(specs) == 1
+        assert specs[0][1] >= df.values.nbytes
+
+        result = pool.unpack(payload, specs)
+        pd.testing.assert_frame_equal(result['df'], df)
+        assert np.array_equal(result['small'], small)
+        assert result['name'] == 'x'
+    finally:
+        pool.release(blocks)
+
+
+def test_pack_without_large_buffers():
+    payload, specs, blocks = pool.pack({'threshold': 0.75})
+    assert specs == [] and blocks == []
+    assert pool.unpack(payload, specs) == {'threshold': 0.75}
+
+
+def test_worker_count(monkeypatch):
+    monkeypatch.setattr(pool.multiprocessing, 'cpu_count', lambda: 8)
+    assert pool.worker_count(0, 20) == 8
+    assert pool.worker_count(None, 3) == 3
+    assert pool.worker_count(4, 20) == 4
+    assert pool.worker_count(16, 2) == 2
+    assert pool.worker_count(0, 1) == 1
+    assert pool.worker_count(0, 0) == 1
+
+
+def test_limit_threads(monkeypatch):
+    from paddle import normalization
+
+    monkeypatch.delenv('OMP_NUM_THREADS', raising=False)
+    monkeypatch.delenv('OPENBLAS_NUM_THREADS', raising=False)
+    monkeypatch.setenv('MKL_NUM_THREADS', '2')
+    monkeypatch.setattr(normalization, 'threads', None)
+    pool.limit_threads()
+
+    assert os.environ['OMP_NUM_THREADS'] == '1' and os.environ['OPENBLAS_NUM_THREADS'] == '1'
+    # Set by the user: kept
+    assert os.environ['MKL_NUM_THREADS'] == '2'
+    # The blocked kernels follow
+    assert normalization.get_threads() == 1
@@ -0,0 +1,211 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from paddle import process
+
+
+def test_compact_dtypes_downcasts_quantification_only():
+    df = pd.DataFrame({
+        'Localization prob': [0.7, 0.9, 0.95, 0.5],
+        'Score': [1.5, 2.5, 3.5, 4.5],
+        'Intensity': [1e6, 2e6, np.nan, 0.0],
+        'Intensity A': [1e6, 2e6, np.nan, 0.0],
+        'Reverse': ['+', np.nan, np.nan, '+'],
+    })
+    compacted, saved = process.compact_dtypes(df, flags=['Reverse'], float32=True)
+
+    assert compacted['Localization prob'].dtype == np.float64
+    assert compacted['Score'].dtype == np.float64
+    assert compacted['Intensity'].dtype == np.float32
+    assert compacted['Intensity A'].dtype == np.float32
+    assert compacted['Reverse'].dtype == bool
+    assert saved > 0
+
+
+def test_compact_dtypes_keeps_threshold_boundary():
+    # Sites scored exactly at a threshold pass a >= filter after compacting
+    probabilities = [0.7, 0.9, 0.95, 0.69]
+    df = pd.DataFrame({'Localization prob': probabilities, 'Intensity': [1.0] * 4})
+    df, _ = process.compact_dtypes(df, float32=True)
+
+    index = process.ThresholdIndex(df['Localization prob'].values)
+    for threshold in (0.7, 0.9, 0.95):
+        expected = [p for p in probabilities if p >= threshold]
+        assert index.count(threshold) == len(expected)
+        assert list(index.subset(df, threshold)['Localization prob']) == expected
+
+
+def test_log2_transform_zeros_become_missing():
+    # MaxQuant writes unmeasured intensities as 0. Before the block transform log2
+    # gave -inf, which counted as a valid value; they are now NaN, so missing
+    df = pd.DataFrame({'Intensity A': [4.0, 0.0, 1.0], 'Intensity B': [0.0, -1.0, 8.0]})
+    values = process.log2_transform(process.value_block(df, [0, 1], 'float64'))
+
+    np.testing.assert_array_equal(values, [[2.0, np.nan], [np.nan, np.nan], [0.0, 3.0]])
+    assert not np.isinf(values).any()
+    assert list(np.count_nonzero(~np.isnan(values), axis=1)) == [1, 0, 2]
+
+
+def test_log2_transform_matches_numpy_without_zeros():
+    rng = np.random.default_rng(0)
+    raw = rng.lognormal(20, 2, size=(50, 4))
+    for dtype in ('float32', 'float64'):
+        values = process.value_block(pd.DataFrame(raw), range(4), dtype)
+        np.testing.assert_array_equal(process.log2_transform(values), np.log2(raw.astype(dtype)))
+
+
+def test_subtract_column_median_ignores_missing():
+    values = np.array([[1.0, np.nan], [2.0, 5.0], [np.nan, 7.0], [4.0, 9.0]], order='F')
+    np.testing.assert_array_equal(process.column_medians(values), [2.0, 7.0])
+
+    process.subtract_column_median(values)
+    np.testing.assert_array_equal(values, [[-1.0, np.nan], [0.0, -2.0], [np.nan, 0.0], [2.0, 2.0]])
+
+
+def test_quality_filter_counts_each_row_once():
+    df = pd.DataFrame({
+        'Reverse': ['+', '+', np.nan, np.nan],
+        'Potential contaminant': pd.Categorical(['+', np.nan, '+', np.nan], categories=['+']),
+        'Only identified by site': [False, False, False, True],
+        'Intensity': [1.0, 2.0, 3.0, 4.0],
+    })
+    filtered, counts = process.quality_filter(
+        df, ['Reverse', 'Potential contaminant', 'Contaminant', 'Only identified by site'])
+
+    assert list(filtered['Intensity']) == []
+    assert list(counts.items()) == [('Reverse', 2), ('Potential contaminant', 1), ('Only identified by site', 1)]
+
+    filtered, counts = process.quality_filter(df, ['Potential contaminant'])
+    assert list(filtered['Intensity']) == [2.0, 4.0]
+    assert counts['Potential contaminant'] == 2
+
+
+def test_threshold_index_matches_comparison():
+    rng = np.random.default_rng(0)
+    scores = rng.random(200)
+    scores[rng.choice(200, 20, replace=False)] = np.nan
+    index = process.ThresholdIndex(scores)
+
+    thresholds = [0.0, 0.25, 0.5, 0.75, 1.0]
+    for threshold in thresholds:
+        passed = np.flatnonzero(scores >= threshold)
+        assert index.count(threshold) == len(passed)
+        assert list(index.positions(threshold)) == list(passed)
+    assert list(index.counts(thresholds)) == [index.count(t) for t in thresholds]
+
+
+def test_threshold_index_subset():
+    df = pd.DataFrame({'Score': [3.0, np.nan, 1.0, 2.0, 2.0]}, index=list('abcde'))
+    index = process.ThresholdIndex(df['Score'].values)
+
+    assert list(index.subset(df, 2.0).index) == ['a', 'd', 'e']
+    # Rows with no score never pass, even at the lowest threshold
+    assert list(index.subset(df, -np.inf).index) == ['a', 'c', 'd', 'e']
+    assert index.subset(df, 4.0).empty
+
+
+def test_threshold_index_subset_all_rows():
+    df = pd.DataFrame({'Score': [1.0, 2.0]})
+    index = process.ThresholdIndex(df['Score'].values)
+    assert index.subset(df, 0) is df
+
+
+def test_threshold_index_row_mismatch():
+    index = process.ThresholdIndex([1.0, 2.0])
+    with pytest.raises(ValueError):
+        index.subset(pd.DataFrame({'Score': [1.0]}), 0)
+
+
+def test_expand_side_table():
+    df = pd.DataFrame({
+        'id': [0, 1],
+        'Protein': ['P1', 'P2'],
+        'Intensity A___1': [1.0, 2.0],
+        'Intensity A___2': [3.0, 4.0],
+        'Intensity A___3': [5.0, 6.0],
+        'Intensity B___1': [7.0, 8.0],
+        'Intensity B___2': [9.0, 10.0],
+        'Intensity B___3': [11.0, 12.0],
+    })
+    expanded = process.expand_side_table(df)
+
+    assert list(expanded.index) == [0, 1, 0, 1, 0, 1]
+    assert list(expanded['Intensity A']) == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+    assert list(expanded['Intensity B']) == [7.0, 8.0, 9.0, 10.0, 11.0, 12.0]
+    assert list(expanded['Multiplicity']) == ['___1', '___1', '___2', '___2', '___3', '___3']
+    assert list(expanded['id']) == ['0___1', '1___1', '0___2', '1___2', '0___3', '1___3']
+    assert list(expanded['Protein']) == ['P1', 'P2'] * 3
+
+
+def test_expand_side_table_missing_block():
+    # Without ___3 columns that block is all missing; mixed types keep their own
+    df = pd.DataFrame({
+        'Intensity A___1': [1.0],
+        'Intensity A___2': [2.0],
+        'Count A___1': [1],
+        'Count A___2': [2],
+    }, index=pd.Index(['s'], name='Site'))
+    expanded = process.expand_side_table(df)
+
+    assert list(expanded.index) == ['s', 's', 's']
+    assert list(expanded['Intensity A'][:2]) == [1.0, 2.0]
+    assert np.isnan(expanded['Intensity A'].iloc[2])
+    assert list(expanded['Count A'][:2]) == [1, 2]
+
+
+def design_table(groups, rows=50, missing=0.3, seed=0):
+    # Columns indexed by (Group, Replicate), with missing values and one unassigned column
+    rng = np.random.default_rng(seed)
+    columns = pd.MultiIndex.from_tuples(
+        [(g, r) for g, n in groups for r in range(1, n + 1)], names=['Group', 'Replicate'])
+    values = rng.normal(20, 2, (rows, len(columns)))
+    values[rng.random(values.shape) < missing] = np.nan
+    return pd.DataFrame(values, columns=columns)
+
+
+@pytest.mark.parametrize('groups', [
+    [('B', 3), ('A', 3)],  # Uniform, out of order
+    [('A', 1), ('B', 4), ('C', 2)],  # Uneven
+    [('A', 1), ('B', 1)],  # Single replicates
+])
+def test_groups_reduce_matches_groupby(groups):
+    df = design_table(groups)
+    reduced = process.GroupIndex(df.columns).groups(['Group']).reduce(
+        df, ['median', 'mean', 'count', 'size'], chunk_rows=16)
+    grouped = df.T.groupby(level='Group')
+
+    pd.testing.assert_frame_equal(reduced['median'], grouped.median().T, check_names=False)
+    pd.testing.assert_frame_equal(reduced['mean'], grouped.mean().T, check_names=False)
+    pd.testing.assert_frame_equal(reduced['count'], grouped.count().T, check_names=False, check_dtype=False)
+    sizes = grouped.size()
+    assert (reduced['size'] == sizes.values).all().all()
+    assert list(reduced['size'].columns) == list(sizes.index)
+
+
+def test_groups_by_several_levels():
+    df = design_table([('A', 2), ('B', 2)])
+    index = process.GroupIndex(df.columns)
+
+    groups = index.groups(['Group', 'Replicate'])
+    assert list(groups.keys) == [('A', 1), ('A', 2), ('B', 1), ('B', 2)]
+    # Levels not in the design are ignored, falling back to 'Group'
+    assert list(index.groups(['Timepoint']).keys) == ['A', 'B']
+
+    with pytest.raises(ValueError):
+        groups.reduce(df.iloc[:, :3])
+    with pytest.raises(ValueError):
+        groups.reduce(df, 'max')
+
+
+def test_nanmedian_matches_numpy():
+    rng = np.random.default_rng(0)
+    for lanes in (1, 2, 5, process.SORT_NETWORK_SIZE + 3):
+        a = rng.normal(size=(100, lanes))
+        a[rng.random(a.shape) < 0.3] = np.nan
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN rows
+            expected = np.nanmedian(a, axis=1)
+        assert np.allclose(process.nanmedian(a, axis=1), expected, equal_nan=True)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('PyQt5')
+pytest.importorskip('pyqtconfig')
+pytest.importorskip('padua')
+
+from paddle import io
+from paddle.tools.quantification import Quantification, histogram
+
+
+def value_columns(rows=1000, seed=0, dtype=np.float32):
+    # Columns with missing and infinite values, one of them all missing
+    rng = np.random.default_rng(seed)
+    columns = []
+    for n in range(5):
+        v = rng.normal(loc=n, scale=1 + n, size=rows).astype(dtype)
+        v[rng.random(rows) < 0.3] = np.nan
+        columns.append(v)
+    columns[1][::97] = np.inf
+    columns[3][::89] = -np.inf
+    columns.append(np.full(rows, np.nan, dtype=dtype))
+    return columns
+
+
+def finite(v):
+    return v[np.isfinite(v)]
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 7, 64, 333, 1000, 4096])
+def test_histogram_matches_numpy(chunk_rows):
+    columns = value_columns()
+    counts, edges = histogram(columns, bins=25, chunk_rows=chunk_rows)
+
+    values = np.concatenate([finite(v) for v in columns])
+    expected, expected_edges = np.histogram(values, bins=25)
+    np.testing.assert_array_equal(edges, expected_edges)
+    np.testing.assert_array_equal(counts.sum(axis=0), expected)
+
+    assert counts.shape == (len(columns), 25)
+    for c, v in zip(counts, columns):
+        np.testing.assert_array_equal(c, np.histogram(finite(v), bins=edges)[0])
+    # The all-missing column
+    assert not counts[-1].any()
+
+
+@pytest.mark.parametrize('chunk_rows', [3, 1000])
+def test_histogram_sums_columns_of_a_sample(chunk_rows):
+    # e.g. the multiplicity columns of sites tables
+    columns = value_columns()
+    samples = ['A', 'B', 'A', 'C', 'B', 'C']
+    counts, edges = histogram(columns, samples, chunk_rows=chunk_rows)
+
+    assert counts.shape == (3, 25)
+    for row, sample in enumerate(['A', 'B', 'C']):
+        values = np.concatenate([finite(v) for v, s in zip(columns, samples) if s == sample])
+        np.testing.assert_array_equal(counts[row], np.histogram(values, bins=edges)[0])
+
+
+def test_histogram_of_no_values():
+    counts, edges = histogram([np.full(10, np.nan), np.array([np.inf, -np.inf])], chunk_rows=4)
+    np.testing.assert_array_equal(edges, np.histogram([], bins=25)[1])
+    assert counts.shape == (2, 25) and not counts.any()
+
+
+def test_set_dataset_offers_what_the_data_has(host, source, protein_groups):
+    dataset = io.sniff_maxquant(protein_groups)
+    # A tool with no choices depending on the data, which ignores it
+    source('localization')
+    tool = host.add(Quantification)
+    tool.config.set('normalization_reference', 'elsewhere')
+
+    # As the main window does, for every tool, on selecting a file
+    for t in host.tools:
+        t.set_dataset(dataset)
+    panel = tool.panel
+    assert [panel.quantification.itemText(n) for n in range(panel.quantification.count())] == \
+        dataset['quantification']
+    assert tool.config.get('quantification') == 'Intensity'
+    assert tool.config.get('normalization_reference') == 'A_1'
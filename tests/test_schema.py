@@ -0,0 +1,59 @@
+import pandas as pd
+
+from paddle import schema
+
+
+COLUMNS = [
+    'Protein IDs',
+    'Reverse',
+    'Intensity',
+    'Intensity A',
+    'Intensity B',
+    'LFQ intensity A',
+    'LFQ intensity B',
+    'Reporter intensity 1___2',
+    'Score',
+]
+
+
+def test_parse_column():
+    assert schema.parse_column('LFQ intensity A___2') == (schema.QUANTIFICATION, 'LFQ intensity', 'A', '___2')
+    assert schema.parse_column('Intensity') == (schema.QUANTIFICATION, 'Intensity', None, None)
+    # The longest type matches, not 'Intensity' within it
+    assert schema.parse_column('Reporter intensity 1') == (schema.QUANTIFICATION, 'Reporter intensity', '1', None)
+    assert schema.parse_column('Reverse') == (schema.FLAG, None, None, None)
+    assert schema.parse_column('Protein IDs') == (schema.ANNOTATION, None, None, None)
+    assert schema.parse_column('Score') == (schema.OTHER, None, None, None)
+    assert schema.parse_column(('Group', 1)) == (schema.OTHER, None, None, None)
+
+
+def test_positions():
+    s = schema.ColumnSchema(COLUMNS)
+
+    assert list(s.positions(schema.QUANTIFICATION)) == [3, 4, 5, 6, 7]
+    assert list(s.positions(schema.QUANTIFICATION, sample=False)) == [2, 3, 4, 5, 6, 7]
+    assert list(s.positions(schema.QUANTIFICATION, 'LFQ intensity')) == [5, 6]
+    assert list(s.positions(schema.QUANTIFICATION, multiplicity=True)) == [7]
+    assert list(s.positions(schema.FLAG)) == [1]
+    assert list(s.exclude(s.positions(schema.QUANTIFICATION))) == [0, 1, 2, 8]
+
+
+def test_subset_and_sample_names():
+    s = schema.ColumnSchema(COLUMNS)
+    positions = s.positions(schema.QUANTIFICATION, 'LFQ intensity')
+
+    df = pd.DataFrame([range(len(COLUMNS))], columns=COLUMNS)
+    selected, sub = s.select(df, positions)
+    assert sub.matches(selected)
+    assert list(selected.columns) == ['LFQ intensity A', 'LFQ intensity B']
+
+    assert sub.sample_names() == ['A', 'B']
+    assert s.sample_names([0, 3]) == ['Protein IDs', 'A']
+    assert sub.available_quantification() == ['LFQ intensity']
+
+
+def test_available_quantification():
+    s = schema.ColumnSchema(COLUMNS)
+    # The summed 'Intensity' column alone doesn't make a type available
+    assert s.available_quantification() == ['Intensity', 'LFQ intensity', 'Reporter intensity']
+    assert schema.ColumnSchema(['Intensity', 'Score']).available_quantification() == []
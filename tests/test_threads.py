@@ -0,0 +1,114 @@
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from paddle import threads
+
+
+class Signals(object):
+    # Records the signals a worker emits; run in this thread, they are delivered at once
+
+    def __init__(self, worker):
+        self.emitted = []
+        for name in ('result', 'error', 'cancelled', 'finished', 'profile'):
+            getattr(worker.signals, name).connect(lambda *args, name=name: self.emitted.append((name, args)))
+
+    def names(self):
+        return [name for name, _ in self.emitted if name != 'profile']
+
+    def profile(self):
+        return [args[0] for name, args in self.emitted if name == 'profile'][0]
+
+
+def steps(progress_callback, n=5, cancel_at=None, worker=None, seen=None):
+    # Reports progress n times, cancelling its own worker at step `cancel_at`
+    for i in range(n):
+        if i == cancel_at:
+            worker[0].cancel()
+        progress_callback(i / float(n))
+        seen.append(i)
+    return {'data': {'steps': len(seen)}}
+
+
+def make_worker(**kwargs):
+    worker = []
+    seen = []
+    w = threads.Worker(steps, progress_callback=lambda p: None, worker=worker, seen=seen, **kwargs)
+    worker.append(w)
+    return w, seen
+
+
+def test_cancel_token():
+    token = threads.CancelToken()
+    token.check()
+    assert not token.is_cancelled()
+
+    token.cancel()
+    assert token.is_cancelled()
+    with pytest.raises(threads.WorkerCancelled):
+        token.check()
+
+
+def test_worker_result():
+    w, seen = make_worker()
+    signals = Signals(w)
+    w.run()
+
+    assert seen == [0, 1, 2, 3, 4]
+    assert signals.names() == ['result', 'finished']
+    assert signals.emitted[1][1][0] == {'data': {'steps': 5}}
+    assert signals.profile()['status'] == 'ok'
+    assert len(signals.profile()['stages']) == 5
+
+
+def test_worker_stops_at_next_progress():
+    w, seen = make_worker(cancel_at=2)
+    signals = Signals(w)
+    w.run()
+
+    # Steps before the cancelled progress report complete; nothing after it runs
+    assert seen == [0, 1]
+    assert signals.names() == ['cancelled', 'finished']
+    assert signals.profile()['status'] == 'cancelled'
+
+
+def test_worker_cancelled_after_last_progress_emits_no_result():
+    # Cancelled once the function has reported its last progress: it runs to the end,
+    # but the result is discarded
+    def last_step(progress_callback, worker):
+        progress_callback(1.0)
+        worker[0].cancel()
+        return {'data': {}}
+
+    worker = []
+    w = threads.Worker(last_step, progress_callback=lambda p: None, worker=worker)
+    worker.append(w)
+    signals = Signals(w)
+    w.run()
+
+    assert signals.names() == ['cancelled', 'finished']
+
+
+def test_worker_cancelled_before_start():
+    w, seen = make_worker()
+    signals = Signals(w)
+    w.cancel()
+    w.run()
+
+    assert seen == []
+    assert signals.names() == ['cancelled', 'finished']
+
+
+def test_worker_error():
+    def fails(progress_callback):
+        progress_callback(0.5)
+        raise ValueError('bad input')
+
+    w = threads.Worker(fails, progress_callback=lambda p: None)
+    signals = Signals(w)
+    w.run()
+
+    assert signals.names() == ['error', 'finished']
+    exctype, value, tb = signals.emitted[1][1][0]
+    assert exctype is ValueError and 'bad input' in tb
+    assert signals.profile()['status'] == 'error'
@@ -0,0 +1,239 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('PyQt5')
+pytest.importorskip('pyqtconfig')
+
+from paddle import process
+from paddle import workflow
+from paddle.qt import QGridLayout
+from paddle.tools.base import ToolBase, ThresholdTool, ThresholdConfigPanel
+
+
+class Scale(ToolBase):
+    name = 'Scale'
+    shortname = 'scale'
+    inputs = ('source',)
+    outputs = ('df',)
+    uses = ('df',)
+    function = 'scale'
+
+    defaults = {
+        'factor': 2.0,
+    }
+
+    @staticmethod
+    def scale(df, config, progress_callback, **kwargs):
+        return {'data': {'df': df * config['factor']}, 'fig': None}
+
+
+class ScaleAgain(Scale):
+    name = 'Scale again'
+    shortname = 'scale_again'
+    inputs = ('scale',)
+
+
+class Elsewhere(Scale):
+    name = 'Elsewhere'
+    shortname = 'elsewhere'
+    inputs = ('other',)
+
+
+# Held until set, so runs can be superseded while in flight
+gate = threading.Event()
+
+
+class Slow(Scale):
+    name = 'Slow'
+    shortname = 'slow'
+    function = 'slow'
+
+    @staticmethod
+    def slow(df, config, progress_callback, **kwargs):
+        while not gate.is_set():
+            progress_callback(0.5)
+            time.sleep(0.005)
+        return {'data': {'df': df * config['factor']}, 'fig': None}
+
+
+class ScoresConfig(ThresholdConfigPanel):
+
+    def __init__(self, parent, *args, **kwargs):
+        super(ScoresConfig, self).__init__(parent, *args, **kwargs)
+        gd = QGridLayout()
+        self.layout.addLayout(gd)
+        self.add_sweep(gd, 0)
+        self.finalise()
+
+
+class Scores(ThresholdTool):
+    # A threshold tool with the default sweep plot
+    name = 'Scores'
+    shortname = 'scores'
+    inputs = ('source',)
+    function = 'scores'
+    threshold = 'min_score'
+
+    defaults = {
+        'min_score': 2.0,
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(Scores, self).__init__(*args, **kwargs)
+        self.panel = self.addConfigPanel(ScoresConfig)
+
+    @staticmethod
+    def scores(df, config, progress_callback, **kwargs):
+        index = process.ThresholdIndex(df['Score'].values)
+        return {'data': {'df': index.subset(df, config['min_score'])}, 'fig': None, 'threshold_index': index}
+
+
+def frame(seed=0):
+    return pd.DataFrame(np.random.default_rng(seed).normal(size=(50, 4)), columns=list('ABCD'))
+
+
+def run(host, tool):
+    tool.run_manual()
+    host.wait(lambda: tool.current_status == 'complete')
+
+
+def test_threshold_panel_default_sweep(host, source):
+    source('source', df=pd.DataFrame({'Score': [1.0, 2.0, 2.0, 3.0, np.nan]}))
+    tool = host.add(Scores)
+    run(host, tool)
+
+    assert tool.panel.retained.text() == '3 of 5 rows retained'
+    line = tool.panel.ax.lines[0]
+    assert list(line.get_xdata()) == [1.0, 2.0, 3.0]
+    assert list(line.get_ydata()) == [4, 3, 1]
+
+    # A threshold beyond the scores is still shown
+    tool.config.set('min_score', 5.0)
+    assert tool.panel.retained.text() == '0 of 5 rows retained'
+    assert tool.panel.ax.get_xlim()[1] == 5.0
+
+
+def test_unchanged_inputs_skip_the_run(host, source):
+    df = frame()
+    upstream = source('source', df=df, design=pd.DataFrame({'Label': list('ABCD')}))
+    tool = host.add(Scale)
+    run(host, tool)
+    started = host.threadpool.started
+    result = tool.data
+
+    # Run again as is: the result stands, without a worker
+    tool.run_manual()
+    assert tool.current_status == 'complete'
+    assert host.threadpool.started == started
+    assert tool.data is result
+
+    # Upstream re-run giving the same values, or changing only data the tool doesn't use
+    upstream.config.set('auto_run_on_config_change', False)
+    upstream.feed(df=df.copy(), design=pd.DataFrame({'Label': list('ABCD')}))
+    upstream.feed(df=df.copy(), design=pd.DataFrame({'Label': list('WXYZ')}))
+    run(host, tool)
+    assert host.threadpool.started == started + 2  # The upstream runs only
+    assert tool.data is result
+
+    # New values upstream
+    upstream.feed(df=df + 1, design=pd.DataFrame({'Label': list('WXYZ')}))
+    started = host.threadpool.started
+    run(host, tool)
+    assert host.threadpool.started == started + 1
+    pd.testing.assert_frame_equal(tool.data['data']['df'], (df + 1) * 2)
+
+
+def test_config_change_runs_again(host, source):
+    df = frame()
+    source('source', df=df)
+    tool = host.add(Scale)
+    run(host, tool)
+    key = tool.fingerprint
+
+    tool.config.set('factor', 3.0)
+    started = host.threadpool.started
+    run(host, tool)
+    assert host.threadpool.started == started + 1
+    assert tool.fingerprint != key
+    pd.testing.assert_frame_equal(tool.data['data']['df'], df * 3)
+
+    # Back to the first config: the same key as the first run
+    tool.config.set('factor', 2.0)
+    run(host, tool)
+    assert tool.fingerprint == key
+
+
+def test_upstream_run_marks_dependents_stale(host, source):
+    df = frame()
+    upstream = source('source', df=df)
+    first = host.add(Scale)
+    second = host.add(ScaleAgain)
+    elsewhere = host.add(Elsewhere)
+    run(host, first)
+    run(host, second)
+    elsewhere.status.emit('ready')
+
+    # As the main window does when a tool starts running
+    dependents = workflow.downstream(upstream, host.tools, ToolBase.is_active)
+    assert dependents == [first, second]
+    for t in dependents:
+        t.invalidate()
+
+    assert [t.current_status for t in (first, second, elsewhere)] == ['stale', 'stale', 'ready']
+    # Results are kept until replaced
+    pd.testing.assert_frame_equal(second.data['data']['df'], df * 4)
+
+    # The upstream data came out unchanged: both complete without running
+    started = host.threadpool.started
+    run(host, first)
+    run(host, second)
+    assert host.threadpool.started == started
+
+
+def test_superseded_runs_give_one_result_with_latest_config(host, source):
+    df = frame()
+    source('source', df=df)
+    tool = host.add(Slow)
+    completed = []
+    tool.complete.connect(lambda: completed.append(tool.data['data']['df']))
+    started = host.threadpool.started
+
+    gate.clear()
+    tool.run_manual()
+    first = tool._worker_thread_
+    # Config changes while running: each supersedes the run in flight
+    for factor in (3.0, 4.0, 5.0):
+        tool.config.set('factor', factor)
+        tool.run_manual()
+    assert first.token.is_cancelled()
+    gate.set()
+
+    host.wait(lambda: completed)
+    # Cancelled at its next progress report, then run once more, after the debounce
+    assert host.threadpool.started == started + 2
+    assert len(completed) == 1
+    pd.testing.assert_frame_equal(completed[0], df * 5)
+
+    # Nothing further is pending
+    time.sleep(0.3)
+    host.wait(lambda: True)
+    assert host.threadpool.started == started + 2 and len(completed) == 1
+
+
+def test_invalidate_cancels_run_in_flight(host, source):
+    source('source', df=frame())
+    tool = host.add(Slow)
+    started = host.threadpool.started
+
+    gate.clear()
+    tool.run_manual()
+    tool.invalidate()
+    gate.set()
+
+    host.wait(lambda: tool.current_status == 'ready')
+    assert tool.data['data'] is None
+    assert host.threadpool.started == started + 1
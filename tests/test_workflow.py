@@ -0,0 +1,84 @@
+import pytest
+
+from paddle import workflow
+
+
+class Tool(object):
+
+    def __init__(self, shortname, inputs=()):
+        self.shortname = shortname
+        self.inputs = inputs
+
+    def __repr__(self):
+        return self.shortname
+
+
+def chain():
+    # The GUI's tool graph
+    return [
+        Tool('import'),
+        Tool('localization', ('import',)),
+        Tool('amino_acids', ('localization',)),
+        Tool('rank_intensity', ('localization',)),
+        Tool('quantification', ('localization',)),
+        Tool('design', ('quantification',)),
+        Tool('filter', ('design',)),
+        Tool('imputation', ('filter',)),
+        Tool('correlation', ('imputation',)),
+        Tool('enrichment', ('design',)),
+    ]
+
+
+def named(tools):
+    return {t.shortname: t for t in tools}
+
+
+def active_except(*names):
+    return lambda t: t.shortname not in names
+
+
+def test_inactive_tools_are_transparent():
+    tools = chain()
+    t = named(tools)
+
+    assert workflow.resolve_inputs(t['quantification'], tools) == [t['localization']]
+    assert workflow.resolve_inputs(t['quantification'], tools, active_except('localization')) == [t['import']]
+    assert workflow.dependents(t['import'], tools, active_except('localization')) == \
+        [t['amino_acids'], t['rank_intensity'], t['quantification']]
+
+
+def test_downstream_in_tool_order():
+    tools = chain()
+    t = named(tools)
+
+    assert workflow.downstream(t['design'], tools) == [t['filter'], t['imputation'], t['correlation'], t['enrichment']]
+    assert workflow.downstream(t['design'], tools, active_except('imputation')) == \
+        [t['filter'], t['correlation'], t['enrichment']]
+
+
+def test_order_puts_inputs_first():
+    tools = chain()
+    ordered = workflow.order(list(reversed(tools)))
+
+    for tool in ordered:
+        for i in workflow.resolve_inputs(tool, tools):
+            assert ordered.index(i) < ordered.index(tool)
+    assert [t.shortname for t in workflow.order(tools, active_except('filter'))] == \
+        [t.shortname for t in tools if t.shortname != 'filter']
+
+
+def test_order_detects_cycles():
+    with pytest.raises(ValueError):
+        workflow.order([Tool('a', ('b',)), Tool('b', ('a',))])
+
+
+def test_resolve_processed_data_tool():
+    # Saving processed data takes the imputation output, or the nearest active tool before it
+    tools = chain()
+    t = named(tools)
+
+    assert workflow.resolve('imputation', tools) is t['imputation']
+    assert workflow.resolve('imputation', tools, active_except('imputation')) is t['filter']
+    assert workflow.resolve('imputation', tools, active_except('imputation', 'filter')) is t['design']
+    assert workflow.resolve('imputation', tools, lambda t: False) is None
+    assert workflow.resolve('missing', tools) is None